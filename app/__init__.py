@@ -22,9 +22,13 @@ def create_app():
     )
     app.config.from_object(Config)
 
-    from app.database import init_all_tables
+    from app.database import init_all_tables, release_request_conn
     init_all_tables()
 
+    # get_conn() hands every caller in a request the same pooled
+    # connection; this gives it back once the response is built.
+    app.teardown_request(release_request_conn)
+
     # Register blueprints
     from app.blueprints.auth_bp import auth_bp
     from app.blueprints.users_bp import users_bp
@@ -36,6 +40,7 @@ def create_app():
     from app.blueprints.marketing_bp import marketing_bp
     from app.blueprints.util_bp import util_bp
     from app.blueprints.crm_bp import crm_bp
+    from app.blueprints.avatars_bp import avatars_bp
 
     app.register_blueprint(pages_bp)
     app.register_blueprint(auth_bp)
@@ -47,6 +52,7 @@ def create_app():
     app.register_blueprint(marketing_bp)
     app.register_blueprint(util_bp)
     app.register_blueprint(crm_bp)
+    app.register_blueprint(avatars_bp)
 
     # Error handlers — API paths get structured JSON, browser gets a friendly page
     @app.errorhandler(404)
@@ -64,6 +70,15 @@ def create_app():
             return jsonify({"error_code": "server", "error": "server"}), 500
         return "Server error. Please try again later.", 500
 
+    @app.errorhandler(413)
+    def payload_too_large(e):
+        # MAX_CONTENT_LENGTH (see Config.CRM_UPLOAD_MAX_BYTES) tripped
+        # before the view ran.
+        from flask import request, jsonify
+        if request.path.startswith("/api/"):
+            return jsonify({"error_code": "upload_too_large", "error": "upload_too_large"}), 413
+        return "Upload too large", 413
+
     @app.errorhandler(405)
     def method_not_allowed(e):
         from flask import request, jsonify
@@ -71,11 +86,11 @@ def create_app():
             return jsonify({"error_code": "forbidden", "error": "method_not_allowed"}), 405
         return "Method not allowed", 405
 
-    # Track last-seen for the Online/Offline status. Throttled at the SQL
-    # level via WHERE last_seen < NOW() - INTERVAL '30s' so concurrent
-    # requests don't pile up writes. Skips static assets, the /api/auth/me
-    # poll, and the login endpoints — these would either hammer the row or
-    # fire before a user_id is set.
+    # Track last-seen for the Online/Offline status. The hook only notes
+    # the user in memory; app/last_seen.py writes the batch every
+    # LAST_SEEN_FLUSH_SECONDS. Skips static assets, the /api/auth/me poll,
+    # and the login endpoints — these would either keep a logged-out user
+    # online or fire before a user_id is set.
     _LAST_SEEN_SKIP = {"/api/auth/me", "/api/auth/login", "/api/auth/logout", "/api/auth/csrf"}
 
     @app.before_request
@@ -87,37 +102,24 @@ def create_app():
         uid = session.get("user_id")
         if not uid:
             return
-        try:
-            from app.database import get_conn
-            conn = get_conn()
-            try:
-                with conn.cursor() as cur:
-                    cur.execute(
-                        "UPDATE users SET last_seen = NOW() "
-                        "WHERE id = %s AND (last_seen IS NULL OR last_seen < NOW() - INTERVAL '30 seconds')",
-                        (uid,),
-                    )
-                conn.commit()
-            finally:
-                conn.close()
-        except Exception as e:
-            # Never fail a request because heartbeat couldn't write — the
-            # admin status display is non-critical.
-            log.debug("last_seen update failed for uid=%s: %s", uid, e)
+        from app.last_seen import record_seen
+        record_seen(uid)
 
     # Security-hardening response headers + freshness guarantees on API
     # responses. Without an explicit Cache-Control, browsers can apply a
     # heuristic cache (typically a fraction of the resource's age) to GET
     # responses — the symptom is "I clicked filter and the data didn't
     # update from the database." `no-store` on /api/* forces every call
-    # to round-trip; static assets keep their default caching.
+    # to round-trip; static assets keep their default caching, and an API
+    # endpoint that sets its own Cache-Control (the versioned avatar
+    # images) keeps it.
     @app.after_request
     def _sec_headers(resp):
         resp.headers.setdefault("X-Content-Type-Options", "nosniff")
         resp.headers.setdefault("X-Frame-Options", "SAMEORIGIN")
         resp.headers.setdefault("Referrer-Policy", "strict-origin-when-cross-origin")
         resp.headers.setdefault("Permissions-Policy", "geolocation=(), microphone=(), camera=()")
-        if request.path.startswith("/api/"):
+        if request.path.startswith("/api/") and "Cache-Control" not in resp.headers:
             resp.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
             resp.headers["Pragma"] = "no-cache"
             resp.headers["Expires"] = "0"
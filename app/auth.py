@@ -23,6 +23,8 @@ from typing import Optional, Tuple
 from flask import g, jsonify, redirect, request, session
 from werkzeug.security import check_password_hash, generate_password_hash
 
+from app.util.avatars import avatar_src
+
 
 ROLES = ["admin", "manager", "team_leader", "dataentry", "sales", "marketing"]
 
@@ -189,12 +191,12 @@ def rate_limit_reset(prefix: str):
 def current_user():
     """Returns the current user as a dict for templates and APIs.
 
-    avatar_url is fetched from the DB (not the session cookie) because a
-    base64 data-URL avatar is ~30-80KB — far above the ~4KB browser cap
-    on cookies. Storing it in the cookie session would cause Set-Cookie
-    to be silently dropped by the browser, which is exactly the symptom
-    we hit (avatar reverts after reload). The DB hit is cached on
-    flask.g for the request so multiple template renders don't pile up.
+    avatar_url is the versioned /api/avatars link (app/util/avatars.py),
+    built from users.avatar_hash — never the 30-80KB data URL itself. It
+    comes from the DB rather than the cookie session so a picture changed
+    on another device shows up on the next page load. The DB hit is
+    cached on flask.g for the request so multiple template renders don't
+    pile up.
     """
     if "user_id" not in session:
         return None
@@ -211,10 +213,10 @@ def current_user():
         conn = get_conn()
         try:
             with conn.cursor() as cur:
-                cur.execute("SELECT avatar_url FROM users WHERE id = %s", (uid,))
+                cur.execute("SELECT avatar_hash FROM users WHERE id = %s", (uid,))
                 row = cur.fetchone()
                 if row:
-                    avatar_url = row[0]
+                    avatar_url = avatar_src(uid, row[0])
         finally:
             conn.close()
     except Exception:
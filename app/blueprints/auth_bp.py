@@ -29,6 +29,8 @@ from app.auth import (
     verify_password,
 )
 from app.database import get_conn
+from app.last_seen import forget as forget_last_seen
+from app.util.avatars import avatar_src
 from app.mailer import (
     password_reset_email,
     signup_pending_email,
@@ -81,7 +83,7 @@ def login():
             try:
                 cur.execute("""
                     SELECT id, username, full_name, password_hash, role, active, email,
-                           phone, avatar_url, failed_logins, locked_until, approval_status
+                           phone, failed_logins, locked_until, approval_status
                     FROM users WHERE LOWER(username) = %s
                 """, (username,))
                 user = cur.fetchone()
@@ -89,7 +91,7 @@ def login():
                 conn.rollback()
                 cur.execute("""
                     SELECT id, username, full_name, password_hash, role, active, email,
-                           phone, avatar_url, failed_logins, locked_until
+                           phone, failed_logins, locked_until
                     FROM users WHERE LOWER(username) = %s
                 """, (username,))
                 user = cur.fetchone()
@@ -148,11 +150,11 @@ def login():
         session["role"] = user["role"]
         session["email"] = user.get("email")
         session["phone"] = user.get("phone")
-        # avatar_url is intentionally NOT stored in the cookie session — a
+        # The avatar is intentionally NOT stored in the cookie session — a
         # data-URL avatar (~30-80KB) blows past the browser's ~4KB cookie cap
         # and the new Set-Cookie gets silently dropped, which is exactly the
         # symptom that broke avatar persistence on reload. current_user()
-        # fetches it fresh from the DB and caches per-request via flask.g.
+        # looks up its versioned link per request (cached via flask.g).
         session.permanent = True
         ensure_csrf_token()
         rate_limit_reset("login")
@@ -281,6 +283,8 @@ def logout():
     # minutes ago" displays.
     uid = session.get("user_id")
     if uid:
+        # A heartbeat still waiting to be flushed would undo this.
+        forget_last_seen(uid)
         conn = None
         try:
             conn = get_conn()
@@ -317,7 +321,7 @@ def me():
             # Approved / Reset all land in the same colour scheme the user just
             # left in the app.
             cur.execute("""
-                SELECT email, phone, avatar_url, created_at, last_login,
+                SELECT email, phone, avatar_hash, created_at, last_login,
                        preferred_theme, preferred_lang
                 FROM users WHERE id = %s
             """, (u["id"],))
@@ -325,7 +329,7 @@ def me():
         if row:
             u["email"] = row.get("email") or u.get("email")
             u["phone"] = row.get("phone") or u.get("phone")
-            u["avatar_url"] = row.get("avatar_url") or u.get("avatar_url")
+            u["avatar_url"] = avatar_src(u["id"], row.get("avatar_hash"))
             u["preferred_theme"] = row.get("preferred_theme") or "light"
             u["preferred_lang"] = row.get("preferred_lang") or "ar"
             for k in ("created_at", "last_login"):
@@ -498,9 +502,11 @@ def upload_avatar():
         conn = get_conn()
         with conn.cursor() as cur:
             cur.execute(
-                "UPDATE users SET avatar_url = %s, updated_at = NOW() WHERE id = %s",
+                "UPDATE users SET avatar_url = %s, updated_at = NOW() WHERE id = %s "
+                "RETURNING avatar_hash",
                 (data_url, session["user_id"]),
             )
+            avatar_hash = cur.fetchone()[0]
         conn.commit()
         # Bust any per-request cache so the next current_user() in this
         # request (e.g. response middleware) sees the new avatar. The DB is
@@ -508,7 +514,7 @@ def upload_avatar():
         if hasattr(g, "_current_user_cache"):
             g._current_user_cache = None
         log.info("avatar updated for user_id=%s mime=%s size=%d", session["user_id"], mime, size)
-        return jsonify({"ok": True, "avatar_url": data_url})
+        return jsonify({"ok": True, "avatar_url": avatar_src(session["user_id"], avatar_hash)})
     except Exception as e:
         log.error("upload_avatar error: %s", e)
         return error_response("server", 500)
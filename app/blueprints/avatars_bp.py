@@ -0,0 +1,75 @@
+"""
+User avatars as cacheable images.
+
+  GET /api/avatars/<user_id>?v=<version>  → the picture's bytes
+
+JSON payloads carry only the versioned link (app.util.avatars); this is
+where the browser fetches the image, once per version. The ETag is the
+picture's md5 (users.avatar_hash), so a revalidation is answered 304
+without reading the data URL.
+"""
+import logging
+
+from flask import Blueprint, Response, request
+
+from app.auth import error_response, login_required
+from app.database import get_conn
+from app.util.avatars import AVATAR_VERSION_CHARS, decode_avatar
+
+log = logging.getLogger(__name__)
+avatars_bp = Blueprint("avatars", __name__, url_prefix="/api/avatars")
+
+# The link changes whenever the picture does, so a response fetched
+# through the current link never goes stale.
+_VERSIONED_MAX_AGE = 365 * 24 * 3600
+
+
+@avatars_bp.route("/<int:user_id>", methods=["GET"])
+@login_required
+def get_avatar(user_id):
+    known = [tag for tag in request.if_none_match.as_set() if tag]
+    conn = None
+    try:
+        conn = get_conn()
+        with conn.cursor() as cur:
+            # The data URL is only read when the client's copy is stale.
+            cur.execute(
+                """
+                SELECT avatar_hash,
+                       CASE WHEN avatar_hash = ANY(%s::text[]) THEN NULL ELSE avatar_url END
+                FROM users WHERE id = %s
+                """,
+                (known, user_id),
+            )
+            row = cur.fetchone()
+        conn.commit()
+    except Exception as e:
+        log.error("get_avatar error: %s", e)
+        return error_response("server", 500)
+    finally:
+        if conn:
+            conn.close()
+
+    if not row or not row[0]:
+        return error_response("not_found", 404)
+    avatar_hash, data_url = row
+
+    if request.args.get("v") == avatar_hash[:AVATAR_VERSION_CHARS]:
+        cache_control = f"private, max-age={_VERSIONED_MAX_AGE}, immutable"
+    else:
+        # Unversioned or outdated link: serve the current picture but make
+        # the browser revalidate next time.
+        cache_control = "private, no-cache"
+
+    if data_url is None:
+        resp = Response(status=304)
+    else:
+        decoded = decode_avatar(data_url)
+        if decoded is None:
+            log.warning("get_avatar: unreadable avatar for user_id=%s", user_id)
+            return error_response("not_found", 404)
+        mime, raw = decoded
+        resp = Response(raw, mimetype=mime)
+    resp.set_etag(avatar_hash)
+    resp.headers["Cache-Control"] = cache_control
+    return resp
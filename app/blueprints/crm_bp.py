@@ -11,8 +11,9 @@ import json
 import logging
 
 import psycopg2.extras
-from flask import Blueprint, jsonify, request, session
+from flask import Blueprint, Response, jsonify, request, session
 
+from config import Config
 from app.auth import (
     csrf_protect,
     error_response,
@@ -21,27 +22,50 @@ from app.auth import (
 )
 from datetime import date, datetime, timedelta
 
+from app.crm_events import (
+    badge_snapshot,
+    cache_badge,
+    event_stream,
+    notify_intervention_counts,
+    subscribe,
+    unsubscribe,
+)
+from app.crm_jobs import enqueue_mapping_change, job_status, wake_worker
 from app.crm_logic import (
     DEFAULT_STAGE_MAP,
-    apply_sales_rep_mapping_change,
-    apply_stage_mapping_change,
     build_lead_timeline,
     normalize_sales_name,
-    recalc_after_upload,
+    refresh_lead_state,
     _response_rate_pct,
 )
-from app.crm_processor import start_processing_thread
-from app.database import get_conn
+from app.crm_processor import (
+    UploadQueueFull,
+    UploadTooLarge,
+    hash_upload_session,
+    hash_upload_stream,
+    open_upload_session,
+    preview_upload,
+    record_duplicate_upload,
+    spool_upload,
+    spool_upload_session,
+    store_upload_session_chunk,
+    submit_upload,
+    upload_queue_has_room,
+    upload_rate_and_eta,
+    upload_session_chunk_count,
+    upload_session_chunk_size,
+    upload_session_received,
+)
+from app.database import get_conn, release_request_conn
+from app.util.avatars import avatar_src_sql
 
 log = logging.getLogger(__name__)
 crm_bp = Blueprint("crm", __name__, url_prefix="/api/crm")
 
 
-# Upload cap. 10 MB is roughly ~40k rows of typical CRM exports; anything
-# larger is almost certainly a multi-month export that should be split
-# upstream. The cap also doubles as a cheap DoS guard since the file goes
-# straight into a worker thread's memory.
-_MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+# The parser tells .xlsx from CSV/TSV by content; the extension check only
+# keeps obviously wrong files (.xls, .pdf, …) from being spooled at all.
+_UPLOAD_EXTENSIONS = (".xlsx", ".csv", ".tsv")
 
 
 def _campaign_exists(conn, campaign_id: int) -> bool:
@@ -60,7 +84,15 @@ def _campaign_exists(conn, campaign_id: int) -> bool:
 @role_required("admin", "manager", "marketing")
 @csrf_protect
 def upload_crm_report(campaign_id: int):
+    """Queue a CRM sheet for the upload workers (202). A byte-identical
+    re-upload is answered at once as a duplicate (200). With ?dry_run=1
+    nothing is stored: the sheet is parsed, checked against lead_events
+    and the preview is returned (200)."""
     # Validate the multipart payload before we even consider opening the file.
+    # Reading request.files pulls the whole body off the socket, which is
+    # as slow as the client's link: make sure no pooled connection is
+    # checked out for this request while that happens.
+    release_request_conn()
     if "file" not in request.files:
         return error_response("required_fields_missing", 400)
 
@@ -68,23 +100,21 @@ def upload_crm_report(campaign_id: int):
     if not f or not f.filename:
         return error_response("required_fields_missing", 400)
 
-    # openpyxl reads .xlsx; we don't support .xls (old binary format) or
-    # .csv on this endpoint to keep the parser focused.
-    if not f.filename.lower().endswith(".xlsx"):
+    # .xlsx via openpyxl, .csv / .tsv via the csv module. No .xls (old
+    # binary format).
+    if not f.filename.lower().endswith(_UPLOAD_EXTENSIONS):
         return error_response("invalid_input", 400)
 
-    # Slurp the bytes once. werkzeug streams from a SpooledTemporaryFile;
-    # by reading it into memory we (a) decouple parsing from the HTTP
-    # request lifecycle (the thread keeps working after we return) and
-    # (b) get an unambiguous size check.
-    blob = f.read()
-    if not blob:
+    # MAX_CONTENT_LENGTH already turned away bodies that declare more than
+    # the cap (413 before a byte was read). werkzeug has put the file part
+    # in a SpooledTemporaryFile — on disk past 500 KB — and it is only
+    # ever read from there in chunks: hashed now, spooled to the DB below.
+    try:
+        file_sha256, size = hash_upload_stream(f.stream, Config.CRM_UPLOAD_MAX_BYTES)
+    except UploadTooLarge:
+        return error_response("upload_too_large", 413)
+    if not size:
         return error_response("invalid_input", 400)
-    if len(blob) > _MAX_UPLOAD_BYTES:
-        # 413 Payload Too Large is the strict-correct status; the frontend
-        # already handles range_too_large the same way, so reuse the
-        # surface here. We pick a specific code so the toast localizes.
-        return error_response("range_too_large", 413)
 
     conn = None
     try:
@@ -92,19 +122,24 @@ def upload_crm_report(campaign_id: int):
         if not _campaign_exists(conn, campaign_id):
             return error_response("not_found", 404)
 
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO crm_report_uploads (
-                    campaign_id, file_name, uploaded_by, status
-                )
-                VALUES (%s, %s, %s, 'PENDING')
-                RETURNING id
-                """,
-                (campaign_id, f.filename[:255], session.get("user_id")),
-            )
-            upload_id = cur.fetchone()[0]
-        conn.commit()
+        # ?dry_run=1 — report what the upload would do, write nothing.
+        if request.args.get("dry_run") in ("1", "true"):
+            try:
+                preview = preview_upload(conn, campaign_id, f.stream, file_sha256)
+            except ValueError as e:
+                # No sheet with the required header columns; the message
+                # names what's missing.
+                return jsonify({"error_code": "crm_sheet_unreadable",
+                                "error": "crm_sheet_unreadable",
+                                "detail": str(e)}), 400
+            finally:
+                conn.rollback()
+            return jsonify(preview)
+
+        return _accept_upload(
+            conn, campaign_id, f.filename[:255], file_sha256,
+            lambda cur, upload_id: spool_upload(cur, upload_id, f.stream),
+        )
     except Exception as e:
         log.error("CRM upload insert failed: %s", e)
         return error_response("server", 500)
@@ -112,18 +147,295 @@ def upload_crm_report(campaign_id: int):
         if conn is not None:
             conn.close()
 
-    # Hand off to the daemon thread. start_processing_thread is fire-and-
-    # forget; status/errors land on the upload row via the thread itself.
-    start_processing_thread(upload_id, blob, campaign_id)
+
+def _accept_upload(conn, campaign_id: int, file_name: str, file_sha256: str,
+                   spool, on_accepted=None):
+    """Shared tail of the multipart and chunked upload endpoints: answer a
+    duplicate straight away, or create the upload row, `spool(cur,
+    upload_id)` its bytes and hand it to the worker pool. `on_accepted(cur)`
+    runs (and commits) once the upload is recorded or queued — never when
+    it is turned away with 503, so the caller's state survives a retry."""
+    # Same bytes as an upload this campaign already completed: record
+    # it as a duplicate and answer with the final result right away.
+    with conn.cursor() as cur:
+        duplicate = record_duplicate_upload(
+            cur, campaign_id, file_name, session.get("user_id"), file_sha256,
+        )
+        if duplicate is not None and on_accepted is not None:
+            on_accepted(cur)
+    conn.commit()
+    if duplicate is not None:
+        upload_id, original_id = duplicate
+        return jsonify({
+            "ok": True,
+            "upload_id": upload_id,
+            "status": "COMPLETED",
+            "duplicate_of_upload_id": original_id,
+        })
+
+    # Turn the upload away when the worker pool's queue is already
+    # full — the client retries after Retry-After.
+    if not upload_queue_has_room():
+        return _upload_queue_full()
+
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO crm_report_uploads (
+                campaign_id, file_name, uploaded_by, status, file_sha256
+            )
+            VALUES (%s, %s, %s, 'PENDING', %s)
+            RETURNING id
+            """,
+            (campaign_id, file_name, session.get("user_id"), file_sha256),
+        )
+        upload_id = cur.fetchone()[0]
+        spool(cur, upload_id)
+    conn.commit()
+
+    # Hand off to the worker pool. submit_upload is fire-and-forget;
+    # status/errors land on the upload row via the worker itself. If
+    # the queue filled up since the check above, withdraw the upload
+    # (the spool row goes with it) rather than leave it PENDING.
+    try:
+        submit_upload(upload_id, campaign_id)
+    except UploadQueueFull:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM crm_report_uploads WHERE id = %s", (upload_id,))
+        conn.commit()
+        return _upload_queue_full()
+    if on_accepted is not None:
+        with conn.cursor() as cur:
+            on_accepted(cur)
+        conn.commit()
 
     return jsonify({
         "ok": True,
         "upload_id": upload_id,
-        "status": "PROCESSING",
+        "status": "PENDING",
         "message": "Upload received, processing in background",
     }), 202
 
 
+def _upload_queue_full():
+    resp, status = error_response("upload_queue_full", 503)
+    resp.headers["Retry-After"] = "30"
+    return resp, status
+
+
+# ─── Chunked (resumable) upload ─────────────────────────────────────────
+#
+#   POST   /campaigns/<id>/uploads/chunked   {file_name, size}   → session
+#   PUT    /upload-sessions/<sid>/chunks/<seq>   raw bytes of chunk seq
+#   GET    /upload-sessions/<sid>            which chunks have arrived
+#   POST   /upload-sessions/<sid>/complete   → the usual upload_id (202)
+#   DELETE /upload-sessions/<sid>            abandon
+#
+# Every chunk but the last is exactly chunk_bytes long. A client that
+# lost its connection GETs the session and re-sends what's missing; a
+# chunk sent twice just overwrites itself. Sessions belong to the user
+# who opened them — anyone else gets 404. See crm_processor for storage.
+
+@crm_bp.route("/campaigns/<int:campaign_id>/uploads/chunked", methods=["POST"])
+@login_required
+@role_required("admin", "manager", "marketing")
+@csrf_protect
+def open_chunked_upload(campaign_id: int):
+    data = request.get_json(silent=True) or {}
+    file_name = str(data.get("file_name") or "").strip()
+    size = data.get("size")
+    if not file_name or not isinstance(size, int) or isinstance(size, bool):
+        return error_response("required_fields_missing", 400)
+    if not file_name.lower().endswith(_UPLOAD_EXTENSIONS) or size <= 0:
+        return error_response("invalid_input", 400)
+    if size > Config.CRM_UPLOAD_MAX_BYTES:
+        return error_response("upload_too_large", 413)
+
+    conn = None
+    try:
+        conn = get_conn()
+        if not _campaign_exists(conn, campaign_id):
+            return error_response("not_found", 404)
+        with conn.cursor() as cur:
+            session_id, chunk_bytes = open_upload_session(
+                cur, campaign_id, file_name[:255], session.get("user_id"), size,
+            )
+        conn.commit()
+        return jsonify(_upload_session_json(
+            session_id, (campaign_id, file_name[:255], size, chunk_bytes), [],
+        )), 201
+    except Exception as e:
+        log.error("open_chunked_upload campaign=%s: %s", campaign_id, e)
+        return error_response("server", 500)
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+def _load_upload_session(cur, session_id: int):
+    """(campaign_id, file_name, total_bytes, chunk_bytes) of the caller's
+    session, or None."""
+    cur.execute(
+        """
+        SELECT campaign_id, file_name, total_bytes, chunk_bytes
+        FROM crm_upload_sessions
+        WHERE id = %s AND uploaded_by = %s
+        """,
+        (session_id, session.get("user_id")),
+    )
+    return cur.fetchone()
+
+
+def _upload_session_json(session_id, row, received) -> dict:
+    campaign_id, file_name, size, chunk_bytes = row
+    return {
+        "session_id": session_id,
+        "campaign_id": campaign_id,
+        "file_name": file_name,
+        "size": size,
+        "chunk_bytes": chunk_bytes,
+        "chunk_count": upload_session_chunk_count(size, chunk_bytes),
+        "received": received,
+    }
+
+
+@crm_bp.route("/upload-sessions/<int:session_id>", methods=["GET"])
+@login_required
+@role_required("admin", "manager", "marketing")
+def chunked_upload_status(session_id: int):
+    conn = None
+    try:
+        conn = get_conn()
+        with conn.cursor() as cur:
+            row = _load_upload_session(cur, session_id)
+            if not row:
+                return error_response("not_found", 404)
+            received = upload_session_received(cur, session_id)
+        return jsonify(_upload_session_json(session_id, row, received))
+    except Exception as e:
+        log.error("chunked_upload_status %s: %s", session_id, e)
+        return error_response("server", 500)
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+@crm_bp.route("/upload-sessions/<int:session_id>/chunks/<int:seq>", methods=["PUT"])
+@login_required
+@role_required("admin", "manager", "marketing")
+@csrf_protect
+def put_upload_chunk(session_id: int, seq: int):
+    conn = None
+    try:
+        conn = get_conn()
+        with conn.cursor() as cur:
+            row = _load_upload_session(cur, session_id)
+        if not row:
+            return error_response("not_found", 404)
+        _campaign_id, _file_name, size, chunk_bytes = row
+        expected = upload_session_chunk_size(size, chunk_bytes, seq)
+        # Check the declared length before reading the body: a wrong
+        # one is refused without buffering it.
+        if expected is None or request.content_length != expected:
+            return error_response("invalid_input", 400)
+
+        # The chunk arrives at whatever pace the client's link allows;
+        # give the connection back to the pool meanwhile.
+        conn.close()
+        conn = None
+        release_request_conn()
+        data = request.get_data(cache=False)
+        if len(data) != expected:
+            return error_response("invalid_input", 400)
+
+        conn = get_conn()
+        try:
+            with conn.cursor() as cur:
+                store_upload_session_chunk(cur, session_id, seq, data)
+        except psycopg2.IntegrityError:
+            # The session was completed or discarded while the chunk
+            # was in flight.
+            return error_response("not_found", 404)
+        conn.commit()
+        return jsonify({"ok": True, "seq": seq})
+    except Exception as e:
+        log.error("put_upload_chunk %s/%s: %s", session_id, seq, e)
+        return error_response("server", 500)
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+@crm_bp.route("/upload-sessions/<int:session_id>/complete", methods=["POST"])
+@login_required
+@role_required("admin", "manager", "marketing")
+@csrf_protect
+def complete_chunked_upload(session_id: int):
+    """Turn a fully received session into a queued upload. Answers like
+    the multipart endpoint (202 / 200 duplicate / 503), or 409 listing the
+    chunks still missing. The session survives a 503, so completing can
+    simply be retried."""
+    conn = None
+    try:
+        conn = get_conn()
+        with conn.cursor() as cur:
+            row = _load_upload_session(cur, session_id)
+            if not row:
+                return error_response("not_found", 404)
+            campaign_id, file_name, size, chunk_bytes = row
+            received = set(upload_session_received(cur, session_id))
+        missing = [seq for seq in range(upload_session_chunk_count(size, chunk_bytes))
+                   if seq not in received]
+        if missing:
+            conn.rollback()
+            return jsonify({"error_code": "upload_incomplete",
+                            "error": "upload_incomplete",
+                            "missing": missing}), 409
+
+        file_sha256, _ = hash_upload_session(conn, session_id)
+
+        def _drop_session(cur):
+            cur.execute("DELETE FROM crm_upload_sessions WHERE id = %s", (session_id,))
+
+        return _accept_upload(
+            conn, campaign_id, file_name, file_sha256,
+            lambda cur, upload_id: spool_upload_session(cur, session_id, upload_id),
+            on_accepted=_drop_session,
+        )
+    except Exception as e:
+        log.error("complete_chunked_upload %s: %s", session_id, e)
+        return error_response("server", 500)
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+@crm_bp.route("/upload-sessions/<int:session_id>", methods=["DELETE"])
+@login_required
+@role_required("admin", "manager", "marketing")
+@csrf_protect
+def abandon_chunked_upload(session_id: int):
+    conn = None
+    try:
+        conn = get_conn()
+        with conn.cursor() as cur:
+            cur.execute(
+                "DELETE FROM crm_upload_sessions WHERE id = %s AND uploaded_by = %s",
+                (session_id, session.get("user_id")),
+            )
+            deleted = cur.rowcount
+        conn.commit()
+        if not deleted:
+            return error_response("not_found", 404)
+        return jsonify({"ok": True})
+    except Exception as e:
+        log.error("abandon_chunked_upload %s: %s", session_id, e)
+        return error_response("server", 500)
+    finally:
+        if conn is not None:
+            conn.close()
+
+
 # ─── GET status ─────────────────────────────────────────────────────────
 
 @crm_bp.route("/uploads/<int:upload_id>/status", methods=["GET"])
@@ -140,7 +452,10 @@ def upload_status(upload_id: int):
                        total_rows, total_leads, total_events,
                        new_events, duplicate_events,
                        unmatched_sales_reps, unmatched_stages, warnings,
-                       error_message, processed_at
+                       error_message, processed_at,
+                       phase, rows_processed, rows_total,
+                       parse_ms, ingest_ms, recalc_ms, started_at,
+                       duplicate_of_upload_id
                 FROM crm_report_uploads
                 WHERE id = %s
                 """,
@@ -149,6 +464,10 @@ def upload_status(upload_id: int):
             row = cur.fetchone()
         if not row:
             return error_response("not_found", 404)
+        rows_per_second, eta_seconds = upload_rate_and_eta(
+            row["phase"], row["rows_processed"], row["rows_total"],
+            row["parse_ms"], row["ingest_ms"],
+        )
         return jsonify({
             "upload_id": row["id"],
             "campaign_id": row["campaign_id"],
@@ -163,6 +482,16 @@ def upload_status(upload_id: int):
             "warnings": row["warnings"] or [],
             "error_message": row["error_message"],
             "processed_at": row["processed_at"].isoformat() if row["processed_at"] else None,
+            "phase": row["phase"],
+            "rows_processed": row["rows_processed"] or 0,
+            "rows_total": row["rows_total"],
+            "parse_ms": row["parse_ms"],
+            "ingest_ms": row["ingest_ms"],
+            "recalc_ms": row["recalc_ms"],
+            "rows_per_second": rows_per_second,
+            "eta_seconds": eta_seconds,
+            "started_at": row["started_at"].isoformat() if row["started_at"] else None,
+            "duplicate_of_upload_id": row["duplicate_of_upload_id"],
         })
     except Exception as e:
         log.error("upload_status %s: %s", upload_id, e)
@@ -419,10 +748,10 @@ def campaign_sales_kpis(campaign_id: int):
 
         with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
             cur.execute(
-                """
+                f"""
                 SELECT s.sales_user_id, s.fresh_leads_count, s.rotation_leads_count,
                        s.fresh_outcomes, s.rotation_outcomes, s.updated_at,
-                       u.full_name AS sales_name, u.avatar_url
+                       u.full_name AS sales_name, {avatar_src_sql("u")} AS avatar_url
                 FROM sales_kpis s
                 JOIN users u ON u.id = s.sales_user_id
                 WHERE s.campaign_id = %s
@@ -515,10 +844,10 @@ def campaign_leads(campaign_id: int):
     """Paginated leads listing for the campaign tab.
 
     Each row is one lead with its derived state (latest stage, current
-    rep, event count, last event date, intervention flag). The latest
-    event is found via a LATERAL subquery — cheaper than a window over
-    the full lead_events table because the (lead_id, follow_date) index
-    drives the lookup to a single row per lead.
+    rep, event count, last event date, intervention flag). That state is
+    read from lead_state, which the recalc pipeline keeps up to date, so
+    neither the page nor the total count touches lead_events — the
+    lead_state indexes cover every filter plus the sort order.
 
     Cursor pagination keyed on (last_event_at DESC NULLS LAST, lead_id DESC)
     so the order is stable when two leads share a timestamp.
@@ -562,31 +891,43 @@ def campaign_leads(campaign_id: int):
 
         # Build the WHERE clauses dynamically. Use parameter placeholders
         # only — concatenating user input would be a SQL-injection foot-gun.
-        clauses = ["l.campaign_id = %s"]
+        clauses = ["ls.campaign_id = %s"]
         params = [campaign_id]
         if stage_filter:
-            clauses.append("latest.normalized_stage = %s")
+            clauses.append("ls.latest_stage = %s")
             params.append(stage_filter)
         if sales_user_id is not None:
-            clauses.append("latest.sales_user_id = %s")
+            clauses.append("ls.latest_sales_user_id = %s")
             params.append(sales_user_id)
-        if intervention_filter is True:
-            clauses.append("mi.id IS NOT NULL AND mi.status = 'OPEN'")
-        elif intervention_filter is False:
-            clauses.append("(mi.id IS NULL OR mi.status <> 'OPEN')")
+        if intervention_filter is not None:
+            clauses.append("ls.has_open_intervention = %s")
+            params.append(intervention_filter)
         if search:
             clauses.append("(l.client_name ILIKE %s OR l.mobile ILIKE %s)")
             like = f"%{search}%"
             params.extend([like, like])
-        if cursor_ts is not None and cursor_id is not None:
-            # (last_event_at, lead_id) < (cursor) — strictly less than the
-            # cursor for "next page". NULL last_event_at sorts last and is
-            # the trailing edge of the dataset.
-            clauses.append(
-                "(latest.follow_date < %s "
-                "OR (latest.follow_date IS NOT DISTINCT FROM %s AND l.id < %s))"
-            )
-            params.extend([cursor_ts, cursor_ts, cursor_id])
+
+        # Total count under the same filters, but without the cursor
+        # clause — pagination shouldn't change the total. leads is only
+        # joined in when the search box needs client_name / mobile.
+        count_join = "JOIN leads l ON l.id = ls.lead_id" if search else ""
+        count_where = " AND ".join(clauses)
+        count_params = params[:]
+
+        if cursor_id is not None:
+            # Strictly after the cursor in (last_event_at DESC NULLS LAST,
+            # lead_id DESC) order. Leads without events sort last, so a
+            # dated cursor still has the whole NULL tail ahead of it, and
+            # a NULL cursor only walks further down that tail.
+            if cursor_ts is not None:
+                clauses.append(
+                    "(ls.last_event_at < %s OR ls.last_event_at IS NULL "
+                    "OR (ls.last_event_at = %s AND ls.lead_id < %s))"
+                )
+                params.extend([cursor_ts, cursor_ts, cursor_id])
+            else:
+                clauses.append("(ls.last_event_at IS NULL AND ls.lead_id < %s)")
+                params.append(cursor_id)
 
         where_sql = " AND ".join(clauses)
 
@@ -595,58 +936,28 @@ def campaign_leads(campaign_id: int):
         with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
             cur.execute(
                 f"""
-                SELECT l.id AS lead_id, l.client_name, l.mobile,
-                       latest.normalized_stage AS latest_stage,
-                       latest.sales_user_id    AS current_sales_user_id,
-                       latest.follow_date      AS last_event_at,
-                       counts.event_count,
-                       u.full_name             AS current_sales_rep,
-                       mi.priority             AS intervention_priority,
-                       (mi.id IS NOT NULL AND mi.status = 'OPEN') AS has_intervention
-                FROM leads l
-                LEFT JOIN LATERAL (
-                    SELECT normalized_stage, sales_user_id, follow_date
-                    FROM lead_events
-                    WHERE lead_id = l.id AND is_voided = FALSE
-                    ORDER BY follow_date DESC NULLS LAST, id DESC
-                    LIMIT 1
-                ) latest ON TRUE
-                LEFT JOIN LATERAL (
-                    SELECT COUNT(*) AS event_count
-                    FROM lead_events
-                    WHERE lead_id = l.id AND is_voided = FALSE
-                ) counts ON TRUE
-                LEFT JOIN users u ON u.id = latest.sales_user_id
-                LEFT JOIN manager_intervention_flags mi ON mi.lead_id = l.id
+                SELECT ls.lead_id, l.client_name, l.mobile,
+                       ls.latest_stage,
+                       ls.latest_sales_user_id  AS current_sales_user_id,
+                       ls.last_event_at,
+                       ls.event_count,
+                       u.full_name              AS current_sales_rep,
+                       ls.intervention_priority,
+                       ls.has_open_intervention AS has_intervention
+                FROM lead_state ls
+                JOIN leads l ON l.id = ls.lead_id
+                LEFT JOIN users u ON u.id = ls.latest_sales_user_id
                 WHERE {where_sql}
-                ORDER BY latest.follow_date DESC NULLS LAST, l.id DESC
+                ORDER BY ls.last_event_at DESC NULLS LAST, ls.lead_id DESC
                 LIMIT %s
                 """,
                 params + [limit + 1],
             )
             rows = cur.fetchall()
 
-            # Total count under the same filters, but without the cursor
-            # clause — pagination shouldn't change the total. Re-build
-            # the WHERE here so the count reflects ONLY the filters.
-            count_clauses = clauses[:]
-            count_params = params[:]
-            if cursor_ts is not None:
-                # Drop the cursor's 3 trailing params and its clause.
-                count_clauses = clauses[:-1]
-                count_params = params[:-3]
-            count_where = " AND ".join(count_clauses)
             cur.execute(
                 f"""
-                SELECT COUNT(*) AS n FROM leads l
-                LEFT JOIN LATERAL (
-                    SELECT normalized_stage, sales_user_id, follow_date
-                    FROM lead_events
-                    WHERE lead_id = l.id AND is_voided = FALSE
-                    ORDER BY follow_date DESC NULLS LAST, id DESC
-                    LIMIT 1
-                ) latest ON TRUE
-                LEFT JOIN manager_intervention_flags mi ON mi.lead_id = l.id
+                SELECT COUNT(*) AS n FROM lead_state ls {count_join}
                 WHERE {count_where}
                 """,
                 count_params,
@@ -674,9 +985,7 @@ def campaign_leads(campaign_id: int):
                     r["last_event_at"].isoformat() if r["last_event_at"] else None
                 ),
                 "has_intervention": bool(r["has_intervention"]),
-                "intervention_priority": (
-                    r["intervention_priority"] if r["has_intervention"] else None
-                ),
+                "intervention_priority": r["intervention_priority"],
             })
 
         return jsonify({
@@ -930,7 +1239,11 @@ def update_intervention(flag_id: int):
                 """,
                 (row["campaign_id"], row["campaign_id"]),
             )
+            counts = notify_intervention_counts(cur)
         conn.commit()
+        cache_badge(counts)
+        # The leads listing reads the open-flag state from lead_state.
+        refresh_lead_state(row["campaign_id"], conn, lead_ids=[row["lead_id"]])
         return jsonify({"ok": True, "id": row["id"], "status": row["status"]})
     except Exception as e:
         log.error("update_intervention %s: %s", flag_id, e)
@@ -946,39 +1259,41 @@ def update_intervention(flag_id: int):
 @login_required
 @role_required("admin", "manager", "marketing")
 def intervention_open_count():
-    """Tiny endpoint behind the sidebar badge. Pulled on every page load
-    via common.js, so the SQL stays a single GROUP BY against the indexed
-    (priority, status) — no joins. Returns {open_count, high_priority}.
+    """Endpoint behind the sidebar badge, polled by every open tab.
+    Answers from the shared in-process badge cache (crm_events.
+    badge_snapshot), which the intervention NOTIFYs keep current, so the
+    tabs together cost one GROUP BY per cache TTL, not one per poll.
+    Returns {open_count, high_priority, medium_priority}.
     """
-    conn = None
-    try:
-        conn = get_conn()
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT priority, COUNT(*) FROM manager_intervention_flags
-                WHERE status = 'OPEN'
-                GROUP BY priority
-                """
-            )
-            high = 0
-            medium = 0
-            for priority, n in cur.fetchall():
-                if priority == "HIGH":
-                    high = n
-                elif priority == "MEDIUM":
-                    medium = n
-        return jsonify({
-            "open_count": high + medium,
-            "high_priority": high,
-            "medium_priority": medium,
-        })
-    except Exception as e:
-        log.error("intervention_open_count: %s", e)
+    counts = badge_snapshot()
+    if counts is None:
         return error_response("server", 500)
-    finally:
-        if conn is not None:
-            conn.close()
+    return jsonify(counts)
+
+
+# ─── GET live events (SSE) ──────────────────────────────────────────────
+
+@crm_bp.route("/events", methods=["GET"])
+@login_required
+@role_required("admin", "manager", "marketing")
+def events():
+    """Server-Sent Events stream: upload progress and intervention badge
+    counts as they change (see app/crm_events.py). Opens with the current
+    badge counts. 503 when this process already serves its cap of streams
+    — EventSource gives up on a non-200 and the page falls back to
+    polling."""
+    sub = subscribe()
+    if sub is None:
+        resp, status = error_response("too_many_streams", 503)
+        resp.headers["Retry-After"] = "60"
+        return resp, status
+    resp = Response(event_stream(sub), mimetype="text/event-stream")
+    # call_on_close fires even if the client drops before the first
+    # chunk, when the generator's own cleanup would never run.
+    resp.call_on_close(lambda: unsubscribe(sub))
+    # Don't let a buffering reverse proxy hold the events back.
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
 
 
 # ─── GET daily activity (P4) ────────────────────────────────────────────
@@ -1006,6 +1321,9 @@ def campaign_daily_activity(campaign_id: int):
 
     Default range: last 30 days. The frontend's two date inputs map to
     `from` and `to` (inclusive on both ends).
+
+    Reads the lead_events_daily rollup — a handful of rows per day in
+    range, however many events the campaign has.
     """
     to_d = _parse_iso_date(request.args.get("to")) or date.today()
     from_d = _parse_iso_date(request.args.get("from"))
@@ -1026,26 +1344,23 @@ def campaign_daily_activity(campaign_id: int):
                 return error_response("not_found", 404)
 
         with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-            # FILTER (...) lets one pass produce all six per-stage buckets;
-            # cheaper than a CASE-based pivot for the volumes we expect.
+            # FILTER (...) lets one pass pivot the per-stage rollup rows
+            # into the six buckets; the PK covers the range scan.
             cur.execute(
                 """
-                SELECT DATE(follow_date) AS day,
-                       COUNT(*) AS total_attempts,
-                       COUNT(*) FILTER (WHERE normalized_stage = 'NO_ANSWER')    AS no_answer_count,
-                       COUNT(*) FILTER (WHERE normalized_stage = 'FOLLOWING')    AS following_count,
-                       COUNT(*) FILTER (WHERE normalized_stage = 'MEETING')      AS meeting_count,
-                       COUNT(*) FILTER (WHERE normalized_stage = 'CANCELLATION') AS cancellation_count,
-                       COUNT(*) FILTER (WHERE normalized_stage = 'INTERESTED')   AS interested_count,
-                       COUNT(*) FILTER (WHERE normalized_stage = 'REQUEST')      AS request_count
-                FROM lead_events
+                SELECT day,
+                       SUM(event_count)::int AS total_attempts,
+                       (SUM(event_count) FILTER (WHERE normalized_stage = 'NO_ANSWER'))::int    AS no_answer_count,
+                       (SUM(event_count) FILTER (WHERE normalized_stage = 'FOLLOWING'))::int    AS following_count,
+                       (SUM(event_count) FILTER (WHERE normalized_stage = 'MEETING'))::int      AS meeting_count,
+                       (SUM(event_count) FILTER (WHERE normalized_stage = 'CANCELLATION'))::int AS cancellation_count,
+                       (SUM(event_count) FILTER (WHERE normalized_stage = 'INTERESTED'))::int   AS interested_count,
+                       (SUM(event_count) FILTER (WHERE normalized_stage = 'REQUEST'))::int      AS request_count
+                FROM lead_events_daily
                 WHERE campaign_id = %s
-                  AND normalized_stage IS NOT NULL
-                  AND is_voided = FALSE
-                  AND follow_date >= %s::date
-                  AND follow_date <  (%s::date + INTERVAL '1 day')
-                GROUP BY DATE(follow_date)
-                ORDER BY DATE(follow_date) ASC
+                  AND day BETWEEN %s AND %s
+                GROUP BY day
+                ORDER BY day ASC
                 """,
                 (campaign_id, from_d, to_d),
             )
@@ -1231,9 +1546,10 @@ def list_stage_mappings():
 @role_required("admin")
 @csrf_protect
 def create_stage_mapping():
-    """Add a stage mapping AND retroactively re-derive every matching
-    event's normalized_stage. Affected campaigns get a full recalc so
-    KPIs and intervention reflect the new mapping immediately."""
+    """Add a stage mapping and queue the retroactive re-derivation of
+    every matching event's normalized_stage, followed by a full recalc of
+    each affected campaign (app/crm_jobs.py). Returns 202 with the job id;
+    poll GET /api/crm/jobs/<job_id> for progress."""
     data = request.get_json(silent=True) or {}
     raw_stage = (data.get("raw_stage") or "").strip()
     normalized = (data.get("normalized_stage") or "").strip().upper()
@@ -1274,19 +1590,17 @@ def create_stage_mapping():
             except psycopg2.errors.UniqueViolation:
                 conn.rollback()
                 return error_response("invalid_input", 409)
+            # Retroactive re-derivation + recalc run on the job worker.
+            # Queued in the same transaction as the mapping, so the job
+            # can't exist without it (or the other way round).
+            job_id = enqueue_mapping_change(
+                cur, "stage", raw_stage, campaign_id, session.get("user_id"))
         conn.commit()
+        wake_worker()
 
-        # Retroactive recalc — the mapping is committed, so the
-        # normalize_stage lookup will see it.
-        affected = apply_stage_mapping_change(raw_stage, campaign_id, conn)
-        for cid in affected:
-            recalc_after_upload(cid, conn)
-        log.info("Stage mapping %s created (raw=%r → %s, scope=%s); recalculated %d campaign(s)",
-                 new_id, raw_stage, normalized, campaign_id or "GLOBAL", len(affected))
-        return jsonify({
-            "ok": True, "id": new_id,
-            "affected_campaigns": sorted(list(affected)),
-        }), 201
+        log.info("Stage mapping %s created (raw=%r → %s, scope=%s); recalc job %s queued",
+                 new_id, raw_stage, normalized, campaign_id or "GLOBAL", job_id)
+        return jsonify({"ok": True, "id": new_id, "job_id": job_id}), 202
     except Exception as e:
         log.error("create_stage_mapping: %s", e)
         return error_response("server", 500)
@@ -1317,17 +1631,13 @@ def delete_stage_mapping(mapping_id: int):
                 return error_response("not_found", 404)
             raw_stage, campaign_id = row
             cur.execute("DELETE FROM stage_mappings WHERE id = %s", (mapping_id,))
+            job_id = enqueue_mapping_change(
+                cur, "stage", raw_stage, campaign_id, session.get("user_id"))
         conn.commit()
+        wake_worker()
 
-        affected = apply_stage_mapping_change(raw_stage, campaign_id, conn)
-        for cid in affected:
-            recalc_after_upload(cid, conn)
-        log.info("Stage mapping %s deleted; recalculated %d campaign(s)",
-                 mapping_id, len(affected))
-        return jsonify({
-            "ok": True,
-            "affected_campaigns": sorted(list(affected)),
-        })
+        log.info("Stage mapping %s deleted; recalc job %s queued", mapping_id, job_id)
+        return jsonify({"ok": True, "job_id": job_id}), 202
     except Exception as e:
         log.error("delete_stage_mapping %s: %s", mapping_id, e)
         return error_response("server", 500)
@@ -1383,10 +1693,11 @@ def list_sales_rep_mappings():
 @role_required("admin")
 @csrf_protect
 def create_sales_rep_mapping():
-    """Map a raw rep-name string to an existing user. Retroactive recalc
+    """Map a raw rep-name string to an existing user. The queued job
     flips the sales_user_id on every event that had this unmatched name
     and runs the full recalc chain — assignments rebuild because the
-    rep IDENTITY changed (unmatched raw_name → matched user_id)."""
+    rep IDENTITY changed (unmatched raw_name → matched user_id). Returns
+    202 with the job id, like create_stage_mapping."""
     data = request.get_json(silent=True) or {}
     raw_name = (data.get("raw_name") or "").strip()
     sales_user_raw = data.get("sales_user_id")
@@ -1435,17 +1746,14 @@ def create_sales_rep_mapping():
             except psycopg2.errors.UniqueViolation:
                 conn.rollback()
                 return error_response("invalid_input", 409)
+            job_id = enqueue_mapping_change(
+                cur, "sales_rep", raw_name, campaign_id, session.get("user_id"))
         conn.commit()
+        wake_worker()
 
-        affected = apply_sales_rep_mapping_change(raw_name, campaign_id, conn)
-        for cid in affected:
-            recalc_after_upload(cid, conn)
-        log.info("Sales-rep mapping %s created (raw=%r → user=%s, scope=%s); recalculated %d campaign(s)",
-                 new_id, raw_name, sales_user_id, campaign_id or "GLOBAL", len(affected))
-        return jsonify({
-            "ok": True, "id": new_id,
-            "affected_campaigns": sorted(list(affected)),
-        }), 201
+        log.info("Sales-rep mapping %s created (raw=%r → user=%s, scope=%s); recalc job %s queued",
+                 new_id, raw_name, sales_user_id, campaign_id or "GLOBAL", job_id)
+        return jsonify({"ok": True, "id": new_id, "job_id": job_id}), 202
     except Exception as e:
         log.error("create_sales_rep_mapping: %s", e)
         return error_response("server", 500)
@@ -1476,17 +1784,13 @@ def delete_sales_rep_mapping(mapping_id: int):
                 return error_response("not_found", 404)
             raw_name, campaign_id = row
             cur.execute("DELETE FROM sales_rep_mappings WHERE id = %s", (mapping_id,))
+            job_id = enqueue_mapping_change(
+                cur, "sales_rep", raw_name, campaign_id, session.get("user_id"))
         conn.commit()
+        wake_worker()
 
-        affected = apply_sales_rep_mapping_change(raw_name, campaign_id, conn)
-        for cid in affected:
-            recalc_after_upload(cid, conn)
-        log.info("Sales-rep mapping %s deleted; recalculated %d campaign(s)",
-                 mapping_id, len(affected))
-        return jsonify({
-            "ok": True,
-            "affected_campaigns": sorted(list(affected)),
-        })
+        log.info("Sales-rep mapping %s deleted; recalc job %s queued", mapping_id, job_id)
+        return jsonify({"ok": True, "job_id": job_id}), 202
     except Exception as e:
         log.error("delete_sales_rep_mapping %s: %s", mapping_id, e)
         return error_response("server", 500)
@@ -1495,6 +1799,30 @@ def delete_sales_rep_mapping(mapping_id: int):
             conn.close()
 
 
+# ─── Background jobs ────────────────────────────────────────────────────
+
+@crm_bp.route("/jobs/<int:job_id>", methods=["GET"])
+@login_required
+@role_required("admin")
+def crm_job_status(job_id: int):
+    """Status + progress of a queued job (see app/crm_jobs.py). For a
+    mapping change, progress counts the per-campaign recalcs it queued;
+    the job reads COMPLETED only once all of them have finished."""
+    conn = None
+    try:
+        conn = get_conn()
+        job = job_status(conn, job_id)
+        if job is None:
+            return error_response("not_found", 404)
+        return jsonify(job)
+    except Exception as e:
+        log.error("crm_job_status %s: %s", job_id, e)
+        return error_response("server", 500)
+    finally:
+        if conn is not None:
+            conn.close()
+
+
 @crm_bp.route("/unmatched-suggestions", methods=["GET"])
 @login_required
 @role_required("admin")
@@ -1637,6 +1965,8 @@ def list_uploads(campaign_id: int):
                        u.new_events, u.duplicate_events,
                        u.is_voided, u.error_message,
                        u.created_at, u.processed_at,
+                       u.parse_ms, u.ingest_ms, u.recalc_ms,
+                       u.duplicate_of_upload_id,
                        u.uploaded_by, usr.full_name AS uploaded_by_name
                 FROM crm_report_uploads u
                 LEFT JOIN users usr ON usr.id = u.uploaded_by
@@ -1650,6 +1980,8 @@ def list_uploads(campaign_id: int):
 
         out = []
         for r in rows:
+            rows_per_second, _ = upload_rate_and_eta(
+                None, r["total_rows"], None, r["parse_ms"], r["ingest_ms"])
             out.append({
                 "upload_id": r["id"],
                 "file_name": r["file_name"],
@@ -1665,6 +1997,11 @@ def list_uploads(campaign_id: int):
                 "processed_at": r["processed_at"].isoformat() if r["processed_at"] else None,
                 "uploaded_by": r["uploaded_by"],
                 "uploaded_by_name": r["uploaded_by_name"],
+                "parse_ms": r["parse_ms"],
+                "ingest_ms": r["ingest_ms"],
+                "recalc_ms": r["recalc_ms"],
+                "rows_per_second": rows_per_second,
+                "duplicate_of_upload_id": r["duplicate_of_upload_id"],
             })
         return jsonify(out)
     except Exception as e:
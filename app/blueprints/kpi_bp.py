@@ -18,6 +18,7 @@ from app.kpi_logic import (
     TL_KPI_CONFIG, TL_AUTO_FIELDS, TL_MANUAL_FIELDS, compute_tl_score,
 )
 from app.util.audit import audit_query
+from app.util.avatars import avatar_src_sql
 from app.util.date_range import parse_range, InvalidRangeError
 
 # Soft cap on response size for range-aware endpoints. Above this, callers
@@ -53,6 +54,9 @@ def _range_where(pr, *, alias="e", ts_field="dataentry"):
 log = logging.getLogger(__name__)
 kpi_bp = Blueprint("kpi", __name__, url_prefix="/api/kpi")
 
+# Versioned /api/avatars link for the joined users row, never the data URL.
+_AVATAR_SRC = avatar_src_sql("u")
+
 
 # ─── JSON helpers ──────────────────────────────────────────────────────────────
 
@@ -336,8 +340,9 @@ def get_entry(user_id, month):
         conn = get_conn()
         try:
             with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-                cur.execute("""
-                    SELECT e.*, u.full_name AS user_name, u.username, u.avatar_url
+                cur.execute(f"""
+                    SELECT e.*, u.full_name AS user_name, u.username,
+                           {_AVATAR_SRC} AS avatar_url
                     FROM kpi_entries e
                     JOIN users u ON u.id = e.user_id
                     WHERE e.user_id = %s AND e.month = %s
@@ -426,8 +431,9 @@ def report():
         conn = get_conn()
         try:
             with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-                q = """
-                    SELECT e.*, u.full_name AS user_name, u.username, u.avatar_url
+                q = f"""
+                    SELECT e.*, u.full_name AS user_name, u.username,
+                           {_AVATAR_SRC} AS avatar_url
                     FROM kpi_entries e
                     JOIN users u ON u.id = e.user_id
                     WHERE u.active = true
@@ -638,8 +644,9 @@ def get_tl_kpi(tl_user_id, month):
 
                 # Submitted team entries for this month — joined to user_name so we can
                 # surface top/weakest performer in the response.
-                cur.execute("""
-                    SELECT e.*, u.full_name AS user_name, u.avatar_url FROM kpi_entries e
+                cur.execute(f"""
+                    SELECT e.*, u.full_name AS user_name, {_AVATAR_SRC} AS avatar_url
+                    FROM kpi_entries e
                     JOIN users u ON u.id = e.user_id
                     WHERE u.team_id = %s AND u.role = 'sales' AND u.active = true
                     AND e.month = %s
@@ -649,8 +656,8 @@ def get_tl_kpi(tl_user_id, month):
                 # Per-rep list for TL-05/TL-06: every active sales rep on this team,
                 # with their entry data if it exists (LEFT JOIN — reps with no entry
                 # this month still appear so the TL sees their full team).
-                cur.execute("""
-                    SELECT u.id, u.full_name, u.username, u.avatar_url,
+                cur.execute(f"""
+                    SELECT u.id, u.full_name, u.username, {_AVATAR_SRC} AS avatar_url,
                            e.total_score, e.rating,
                            e.sales_submitted_at, e.dataentry_submitted_at
                     FROM users u
@@ -772,8 +779,8 @@ def list_team_leaders():
                 # When pr is exactly one month, this collapses to the original
                 # behavior (zero or one row per TL anyway).
                 cur.execute(
-                    """
-                    SELECT u.id, u.full_name, u.username, u.avatar_url,
+                    f"""
+                    SELECT u.id, u.full_name, u.username, {_AVATAR_SRC} AS avatar_url,
                            t.id AS team_id, t.name AS team_name,
                            latest.dataentry_submitted_at, latest.notes
                     FROM users u
@@ -870,8 +877,9 @@ def teams_summary():
                 # Range filter placed in the LEFT JOIN ON clause (not WHERE)
                 # so users with no entry in range still appear with NULLs.
                 q_sales = (
-                    """
-                    SELECT u.id AS user_id, u.full_name, u.team_id, u.avatar_url,
+                    f"""
+                    SELECT u.id AS user_id, u.full_name, u.team_id,
+                           {_AVATAR_SRC} AS avatar_url,
                            e.fresh_leads, e.calls, e.meetings, e.deals,
                            e.reservations, e.crm_pct, e.followup_pct,
                            e.total_score, e.rating, e.month,
@@ -6,6 +6,7 @@ import psycopg2.extras
 from flask import Blueprint, request, jsonify, session
 from app.database import get_conn
 from app.auth import role_required
+from app.util.avatars import avatar_src_sql
 
 log = logging.getLogger(__name__)
 teams_bp = Blueprint("teams", __name__, url_prefix="/api/teams")
@@ -27,11 +28,11 @@ def list_teams():
         conn = get_conn()
         try:
             with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-                cur.execute("""
+                cur.execute(f"""
                     SELECT t.id, t.name, t.description, t.created_at,
                            t.leader_id,
                            u.full_name AS leader_name, u.username AS leader_username,
-                           u.avatar_url AS leader_avatar_url,
+                           {avatar_src_sql("u")} AS leader_avatar_url,
                            (SELECT COUNT(*) FROM users m
                             WHERE m.team_id = t.id AND m.role = 'sales' AND m.active = true
                            ) AS member_count,
@@ -39,7 +40,7 @@ def list_teams():
                                'id', m.id,
                                'full_name', m.full_name,
                                'username', m.username,
-                               'avatar_url', m.avatar_url
+                               'avatar_url', {avatar_src_sql("m")}
                            ) ORDER BY m.full_name), '[]'::json)
                             FROM users m
                             WHERE m.team_id = t.id AND m.role = 'sales' AND m.active = true
@@ -66,10 +67,10 @@ def get_team(team_id):
         conn = get_conn()
         try:
             with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-                cur.execute("""
+                cur.execute(f"""
                     SELECT t.id, t.name, t.description, t.leader_id,
                            u.full_name AS leader_name, u.username AS leader_username,
-                           u.avatar_url AS leader_avatar_url
+                           {avatar_src_sql("u")} AS leader_avatar_url
                     FROM teams t
                     LEFT JOIN users u ON u.id = t.leader_id
                     WHERE t.id = %s
@@ -78,8 +79,9 @@ def get_team(team_id):
                 if not team:
                     return jsonify({"error_code": "not_found", "error": "not_found"}), 404
 
-                cur.execute("""
-                    SELECT id, full_name, username, role, active, avatar_url, email, phone
+                cur.execute(f"""
+                    SELECT id, full_name, username, role, active,
+                           {avatar_src_sql("users")} AS avatar_url, email, phone
                     FROM users
                     WHERE team_id = %s AND role = 'sales'
                     ORDER BY full_name
@@ -20,6 +20,7 @@ from app.auth import (
     validate_username,
 )
 from app.database import get_conn
+from app.util.avatars import avatar_src_sql
 from app.mailer import (
     send_mail,
     signup_approved_email,
@@ -58,8 +59,8 @@ def list_users():
             # written when the team was created.
             # team_leader_id/team_leader_name: only meaningful for sales reps
             # (their TL is tm.leader_id). NULL for all other roles.
-            q = """SELECT u.id, u.username, u.full_name, u.role, u.email, u.phone,
-                          u.active, u.avatar_url, u.approval_status,
+            q = f"""SELECT u.id, u.username, u.full_name, u.role, u.email, u.phone,
+                          u.active, {avatar_src_sql("u")} AS avatar_url, u.approval_status,
                           COALESCE(tl.id,   u.team_id) AS team_id,
                           COALESCE(tl.name, tm.name)   AS team_name,
                           CASE WHEN u.role = 'sales' THEN tm.leader_id END AS team_leader_id,
@@ -105,8 +106,9 @@ def get_user(user_id):
     try:
         conn = get_conn()
         with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-            cur.execute("""
-                SELECT id, username, full_name, role, email, phone, active, avatar_url,
+            cur.execute(f"""
+                SELECT id, username, full_name, role, email, phone, active,
+                       {avatar_src_sql("users")} AS avatar_url,
                        approval_status, created_at, updated_at, last_login, last_seen,
                        (last_seen IS NOT NULL AND last_seen > NOW() - INTERVAL '2 minutes') AS is_online
                 FROM users WHERE id = %s
@@ -5,6 +5,7 @@ Currently:
   GET /api/util/today  → server's "today" so the date-range picker doesn't
                          drift from the server's clock when shared deep-links
                          span timezones.
+  GET /api/util/db-pool → this process's database pool counters (admin).
 """
 import logging
 from datetime import date
@@ -12,6 +13,7 @@ from datetime import date
 from flask import Blueprint, Response, json, jsonify
 
 from app.auth import login_required, role_required
+from app.database import pool_stats
 from app.mailer import mailer_is_configured
 
 log = logging.getLogger(__name__)
@@ -50,3 +52,14 @@ def mailer_status():
     password-reset and approval emails will silently no-op until SMTP /
     Resend env vars are set."""
     return jsonify({"configured": mailer_is_configured()})
+
+
+@util_bp.route("/db-pool", methods=["GET"])
+@role_required("admin")
+def db_pool():
+    """Connection pool counters for this process since it started:
+    checkouts, how many had to wait (waits, wait_ms_total, wait_ms_max),
+    how many found the pool exhausted and of those how many timed out or
+    were turned away, stale connections dropped, and the current
+    in_use / idle / waiting numbers against min / max."""
+    return jsonify(pool_stats())
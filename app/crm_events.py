@@ -0,0 +1,292 @@
+"""
+Live CRM events for the browser: Server-Sent Events fed by Postgres
+LISTEN/NOTIFY.
+
+The upload modals used to poll /api/crm/uploads/<id>/status every 2s,
+so a few uploads in flight kept a steady trickle of queries on the pool.
+Now writers announce changes and /api/crm/events pushes them. Pages open
+the stream only while they follow an upload; a stream per open tab would
+pin a gunicorn thread per tab. The sidebar badge polls
+/api/crm/intervention/open-count instead, which answers from the badge
+cache below, so any number of tabs cost one query per _BADGE_TTL_SECONDS:
+
+  upload        crm_processor, whenever an upload changes status / phase
+                or writes progress — the payload carries what the modal
+                renders, so a progress tick costs no query at all
+  intervention  recalc_manager_intervention when a campaign's OPEN flag
+                counts moved, and the flag status PATCH — the payload is
+                the global badge counts (same shape as open-count)
+  resync        sent by this module when a subscriber may have missed
+                events (its queue overflowed, or the listener had to
+                reconnect); clients re-read state over plain HTTP
+
+notify() runs pg_notify inside the writer's own transaction, so Postgres
+delivers it on commit and drops it on rollback — a client never hears
+about a state that didn't land. One listener thread per process holds a
+direct connection (outside the pool; it lives as long as the process),
+LISTENs on the channel and fans each event out to the open streams, one
+bounded queue per stream. Each stream holds a gunicorn thread but no DB
+connection; CRM_SSE_MAX_CLIENTS caps them per process and a stream ends
+after CRM_SSE_MAX_SECONDS (EventSource reconnects by itself), so threads
+are recycled. The badge counts live in an in-process cache that the
+intervention events keep current; server.py starts the listener at boot
+so the cache follows the writers even while no stream is open. A fresh
+stream opens with those counts, as does every open-count answer.
+"""
+import json
+import logging
+import queue
+import select
+import threading
+import time
+from typing import Optional
+
+from config import Config
+from app.database import connect_direct, get_conn
+
+log = logging.getLogger(__name__)
+
+CHANNEL = "crm_events"
+
+EVENT_UPLOAD = "upload"
+EVENT_INTERVENTION = "intervention"
+EVENT_RESYNC = "resync"
+
+_QUEUE_SIZE = 100
+_HEARTBEAT_SECONDS = 15
+_RETRY_MS = 5000
+_LISTEN_PING_SECONDS = 60
+_RECONNECT_SECONDS = 5
+# The badge cache is refreshed from the DB when older than this, which
+# bounds how stale it can get from writes that don't notify (e.g. a
+# campaign delete cascading its flags).
+_BADGE_TTL_SECONDS = 60
+
+
+# ─── Writers ────────────────────────────────────────────────────────────
+
+def notify(cur, event_type: str, payload: dict) -> None:
+    """Queue an event on the writer's transaction; delivered on commit."""
+    body = dict(payload, type=event_type)
+    cur.execute("SELECT pg_notify(%s, %s)", (CHANNEL, json.dumps(body, default=str)))
+
+
+def intervention_counts(cur) -> dict:
+    """Global OPEN flag counts, as the sidebar badge shows them. Works with
+    any cursor type — the query runs on a plain cursor of the same
+    connection (and so inside the caller's transaction)."""
+    high = medium = 0
+    with cur.connection.cursor() as c:
+        c.execute(
+            """
+            SELECT priority, COUNT(*) FROM manager_intervention_flags
+            WHERE status = 'OPEN'
+            GROUP BY priority
+            """
+        )
+        for priority, n in c.fetchall():
+            if priority == "HIGH":
+                high = n
+            elif priority == "MEDIUM":
+                medium = n
+    return {"open_count": high + medium, "high_priority": high, "medium_priority": medium}
+
+
+def notify_intervention_counts(cur) -> dict:
+    """Announce the current badge counts; returns them."""
+    counts = intervention_counts(cur)
+    notify(cur, EVENT_INTERVENTION, counts)
+    return counts
+
+
+# ─── Subscribers ────────────────────────────────────────────────────────
+
+class Subscription:
+    def __init__(self):
+        self.queue: queue.Queue = queue.Queue(maxsize=_QUEUE_SIZE)
+        # Set when an event had to be dropped; the stream turns it into
+        # one resync instead of queueing without bound for a slow reader.
+        self.missed = False
+
+    def offer(self, event_type: str, data: dict) -> None:
+        try:
+            self.queue.put_nowait((event_type, data))
+        except queue.Full:
+            self.missed = True
+
+
+_subs_lock = threading.Lock()
+_subscribers: set = set()
+
+
+def subscribe() -> Optional[Subscription]:
+    """Register a stream; None when this process already serves
+    CRM_SSE_MAX_CLIENTS of them."""
+    start_listener()
+    with _subs_lock:
+        if len(_subscribers) >= Config.CRM_SSE_MAX_CLIENTS:
+            return None
+        sub = Subscription()
+        _subscribers.add(sub)
+    return sub
+
+
+def unsubscribe(sub: Subscription) -> None:
+    with _subs_lock:
+        _subscribers.discard(sub)
+
+
+def subscriber_count() -> int:
+    with _subs_lock:
+        return len(_subscribers)
+
+
+def _broadcast(event_type: str, data: dict) -> None:
+    with _subs_lock:
+        subs = list(_subscribers)
+    for sub in subs:
+        sub.offer(event_type, data)
+
+
+def dispatch(raw_payload: str) -> None:
+    """Fan one NOTIFY payload out to every open stream."""
+    try:
+        data = json.loads(raw_payload)
+        event_type = data.pop("type")
+    except (ValueError, KeyError, TypeError, AttributeError):
+        log.warning("crm_events: ignoring malformed payload %r", raw_payload[:200])
+        return
+    if event_type == EVENT_INTERVENTION:
+        _set_badge(data)
+    _broadcast(event_type, data)
+
+
+# ─── Stream ─────────────────────────────────────────────────────────────
+
+def format_sse(event_type: str, data: dict) -> str:
+    return f"event: {event_type}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def event_stream(sub: Subscription):
+    """Generator behind /api/crm/events. The caller unsubscribes on close."""
+    yield f"retry: {_RETRY_MS}\n\n"
+    counts = badge_snapshot()
+    if counts is not None:
+        yield format_sse(EVENT_INTERVENTION, counts)
+    deadline = time.monotonic() + Config.CRM_SSE_MAX_SECONDS
+    while time.monotonic() < deadline:
+        try:
+            event_type, data = sub.queue.get(timeout=_HEARTBEAT_SECONDS)
+        except queue.Empty:
+            # Comment line: keeps proxies from idling the connection out,
+            # and surfaces a dead client as a write error.
+            yield ": ping\n\n"
+            continue
+        yield format_sse(event_type, data)
+        if sub.missed:
+            sub.missed = False
+            yield format_sse(EVENT_RESYNC, {})
+
+
+# ─── Badge cache ────────────────────────────────────────────────────────
+
+_badge_lock = threading.Lock()
+_badge: dict = {"counts": None, "at": 0.0}
+
+
+def _set_badge(counts: Optional[dict]) -> None:
+    with _badge_lock:
+        _badge["counts"] = counts
+        _badge["at"] = time.monotonic() if counts is not None else 0.0
+
+
+def cache_badge(counts: dict) -> None:
+    """Put counts this process just committed straight into the cache, so
+    the writer's own next open-count read doesn't race the listener
+    delivering the NOTIFY."""
+    _set_badge(dict(counts))
+
+
+def badge_snapshot() -> Optional[dict]:
+    """Current badge counts, from the cache when it's fresh. None if the
+    DB can't be reached — the client then fetches open-count itself."""
+    with _badge_lock:
+        if _badge["counts"] is not None and time.monotonic() - _badge["at"] < _BADGE_TTL_SECONDS:
+            return dict(_badge["counts"])
+    conn = None
+    try:
+        conn = get_conn()
+        with conn.cursor() as cur:
+            counts = intervention_counts(cur)
+        conn.commit()
+    except Exception as e:
+        log.error("crm_events: badge snapshot failed: %s", e)
+        return None
+    finally:
+        if conn is not None:
+            conn.close()
+    _set_badge(counts)
+    return dict(counts)
+
+
+# ─── Listener thread ────────────────────────────────────────────────────
+#
+# Same model as the other background threads: one daemon per process,
+# started on the first subscribe (so processes that never serve a stream,
+# like scripts, don't hold a connection for it).
+
+_listener_lock = threading.Lock()
+_listener_thread: Optional[threading.Thread] = None
+
+
+def start_listener() -> None:
+    """Start the LISTEN thread once per process. Idempotent."""
+    global _listener_thread
+    with _listener_lock:
+        if _listener_thread is not None and _listener_thread.is_alive():
+            return
+        _listener_thread = threading.Thread(target=_listen_loop, name="crm-events", daemon=True)
+        _listener_thread.start()
+    log.info("🧵 CRM event listener started (channel %s)", CHANNEL)
+
+
+def _listen_loop() -> None:
+    first = True
+    while True:
+        conn = None
+        try:
+            conn = connect_direct()
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {CHANNEL}")
+            if not first:
+                # Anything notified while we were away is gone.
+                _set_badge(None)
+                _broadcast(EVENT_RESYNC, {})
+            first = False
+            _pump(conn)
+        except Exception as e:
+            log.error("crm_events listener: %s", e)
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+        time.sleep(_RECONNECT_SECONDS)
+
+
+def _pump(conn) -> None:
+    last_ping = time.monotonic()
+    while True:
+        ready, _, _ = select.select([conn], [], [], _LISTEN_PING_SECONDS)
+        if ready:
+            conn.poll()
+        elif time.monotonic() - last_ping >= _LISTEN_PING_SECONDS:
+            # An idle TCP connection can die without select() noticing;
+            # a round trip raises instead and we reconnect.
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            last_ping = time.monotonic()
+        while conn.notifies:
+            dispatch(conn.notifies.pop(0).payload)
@@ -0,0 +1,376 @@
+"""
+Postgres-backed job queue for CRM work that shouldn't run inside an
+HTTP request.
+
+A stage / sales-rep mapping change used to re-derive the matching events
+and then run recalc_after_upload for every affected campaign before the
+admin got a response. A global mapping touching a few dozen campaigns held
+the (only) gunicorn worker for minutes. Now the mapping endpoint commits
+the mapping together with a `mapping_change` row in `crm_jobs` and returns
+202; the worker thread started from server.py does the rest:
+
+  mapping_change   apply_*_mapping_change (one UPDATE), then enqueue one
+                   campaign_recalc per affected campaign
+  campaign_recalc  recalc_after_upload(campaign_id) — full pass, since a
+                   mapping change can move any lead in the campaign
+
+Claiming uses UPDATE … WHERE id = (SELECT … FOR UPDATE SKIP LOCKED), so
+any number of worker threads/processes can poll the same table without
+handing out a job twice. Recalcs coalesce: at most one PENDING
+campaign_recalc exists per campaign (partial unique index), and enqueuing
+another just returns the pending one's id. A recalc that hasn't started
+yet reads the events as they are when it does start, so it covers every
+mapping change committed before it.
+
+Statuses follow crm_report_uploads: PENDING → PROCESSING → COMPLETED |
+FAILED. A job stuck in PROCESSING past CRM_JOB_STALE_SECONDS (the worker
+died) is claimed again, up to _MAX_ATTEMPTS runs.
+"""
+import json
+import logging
+import threading
+import traceback
+from typing import Optional
+
+import psycopg2.extras
+
+from config import Config
+from app.crm_logic import (
+    apply_sales_rep_mapping_change,
+    apply_stage_mapping_change,
+    recalc_after_upload,
+)
+from app.database import get_conn
+
+log = logging.getLogger(__name__)
+
+JOB_MAPPING_CHANGE = "mapping_change"
+JOB_CAMPAIGN_RECALC = "campaign_recalc"
+
+MAPPING_KINDS = ("stage", "sales_rep")
+
+_TERMINAL = ("COMPLETED", "FAILED")
+_MAX_ATTEMPTS = 3
+
+
+# ─── Enqueue ────────────────────────────────────────────────────────────
+
+def enqueue_mapping_change(cur, kind: str, raw_value: str, campaign_id_scope,
+                           requested_by: Optional[int]) -> int:
+    """Queue the retroactive re-derivation + recalc for one mapping change.
+
+    Runs on the caller's cursor and does NOT commit, so the endpoint can
+    land the mapping row and its job in the same transaction. Call
+    wake_worker() after the commit.
+    """
+    if kind not in MAPPING_KINDS:
+        raise ValueError(f"unknown mapping kind {kind!r}")
+    cur.execute(
+        """
+        INSERT INTO crm_jobs (job_type, campaign_id, payload, requested_by)
+        VALUES (%s, %s, %s::jsonb, %s)
+        RETURNING id
+        """,
+        (
+            JOB_MAPPING_CHANGE, campaign_id_scope,
+            json.dumps({"kind": kind, "raw": raw_value, "scope": campaign_id_scope}),
+            requested_by,
+        ),
+    )
+    return cur.fetchone()[0]
+
+
+def enqueue_campaign_recalc(cur, campaign_id: int, requested_by: Optional[int] = None) -> int:
+    """Queue a full recalc for one campaign, or return the id of the one
+    already waiting. Does not commit."""
+    # The no-op DO UPDATE is there so RETURNING yields the existing row's
+    # id; DO NOTHING would return no row on conflict.
+    cur.execute(
+        """
+        INSERT INTO crm_jobs (job_type, campaign_id, requested_by)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (campaign_id)
+            WHERE job_type = 'campaign_recalc' AND status = 'PENDING'
+        DO UPDATE SET job_type = EXCLUDED.job_type
+        RETURNING id
+        """,
+        (JOB_CAMPAIGN_RECALC, campaign_id, requested_by),
+    )
+    return cur.fetchone()[0]
+
+
+# ─── Claim + run ────────────────────────────────────────────────────────
+
+def claim_next_job(conn) -> Optional[dict]:
+    """Mark the oldest runnable job PROCESSING and return it, or None.
+
+    Runnable = PENDING, or PROCESSING but stale (its worker is gone) with
+    attempts left. A campaign_recalc is skipped while another recalc for
+    the same campaign is PROCESSING, so two job workers don't tie each
+    other up on one campaign (recalc_after_upload's advisory lock is what
+    serializes them against the upload worker). Commits the claim.
+    """
+    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        # Stale jobs that already used up their attempts are given up on
+        # here, so they don't sit in PROCESSING forever.
+        cur.execute(
+            """
+            UPDATE crm_jobs
+            SET status = 'FAILED',
+                error_message = 'worker stopped before the job finished',
+                finished_at = NOW()
+            WHERE status = 'PROCESSING'
+              AND started_at < NOW() - make_interval(secs => %s)
+              AND attempts >= %s
+            """,
+            (Config.CRM_JOB_STALE_SECONDS, _MAX_ATTEMPTS),
+        )
+        cur.execute(
+            """
+            UPDATE crm_jobs j
+            SET status = 'PROCESSING',
+                started_at = NOW(),
+                attempts = j.attempts + 1,
+                error_message = NULL
+            WHERE j.id = (
+                SELECT c.id
+                FROM crm_jobs c
+                WHERE (c.status = 'PENDING'
+                       OR (c.status = 'PROCESSING'
+                           AND c.started_at < NOW() - make_interval(secs => %(stale)s)
+                           AND c.attempts < %(max_attempts)s))
+                  AND NOT (c.job_type = 'campaign_recalc' AND EXISTS (
+                      SELECT 1 FROM crm_jobs r
+                      WHERE r.job_type = 'campaign_recalc'
+                        AND r.campaign_id = c.campaign_id
+                        AND r.status = 'PROCESSING'
+                        AND r.id <> c.id
+                        AND r.started_at >= NOW() - make_interval(secs => %(stale)s)
+                  ))
+                ORDER BY c.id
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            )
+            RETURNING j.id, j.job_type, j.campaign_id, j.payload, j.requested_by, j.attempts
+            """,
+            {"stale": Config.CRM_JOB_STALE_SECONDS, "max_attempts": _MAX_ATTEMPTS},
+        )
+        job = cur.fetchone()
+    conn.commit()
+    return dict(job) if job else None
+
+
+def run_next_job() -> bool:
+    """Claim and run one job. Returns False when the queue was empty."""
+    conn = None
+    try:
+        conn = get_conn()
+        job = claim_next_job(conn)
+        if job is None:
+            return False
+
+        try:
+            if job["job_type"] == JOB_MAPPING_CHANGE:
+                _run_mapping_change(conn, job)
+            elif job["job_type"] == JOB_CAMPAIGN_RECALC:
+                _run_campaign_recalc(conn, job)
+            else:
+                raise ValueError(f"unknown job type {job['job_type']!r}")
+        except Exception as exc:
+            log.error("CRM job %s (%s) failed: %s\n%s",
+                      job["id"], job["job_type"], exc, traceback.format_exc())
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            _finish(conn, job["id"], "FAILED", error_message=str(exc)[:2000])
+        return True
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+def _run_mapping_change(conn, job: dict) -> None:
+    payload = job["payload"] or {}
+    apply = (apply_stage_mapping_change if payload.get("kind") == "stage"
+             else apply_sales_rep_mapping_change)
+    affected = apply(payload.get("raw"), payload.get("scope"), conn)
+
+    # apply_* commits on its own and only reports campaigns it changed.
+    # On a retry an earlier run may have committed the UPDATE and died
+    # before queuing recalcs, so recalc the whole scope instead.
+    if job["attempts"] > 1:
+        affected = set(affected) | _campaigns_in_scope(conn, payload.get("scope"))
+
+    # Enqueue the recalcs and close this job in one transaction, so a
+    # crash can't leave it COMPLETED without its follow-up work.
+    campaign_ids = sorted(affected)
+    with conn.cursor() as cur:
+        recalc_ids = [enqueue_campaign_recalc(cur, cid, job["requested_by"])
+                      for cid in campaign_ids]
+    _finish(conn, job["id"], "COMPLETED", result={
+        "affected_campaigns": campaign_ids,
+        "recalc_job_ids": recalc_ids,
+    })
+    log.info("CRM job %s: %s mapping %r (scope=%s) → %d campaign recalc(s) queued",
+             job["id"], payload.get("kind"), payload.get("raw"),
+             payload.get("scope") or "GLOBAL", len(recalc_ids))
+    if recalc_ids:
+        wake_worker()
+
+
+def _campaigns_in_scope(conn, scope) -> set:
+    if scope is not None:
+        return {scope}
+    with conn.cursor() as cur:
+        cur.execute("SELECT DISTINCT campaign_id FROM leads")
+        return {r[0] for r in cur.fetchall()}
+
+
+def _run_campaign_recalc(conn, job: dict) -> None:
+    recalc = recalc_after_upload(job["campaign_id"], conn)
+    _finish(conn, job["id"], "COMPLETED", result={
+        "mode": recalc.get("mode"),
+        "intervention_open": recalc.get("intervention_open"),
+        "sales_reps_with_kpis": recalc.get("sales_reps_with_kpis"),
+    })
+    log.info("CRM job %s: campaign %s recalculated (open flags=%s)",
+             job["id"], job["campaign_id"], recalc.get("intervention_open"))
+
+
+def _finish(conn, job_id: int, status: str, result=None, error_message=None) -> None:
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            UPDATE crm_jobs
+            SET status = %s, result = %s::jsonb, error_message = %s,
+                finished_at = NOW()
+            WHERE id = %s
+            """,
+            (status, json.dumps(result) if result is not None else None,
+             error_message, job_id),
+        )
+    conn.commit()
+
+
+# ─── Status ─────────────────────────────────────────────────────────────
+
+def job_status(conn, job_id: int) -> Optional[dict]:
+    """The job as the status endpoint reports it, or None if unknown.
+
+    A mapping_change is only done once the recalcs it queued are, so its
+    reported status and progress roll up over those child jobs.
+    """
+    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        cur.execute(
+            """
+            SELECT id, job_type, campaign_id, payload, status, attempts,
+                   result, error_message, created_at, started_at, finished_at
+            FROM crm_jobs WHERE id = %s
+            """,
+            (job_id,),
+        )
+        job = cur.fetchone()
+        if not job:
+            return None
+        children = []
+        recalc_ids = (job["result"] or {}).get("recalc_job_ids") or []
+        if recalc_ids:
+            cur.execute(
+                """
+                SELECT id, campaign_id, status, error_message, finished_at
+                FROM crm_jobs WHERE id = ANY(%s) ORDER BY campaign_id
+                """,
+                (recalc_ids,),
+            )
+            children = cur.fetchall()
+    return summarize_job(job, children)
+
+
+def summarize_job(job: dict, children: list) -> dict:
+    """Roll a job row and its child recalc rows up into the API shape.
+
+    Pure — kept apart from job_status so the roll-up rules are testable
+    without a database.
+    """
+    status = job["status"]
+    if job["job_type"] == JOB_MAPPING_CHANGE:
+        total = len(children) if status == "COMPLETED" else None
+        done = sum(1 for c in children if c["status"] in _TERMINAL)
+        if status == "COMPLETED":
+            if done < len(children):
+                status = "PROCESSING"
+            elif any(c["status"] == "FAILED" for c in children):
+                status = "FAILED"
+    else:
+        total = 1
+        done = 1 if status in _TERMINAL else 0
+
+    error_message = job["error_message"]
+    if error_message is None:
+        failed = [c for c in children if c["status"] == "FAILED"]
+        if failed:
+            error_message = failed[0]["error_message"]
+
+    def _iso(ts):
+        return ts.isoformat() if ts else None
+
+    result = job["result"] or {}
+    return {
+        "job_id": job["id"],
+        "job_type": job["job_type"],
+        "campaign_id": job["campaign_id"],
+        "status": status,
+        "progress": {"done": done, "total": total},
+        "affected_campaigns": result.get("affected_campaigns"),
+        "recalc_jobs": [
+            {"job_id": c["id"], "campaign_id": c["campaign_id"], "status": c["status"]}
+            for c in children
+        ],
+        "error_message": error_message,
+        "created_at": _iso(job["created_at"]),
+        "started_at": _iso(job["started_at"]),
+        "finished_at": _iso(job["finished_at"]) if status in _TERMINAL else None,
+    }
+
+
+# ─── Worker thread ──────────────────────────────────────────────────────
+#
+# Same model as app/sync_service.py: one daemon thread per process. With
+# `gunicorn --workers 1` that is one worker overall; more processes are
+# safe because claiming is SKIP LOCKED. wake_worker() cuts the poll wait
+# short when this process enqueues something.
+
+_wake = threading.Event()
+_worker_lock = threading.Lock()
+_worker_thread: Optional[threading.Thread] = None
+
+
+def wake_worker() -> None:
+    _wake.set()
+
+
+def start_job_worker() -> None:
+    """Start the daemon worker once per process. Idempotent."""
+    global _worker_thread
+    with _worker_lock:
+        if _worker_thread is not None and _worker_thread.is_alive():
+            return
+        _worker_thread = threading.Thread(target=_worker_loop, name="crm-jobs", daemon=True)
+        _worker_thread.start()
+    log.info("🧵 CRM job worker started (poll every %ss)", Config.CRM_JOB_POLL_SECONDS)
+
+
+def _worker_loop() -> None:
+    while True:
+        # Clear before looking for work, not after waiting: a wake_worker()
+        # that lands while a job runs must still cut the next wait short.
+        _wake.clear()
+        try:
+            ran = run_next_job()
+        except Exception as exc:
+            # DB unreachable or similar — back off for one poll interval.
+            log.error("CRM job worker: %s", exc)
+            ran = False
+        if not ran:
+            _wake.wait(Config.CRM_JOB_POLL_SECONDS)
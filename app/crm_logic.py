@@ -12,8 +12,11 @@ Do not add side-effecting recalcs here in this phase.
 import hashlib
 import logging
 import re
+from contextlib import contextmanager
 from typing import Optional
 
+from app.util.avatars import avatar_src_sql
+
 log = logging.getLogger(__name__)
 
 
@@ -121,6 +124,12 @@ def normalize_sales_name(raw) -> str:
     return _WS_COLLAPSE.sub(" ", str(raw).strip().lower())
 
 
+def sales_rep_key_sql(expr: str) -> str:
+    """normalize_sales_name as SQL over `expr` — the value every writer
+    stores in lead_events.raw_sales_rep_key."""
+    return f"BTRIM(REGEXP_REPLACE(LOWER({expr}), '\\s+', ' ', 'g'))"
+
+
 # Allowed roles for CRM sales-rep matching. Team leaders are included since
 # they can show up as the responsible rep in mixed-team campaigns; managers
 # and admins are not — a "sale" attributed to those roles would skew KPIs.
@@ -216,6 +225,159 @@ def normalize_stage(raw, campaign_id: Optional[int] = None, conn=None) -> Option
     return DEFAULT_STAGE_MAP.get(key)
 
 
+# ─── Per-upload mapping resolver ────────────────────────────────────────
+#
+# normalize_stage / match_sales_user cost up to three queries PER CALL —
+# fine for a one-off lookup, ruinous for a 50k-row sheet that only holds a
+# few dozen distinct stage and rep strings. MappingResolver loads the
+# mapping tables and the eligible users once, applies exactly the same
+# precedence in Python, and memoises every distinct raw value it sees.
+#
+# The SQL helpers compare with LOWER(TRIM(...)); Postgres TRIM() strips
+# spaces only, so _pg_trim_lower mirrors that rather than str.strip().
+
+def _pg_trim_lower(s) -> str:
+    return str(s).strip(" ").lower()
+
+
+class MappingResolver:
+    """In-memory stage + sales-rep resolution for one campaign.
+
+    Stage:  stage_mappings (campaign) → stage_mappings (global)
+            → DEFAULT_STAGE_MAP → None
+    Rep:    sales_rep_mappings (campaign) → sales_rep_mappings (global)
+            → active users.full_name with role ∈ _SALES_USER_ROLES
+              (lowest id wins, as in match_sales_user) → None
+
+    Build with MappingResolver.load(conn, campaign_id), or load_resolvers()
+    when several campaigns need resolving at once (retroactive mapping
+    changes). The snapshot is taken at load time — mapping edits made
+    after that aren't seen, which is what a single upload wants.
+    """
+
+    def __init__(self, campaign_id, stage_overrides=None, stage_globals=None,
+                 rep_overrides=None, rep_globals=None, users_by_name=None):
+        self.campaign_id = campaign_id
+        self._stage_overrides = stage_overrides or {}
+        self._stage_globals = stage_globals or {}
+        self._rep_overrides = rep_overrides or {}
+        self._rep_globals = rep_globals or {}
+        self._users_by_name = users_by_name or {}
+        self._stage_memo: dict = {}
+        self._rep_memo: dict = {}
+
+    @classmethod
+    def load(cls, conn, campaign_id):
+        return load_resolvers(conn, [campaign_id])[campaign_id]
+
+    def stage(self, raw) -> Optional[str]:
+        """Same contract as normalize_stage(raw, campaign_id, conn)."""
+        if raw is None:
+            return None
+        try:
+            return self._stage_memo[raw]
+        except (KeyError, TypeError):
+            pass
+        key = str(raw).strip().lower()
+        result = None
+        if key:
+            result = (self._stage_overrides.get(key)
+                      or self._stage_globals.get(key)
+                      or DEFAULT_STAGE_MAP.get(key))
+        if isinstance(raw, str):
+            self._stage_memo[raw] = result
+        return result
+
+    def sales_user(self, raw_name) -> Optional[int]:
+        """Same contract as match_sales_user(raw_name, campaign_id, conn)."""
+        if raw_name is None:
+            return None
+        try:
+            return self._rep_memo[raw_name]
+        except (KeyError, TypeError):
+            pass
+        norm = normalize_sales_name(raw_name)
+        result = None
+        if norm:
+            result = self._rep_overrides.get(norm)
+            if result is None:
+                result = self._rep_globals.get(norm)
+            if result is None:
+                result = self._users_by_name.get(norm)
+        if isinstance(raw_name, str):
+            self._rep_memo[raw_name] = result
+        return result
+
+
+def load_resolvers(conn, campaign_ids) -> dict:
+    """Build one MappingResolver per campaign id with three queries total.
+
+    Global mappings and the users index are shared between the returned
+    resolvers; only the per-campaign override dicts differ. A campaign id
+    of None gets a resolver with no overrides (global scope).
+    """
+    campaign_ids = list(campaign_ids)
+    scoped_ids = [cid for cid in campaign_ids if cid is not None]
+
+    stage_globals: dict = {}
+    stage_overrides: dict = {}
+    rep_globals: dict = {}
+    rep_overrides: dict = {}
+    users_by_name: dict = {}
+
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT campaign_id, raw_stage, normalized_stage
+            FROM stage_mappings
+            WHERE campaign_id IS NULL OR campaign_id = ANY(%s)
+            """,
+            (scoped_ids,),
+        )
+        for cid, raw, token in cur.fetchall():
+            if not token:
+                continue
+            target = stage_globals if cid is None else stage_overrides.setdefault(cid, {})
+            target[_pg_trim_lower(raw)] = token
+
+        cur.execute(
+            """
+            SELECT campaign_id, raw_name, sales_user_id
+            FROM sales_rep_mappings
+            WHERE campaign_id IS NULL OR campaign_id = ANY(%s)
+            """,
+            (scoped_ids,),
+        )
+        for cid, raw, user_id in cur.fetchall():
+            target = rep_globals if cid is None else rep_overrides.setdefault(cid, {})
+            target[_pg_trim_lower(raw)] = user_id
+
+        cur.execute(
+            """
+            SELECT id, full_name
+            FROM users
+            WHERE role = ANY(%s) AND active = TRUE
+            ORDER BY id ASC
+            """,
+            (list(_SALES_USER_ROLES),),
+        )
+        for user_id, full_name in cur.fetchall():
+            key = _WS_COLLAPSE.sub(" ", _pg_trim_lower(full_name or ""))
+            users_by_name.setdefault(key, user_id)
+
+    return {
+        cid: MappingResolver(
+            cid,
+            stage_overrides=stage_overrides.get(cid),
+            stage_globals=stage_globals,
+            rep_overrides=rep_overrides.get(cid),
+            rep_globals=rep_globals,
+            users_by_name=users_by_name,
+        )
+        for cid in campaign_ids
+    }
+
+
 # ─── Event hashing for dedup ────────────────────────────────────────────
 
 def compute_event_hash(
@@ -331,57 +493,159 @@ def recalc_campaign_kpis(campaign_id: int, conn) -> dict:
         )
         total_leads = cur.fetchone()[0] or 0
 
-        # manager_intervention_count tracks OPEN flags only. Closed/reviewed
-        # rows live in the table for the audit trail but don't add to the
-        # "needs attention" badge on the overview.
-        cur.execute(
-            """
-            SELECT COUNT(*) FROM manager_intervention_flags
-            WHERE campaign_id = %s AND status = %s
-            """,
-            (campaign_id, STATUS_OPEN),
+        kpis = _write_campaign_kpis(cur, campaign_id, total_leads, stage_counts)
+    conn.commit()
+    return kpis
+
+
+def _write_campaign_kpis(cur, campaign_id: int, total_leads: int,
+                         stage_counts: dict) -> dict:
+    """Shared tail of the full and delta campaign-KPI paths: read the
+    open-flag count and last upload time, upsert the row, return it."""
+    # manager_intervention_count tracks OPEN flags only. Closed/reviewed
+    # rows live in the table for the audit trail but don't add to the
+    # "needs attention" badge on the overview.
+    cur.execute(
+        """
+        SELECT COUNT(*) FROM manager_intervention_flags
+        WHERE campaign_id = %s AND status = %s
+        """,
+        (campaign_id, STATUS_OPEN),
+    )
+    intervention_count = cur.fetchone()[0] or 0
+
+    cur.execute(
+        """
+        SELECT MAX(processed_at) FROM crm_report_uploads
+        WHERE campaign_id = %s AND status = 'COMPLETED' AND is_voided = FALSE
+        """,
+        (campaign_id,),
+    )
+    last_upload_at = cur.fetchone()[0]
+
+    cur.execute(
+        """
+        INSERT INTO campaign_kpis (
+            campaign_id, total_leads, stage_counts,
+            manager_intervention_count, last_upload_at, updated_at,
+            recalculated_at
         )
-        intervention_count = cur.fetchone()[0] or 0
+        VALUES (%s, %s, %s::jsonb, %s, %s, NOW(), NOW())
+        ON CONFLICT (campaign_id) DO UPDATE SET
+            total_leads                = EXCLUDED.total_leads,
+            stage_counts               = EXCLUDED.stage_counts,
+            manager_intervention_count = EXCLUDED.manager_intervention_count,
+            last_upload_at             = EXCLUDED.last_upload_at,
+            updated_at                 = NOW(),
+            recalculated_at            = NOW()
+        """,
+        (
+            campaign_id,
+            total_leads,
+            _json_dumps_safe(stage_counts),
+            intervention_count,
+            last_upload_at,
+        ),
+    )
+    return {
+        "campaign_id": campaign_id,
+        "total_leads": total_leads,
+        "stage_counts": stage_counts,
+        "manager_intervention_count": intervention_count,
+        "last_upload_at": last_upload_at,
+    }
+
+
+def _merge_stage_counts(baseline: dict, old: dict, new: dict) -> Optional[dict]:
+    """Pure: baseline stage_counts minus the touched leads' previous
+    buckets plus their current ones. Zero buckets are dropped, matching
+    what the full GROUP BY would return. None if any bucket would go
+    negative — the baseline doesn't describe the leads we think it does,
+    and the caller must fall back to a full recalc."""
+    merged = dict(baseline or {})
+    for stage, n in old.items():
+        merged[stage] = merged.get(stage, 0) - n
+    for stage, n in new.items():
+        merged[stage] = merged.get(stage, 0) + n
+    if any(n < 0 for n in merged.values()):
+        return None
+    return {stage: n for stage, n in merged.items() if n}
+
+
+def recalc_campaign_kpis_delta(campaign_id: int, conn, lead_ids,
+                               upload_id: int) -> Optional[dict]:
+    """Incremental counterpart of recalc_campaign_kpis for one upload.
 
+    Only the touched leads can have changed bucket, so we compute each
+    one's latest stage twice — with and without this upload's events —
+    and shift the stored stage_counts / total_leads by the difference.
+    Returns the new row, or None when there's no trustworthy baseline
+    (no campaign_kpis row yet, or the arithmetic doesn't add up); the
+    caller then runs the full recalc instead."""
+    lead_ids = list(lead_ids)
+    with conn.cursor() as cur:
+        # FOR UPDATE so a concurrent recalc can't read the same baseline
+        # and apply its own delta on top of a stale copy.
         cur.execute(
-            """
-            SELECT MAX(processed_at) FROM crm_report_uploads
-            WHERE campaign_id = %s AND status = 'COMPLETED' AND is_voided = FALSE
-            """,
+            "SELECT total_leads, stage_counts FROM campaign_kpis "
+            "WHERE campaign_id = %s FOR UPDATE",
             (campaign_id,),
         )
-        last_upload_at = cur.fetchone()[0]
+        baseline = cur.fetchone()
+        if baseline is None:
+            conn.rollback()
+            return None
+        base_total, base_counts = baseline[0] or 0, baseline[1] or {}
 
+        # Same DISTINCT ON ordering as recalc_campaign_kpis, run over the
+        # touched leads only. `before` drops this upload's events, which
+        # is exactly the state the stored baseline was computed from.
         cur.execute(
             """
-            INSERT INTO campaign_kpis (
-                campaign_id, total_leads, stage_counts,
-                manager_intervention_count, last_upload_at, updated_at
+            WITH ev AS (
+                SELECT le.id, le.lead_id, le.normalized_stage,
+                       le.follow_date, le.source_upload_id
+                FROM lead_events le
+                WHERE le.lead_id = ANY(%s)
+                  AND le.normalized_stage IS NOT NULL
+                  AND le.is_voided = FALSE
+            ),
+            after_upload AS (
+                SELECT DISTINCT ON (lead_id) lead_id, normalized_stage
+                FROM ev
+                ORDER BY lead_id, follow_date DESC NULLS LAST, id DESC
+            ),
+            before_upload AS (
+                SELECT DISTINCT ON (lead_id) lead_id, normalized_stage
+                FROM ev
+                WHERE source_upload_id IS DISTINCT FROM %s
+                ORDER BY lead_id, follow_date DESC NULLS LAST, id DESC
             )
-            VALUES (%s, %s, %s::jsonb, %s, %s, NOW())
-            ON CONFLICT (campaign_id) DO UPDATE SET
-                total_leads                = EXCLUDED.total_leads,
-                stage_counts               = EXCLUDED.stage_counts,
-                manager_intervention_count = EXCLUDED.manager_intervention_count,
-                last_upload_at             = EXCLUDED.last_upload_at,
-                updated_at                 = NOW()
+            SELECT 'old', normalized_stage, COUNT(*) FROM before_upload
+            GROUP BY normalized_stage
+            UNION ALL
+            SELECT 'new', normalized_stage, COUNT(*) FROM after_upload
+            GROUP BY normalized_stage
             """,
-            (
-                campaign_id,
-                total_leads,
-                _json_dumps_safe(stage_counts),
-                intervention_count,
-                last_upload_at,
-            ),
+            (lead_ids, upload_id),
         )
+        old_counts: dict = {}
+        new_counts: dict = {}
+        for side, stage, n in cur.fetchall():
+            (old_counts if side == "old" else new_counts)[stage] = n
+
+        # Every lead with a valid event sits in exactly one bucket, so
+        # total_leads moves by the same amount as the bucket sums.
+        total_leads = base_total - sum(old_counts.values()) + sum(new_counts.values())
+        stage_counts = _merge_stage_counts(base_counts, old_counts, new_counts)
+        if (stage_counts is None or total_leads < 0
+                or sum(stage_counts.values()) != total_leads):
+            conn.rollback()
+            return None
+
+        kpis = _write_campaign_kpis(cur, campaign_id, total_leads, stage_counts)
     conn.commit()
-    return {
-        "campaign_id": campaign_id,
-        "total_leads": total_leads,
-        "stage_counts": stage_counts,
-        "manager_intervention_count": intervention_count,
-        "last_upload_at": last_upload_at,
-    }
+    return kpis
 
 
 # ═══ Recalc — Manager Intervention ══════════════════════════════════════
@@ -404,28 +668,46 @@ def recalc_campaign_kpis(campaign_id: int, conn) -> dict:
 #     reviewed_by/reviewed_at — the situation has materially shifted, so
 #     the previous decision shouldn't carry forward.
 
-def recalc_manager_intervention(campaign_id: int, conn) -> int:
+def recalc_manager_intervention(campaign_id: int, conn, lead_ids=None) -> int:
     """Recompute the manager_intervention_flags rows for this campaign.
-    Returns the number of OPEN flags after recalc."""
+    Returns the number of OPEN flags after recalc.
+
+    lead_ids narrows the pass to those leads (incremental recalc): only
+    their events are classified and only their stale flags are deleted.
+    Flags on every other lead are left exactly as they were.
+
+    When the campaign's OPEN counts per priority moved, the new global
+    badge counts go out as an `intervention` event on commit."""
     import psycopg2.extras
 
+    from app.crm_events import notify_intervention_counts
+
+    event_filter = flag_filter = ""
+    params: tuple = (campaign_id,)
+    if lead_ids is not None:
+        event_filter = " AND le.lead_id = ANY(%s)"
+        flag_filter = " AND lead_id = ANY(%s)"
+        params = (campaign_id, list(lead_ids))
+
     with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        open_before = _open_flag_counts(cur, campaign_id)
+
         # Pull every event for the campaign in one query, ordered so the
         # Python pass can iterate per-lead with a simple groupby pattern.
         # We need ALL events (not just the latest) so we can scan for a
         # prior MEETING / FOLLOWING.
         cur.execute(
-            """
+            f"""
             SELECT le.id, le.lead_id, le.normalized_stage, le.follow_date,
                    le.comment, le.sales_user_id
             FROM lead_events le
             JOIN leads l ON l.id = le.lead_id
             WHERE l.campaign_id = %s
               AND le.normalized_stage IS NOT NULL
-              AND le.is_voided = FALSE
+              AND le.is_voided = FALSE{event_filter}
             ORDER BY le.lead_id, le.follow_date ASC NULLS LAST, le.id ASC
             """,
-            (campaign_id,),
+            params,
         )
         all_events = cur.fetchall()
 
@@ -438,60 +720,58 @@ def recalc_manager_intervention(campaign_id: int, conn) -> int:
         # Existing flags so we can do preservation logic without a per-lead
         # SELECT inside the loop.
         cur.execute(
-            """
+            f"""
             SELECT lead_id, trigger_type, status
             FROM manager_intervention_flags
-            WHERE campaign_id = %s
+            WHERE campaign_id = %s{flag_filter}
             """,
-            (campaign_id,),
+            params,
         )
         existing_flags = {row["lead_id"]: row for row in cur.fetchall()}
 
-        keep_lead_ids: set = set()
+        preserve_rows, upsert_rows, keep_lead_ids = _plan_intervention_writes(
+            campaign_id, by_lead, existing_flags,
+        )
 
-        for lead_id, events in by_lead.items():
-            verdict = _classify_lead_intervention(events)
-            if verdict is None:
-                continue
-            keep_lead_ids.add(lead_id)
-
-            trigger = verdict["trigger"]
-            existing = existing_flags.get(lead_id)
-
-            if existing and existing["status"] in (STATUS_REVIEWED, STATUS_CLOSED):
-                if existing["trigger_type"] == trigger:
-                    # Same trigger, manager already actioned it — update
-                    # descriptive fields only. Don't reset status.
-                    cur.execute(
-                        """
-                        UPDATE manager_intervention_flags SET
-                            current_stage            = %s,
-                            previous_positive_stage  = %s,
-                            priority                 = %s,
-                            last_positive_stage_date = %s,
-                            last_no_answer_date      = %s,
-                            last_comment             = %s,
-                            sales_user_id            = %s,
-                            updated_at               = NOW()
-                        WHERE lead_id = %s
-                        """,
-                        (
-                            verdict["current_stage"],
-                            verdict["previous_positive_stage"],
-                            verdict["priority"],
-                            verdict["last_positive_stage_date"],
-                            verdict["last_no_answer_date"],
-                            verdict["last_comment"],
-                            verdict["sales_user_id"],
-                            lead_id,
-                        ),
-                    )
-                    continue
-                # Trigger flipped (e.g. AFTER_FOLLOWING → AFTER_MEETING).
-                # Material change → reopen so the manager re-evaluates.
-                # Falls through to the upsert below with status=OPEN.
+        # Two set-based writes instead of one statement per flagged lead.
+        # page_size=len(rows) makes execute_values send each as a single
+        # statement, so the row locks are taken and released in one go.
+        if preserve_rows:
+            # Same trigger, manager already actioned it — descriptive
+            # fields only, status / reviewed_* untouched. The casts pin
+            # the VALUES column types; an all-NULL column would otherwise
+            # come through as text.
+            psycopg2.extras.execute_values(
+                cur,
+                """
+                UPDATE manager_intervention_flags AS f SET
+                    current_stage            = v.current_stage,
+                    previous_positive_stage  = v.previous_positive_stage,
+                    priority                 = v.priority,
+                    last_positive_stage_date = v.last_positive_stage_date,
+                    last_no_answer_date      = v.last_no_answer_date,
+                    last_comment             = v.last_comment,
+                    sales_user_id            = v.sales_user_id,
+                    updated_at               = NOW()
+                FROM (VALUES %s) AS v (
+                    lead_id, current_stage, previous_positive_stage, priority,
+                    last_positive_stage_date, last_no_answer_date,
+                    last_comment, sales_user_id
+                )
+                WHERE f.lead_id = v.lead_id
+                """,
+                preserve_rows,
+                template="(%s::int, %s, %s, %s, %s::timestamp, %s::timestamp, "
+                         "%s::text, %s::int)",
+                page_size=len(preserve_rows),
+            )
 
-            cur.execute(
+        if upsert_rows:
+            # New flags, OPEN flags being refreshed, and REVIEWED/CLOSED
+            # flags whose trigger flipped — all land as OPEN with the
+            # review cleared. EXCLUDED.status is the OPEN from the row.
+            psycopg2.extras.execute_values(
+                cur,
                 """
                 INSERT INTO manager_intervention_flags (
                     lead_id, campaign_id, sales_user_id, trigger_type,
@@ -499,7 +779,7 @@ def recalc_manager_intervention(campaign_id: int, conn) -> int:
                     last_positive_stage_date, last_no_answer_date,
                     last_comment, status, created_at, updated_at
                 )
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW(), NOW())
+                VALUES %s
                 ON CONFLICT (lead_id) DO UPDATE SET
                     campaign_id              = EXCLUDED.campaign_id,
                     sales_user_id            = EXCLUDED.sales_user_id,
@@ -510,50 +790,109 @@ def recalc_manager_intervention(campaign_id: int, conn) -> int:
                     last_positive_stage_date = EXCLUDED.last_positive_stage_date,
                     last_no_answer_date      = EXCLUDED.last_no_answer_date,
                     last_comment             = EXCLUDED.last_comment,
-                    status                   = %s,
+                    status                   = EXCLUDED.status,
                     reviewed_by              = NULL,
                     reviewed_at              = NULL,
                     updated_at               = NOW()
                 """,
-                (
-                    lead_id, campaign_id, verdict["sales_user_id"], trigger,
-                    verdict["current_stage"], verdict["previous_positive_stage"],
-                    verdict["priority"],
-                    verdict["last_positive_stage_date"], verdict["last_no_answer_date"],
-                    verdict["last_comment"],
-                    STATUS_OPEN,
-                    # Second STATUS_OPEN — the DO UPDATE branch needs it
-                    # via the literal, not EXCLUDED.status (which would
-                    # mirror the INSERT value but read less clearly).
-                    STATUS_OPEN,
-                ),
+                upsert_rows,
+                template="(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW(), NOW())",
+                page_size=len(upsert_rows),
             )
 
         # DELETE flags for leads in this campaign that no longer qualify.
-        # We narrow by campaign_id so we never touch other campaigns' rows.
+        # We narrow by campaign_id so we never touch other campaigns' rows
+        # (and by lead_ids on an incremental pass, so untouched leads keep
+        # their flags).
         if keep_lead_ids:
             cur.execute(
-                """
+                f"""
                 DELETE FROM manager_intervention_flags
-                WHERE campaign_id = %s AND lead_id <> ALL(%s)
+                WHERE campaign_id = %s{flag_filter} AND lead_id <> ALL(%s)
                 """,
-                (campaign_id, list(keep_lead_ids)),
+                params + (list(keep_lead_ids),),
             )
         else:
             cur.execute(
-                "DELETE FROM manager_intervention_flags WHERE campaign_id = %s",
-                (campaign_id,),
+                f"DELETE FROM manager_intervention_flags "
+                f"WHERE campaign_id = %s{flag_filter}",
+                params,
             )
 
-        cur.execute(
-            "SELECT COUNT(*) AS n FROM manager_intervention_flags "
-            "WHERE campaign_id = %s AND status = %s",
-            (campaign_id, STATUS_OPEN),
-        )
-        open_count = cur.fetchone()["n"]
+        open_after = _open_flag_counts(cur, campaign_id)
+        if open_after != open_before:
+            notify_intervention_counts(cur)
 
     conn.commit()
-    return open_count
+    return sum(open_after.values())
+
+
+def _open_flag_counts(cur, campaign_id: int) -> dict:
+    """{priority: n} over the campaign's OPEN flags."""
+    cur.execute(
+        """
+        SELECT priority, COUNT(*) AS n FROM manager_intervention_flags
+        WHERE campaign_id = %s AND status = %s
+        GROUP BY priority
+        """,
+        (campaign_id, STATUS_OPEN),
+    )
+    return {row["priority"]: row["n"] for row in cur.fetchall()}
+
+
+def _plan_intervention_writes(campaign_id: int, by_lead: dict,
+                              existing_flags: dict):
+    """Pure: classify every lead and sort the verdicts into the two
+    batched writes recalc_manager_intervention issues.
+
+    Returns (preserve_rows, upsert_rows, keep_lead_ids):
+      preserve_rows — REVIEWED/CLOSED flags whose trigger is unchanged;
+                      only the descriptive fields get refreshed.
+      upsert_rows   — everything else that qualifies; written as OPEN,
+                      which also reopens a REVIEWED/CLOSED flag whose
+                      trigger flipped (e.g. AFTER_FOLLOWING → AFTER_MEETING)
+                      so the manager re-evaluates.
+      keep_lead_ids — every lead that still qualifies (the stale-flag
+                      DELETE spares these).
+    Row tuples are in the column order of the two statements.
+    """
+    preserve_rows = []
+    upsert_rows = []
+    keep_lead_ids: set = set()
+
+    for lead_id, events in by_lead.items():
+        verdict = _classify_lead_intervention(events)
+        if verdict is None:
+            continue
+        keep_lead_ids.add(lead_id)
+
+        trigger = verdict["trigger"]
+        existing = existing_flags.get(lead_id)
+
+        if (existing and existing["status"] in (STATUS_REVIEWED, STATUS_CLOSED)
+                and existing["trigger_type"] == trigger):
+            preserve_rows.append((
+                lead_id,
+                verdict["current_stage"],
+                verdict["previous_positive_stage"],
+                verdict["priority"],
+                verdict["last_positive_stage_date"],
+                verdict["last_no_answer_date"],
+                verdict["last_comment"],
+                verdict["sales_user_id"],
+            ))
+            continue
+
+        upsert_rows.append((
+            lead_id, campaign_id, verdict["sales_user_id"], trigger,
+            verdict["current_stage"], verdict["previous_positive_stage"],
+            verdict["priority"],
+            verdict["last_positive_stage_date"], verdict["last_no_answer_date"],
+            verdict["last_comment"],
+            STATUS_OPEN,
+        ))
+
+    return preserve_rows, upsert_rows, keep_lead_ids
 
 
 def _classify_lead_intervention(events):
@@ -620,8 +959,17 @@ def _classify_lead_intervention(events):
 #
 # The pure function _assignments_from_events takes an ASC-sorted event
 # list and returns the assignment dicts WITHOUT touching the DB — it's the
-# only piece we unit-test. rebuild_lead_assignments wraps it with the
-# DELETE + INSERT bookkeeping.
+# reference implementation of the rules. rebuild_lead_assignments wraps it
+# with the DELETE + INSERT bookkeeping for a single lead.
+#
+# Campaign-wide rebuilds don't go through Python at all:
+# rebuild_assignments_for_campaign runs the same rules as one window-
+# function INSERT … SELECT (_ASSIGNMENTS_SQL). scripts/test_assignments_sql.py
+# checks the two agree on generated timelines.
+#
+# Both rebuilds finish by stamping lead_events.assignment_id
+# (_STAMP_ASSIGNMENTS_SQL), so readers join an event to its window by key
+# rather than by date range.
 
 ASSIGNMENT_TYPE_FRESH    = "FRESH"
 ASSIGNMENT_TYPE_ROTATION = "ROTATION"
@@ -718,6 +1066,11 @@ def rebuild_lead_assignments(lead_id: int, conn) -> int:
         events = cur.fetchall()
         if not events:
             cur.execute("DELETE FROM lead_assignments WHERE lead_id = %s", (lead_id,))
+            cur.execute(
+                "UPDATE lead_events SET assignment_id = NULL "
+                "WHERE lead_id = %s AND assignment_id IS NOT NULL",
+                (lead_id,),
+            )
             return 0
 
         campaign_id = events[0]["campaign_id"]
@@ -726,44 +1079,163 @@ def rebuild_lead_assignments(lead_id: int, conn) -> int:
         # Wipe-and-write keeps the logic obvious; the alternative (diff &
         # patch) is fiddly and the event-counts we're walking are small.
         cur.execute("DELETE FROM lead_assignments WHERE lead_id = %s", (lead_id,))
-        if not assignments:
-            return 0
-
-        rows = [
-            (
-                lead_id, campaign_id,
-                a["sales_user_id"], a["raw_sales_rep_name"], a["assignment_type"],
-                a["started_at"], a["ended_at"],
+        if assignments:
+            rows = [
+                (
+                    lead_id, campaign_id,
+                    a["sales_user_id"], a["raw_sales_rep_name"], a["assignment_type"],
+                    a["started_at"], a["ended_at"],
+                )
+                for a in assignments
+            ]
+            psycopg2.extras.execute_values(
+                cur,
+                """
+                INSERT INTO lead_assignments
+                    (lead_id, campaign_id, sales_user_id, raw_sales_rep_name,
+                     assignment_type, started_at, ended_at)
+                VALUES %s
+                """,
+                rows,
             )
-            for a in assignments
-        ]
-        psycopg2.extras.execute_values(
-            cur,
-            """
-            INSERT INTO lead_assignments
-                (lead_id, campaign_id, sales_user_id, raw_sales_rep_name,
-                 assignment_type, started_at, ended_at)
-            VALUES %s
-            """,
-            rows,
+        cur.execute(
+            _STAMP_ASSIGNMENTS_SQL.format(lead_filter=" AND l.id = %(lead_id)s"),
+            {"campaign_id": campaign_id, "lead_id": lead_id},
         )
     return len(assignments)
 
 
+# Set-based twin of _assignments_from_events. Step by step:
+#   ev      — the lead's usable events with the same rep key _rep_key
+#             builds: 'u<id>' for matched reps, 'r<normalized name>'
+#             otherwise, NULL when there's no rep at all (those rows are
+#             dropped, so they never open or close a window).
+#   keyed   — LAG over the remaining events gives the previous rep key.
+#   windows — an event whose key differs from the previous one starts a
+#             window: FRESH when there is no previous key, else ROTATION.
+#             Each window ends where the lead's next window starts.
+# The name normalization mirrors normalize_sales_name (collapse runs of
+# whitespace, trim, lowercase).
+_ASSIGNMENTS_SQL = """
+    WITH ev AS (
+        SELECT le.id, le.lead_id, l.campaign_id, le.follow_date,
+               le.sales_user_id, le.raw_sales_rep_name,
+               CASE
+                   WHEN le.sales_user_id IS NOT NULL
+                       THEN 'u' || le.sales_user_id
+                   ELSE NULLIF('r' || LOWER(BTRIM(REGEXP_REPLACE(
+                            COALESCE(le.raw_sales_rep_name, ''), '\\s+', ' ', 'g'))), 'r')
+               END AS rep_key
+        FROM lead_events le
+        JOIN leads l ON l.id = le.lead_id
+        WHERE l.campaign_id = %(campaign_id)s{lead_filter}
+          AND le.is_voided = FALSE
+          AND le.follow_date IS NOT NULL
+    ),
+    keyed AS (
+        SELECT ev.*,
+               LAG(rep_key) OVER (PARTITION BY lead_id
+                                  ORDER BY follow_date, id) AS prev_key
+        FROM ev
+        WHERE rep_key IS NOT NULL
+    ),
+    windows AS (
+        SELECT lead_id, campaign_id, sales_user_id, raw_sales_rep_name,
+               CASE WHEN prev_key IS NULL THEN %(fresh)s ELSE %(rotation)s END
+                   AS assignment_type,
+               follow_date AS started_at,
+               LEAD(follow_date) OVER (PARTITION BY lead_id
+                                       ORDER BY follow_date, id) AS ended_at
+        FROM keyed
+        WHERE prev_key IS DISTINCT FROM rep_key
+    )
+    INSERT INTO lead_assignments
+        (lead_id, campaign_id, sales_user_id, raw_sales_rep_name,
+         assignment_type, started_at, ended_at)
+    SELECT lead_id, campaign_id, sales_user_id, raw_sales_rep_name,
+           assignment_type, started_at, ended_at
+    FROM windows
+"""
+
+
+# Points each event of the rebuilt leads at the window it falls in — the
+# same [started_at, ended_at) rule the readers used to apply as a range
+# join, computed in one ordered pass per lead:
+#   marks   — the lead's non-empty windows (a rep flip and flip back at
+#             the same timestamp leaves a zero-length window that no
+#             event can land in) interleaved with its events, a window
+#             sorting ahead of events at its own started_at.
+#   runs    — a running count of windows seen so far; every event shares
+#             its run number with the window that opened before it.
+#   stamped — that window's id (NULL for events before the first window
+#             and for events without a follow_date).
+# Only rows whose value changes are written.
+_STAMP_ASSIGNMENTS_SQL = """
+    WITH marks AS (
+        SELECT a.lead_id, a.started_at AS at, 0 AS kind,
+               a.id AS assignment_id, NULL::integer AS event_id
+        FROM lead_assignments a
+        JOIN leads l ON l.id = a.lead_id
+        WHERE l.campaign_id = %(campaign_id)s{lead_filter}
+          AND (a.ended_at IS NULL OR a.ended_at > a.started_at)
+        UNION ALL
+        SELECT le.lead_id, le.follow_date, 1, NULL, le.id
+        FROM lead_events le
+        JOIN leads l ON l.id = le.lead_id
+        WHERE l.campaign_id = %(campaign_id)s{lead_filter}
+    ),
+    runs AS (
+        SELECT marks.*,
+               COUNT(assignment_id) OVER (PARTITION BY lead_id
+                                          ORDER BY at, kind) AS run
+        FROM marks
+    ),
+    stamped AS (
+        SELECT event_id, at,
+               MAX(assignment_id) OVER (PARTITION BY lead_id, run) AS assignment_id
+        FROM runs
+    )
+    UPDATE lead_events le
+    SET assignment_id = CASE WHEN s.at IS NULL THEN NULL ELSE s.assignment_id END
+    FROM stamped s
+    WHERE le.id = s.event_id
+      AND le.assignment_id IS DISTINCT FROM
+          (CASE WHEN s.at IS NULL THEN NULL ELSE s.assignment_id END)
+"""
+
+
 def rebuild_assignments_for_campaign(campaign_id: int, conn,
                                      affected_lead_ids=None) -> int:
     """Rebuild assignments for every lead in the campaign (or only the
-    provided subset). Returns total assignments written."""
-    with conn.cursor() as cur:
-        if affected_lead_ids is None:
-            cur.execute("SELECT id FROM leads WHERE campaign_id = %s", (campaign_id,))
-            lead_ids = [r[0] for r in cur.fetchall()]
-        else:
-            lead_ids = list(affected_lead_ids)
+    provided subset). Returns total assignments written.
 
-    total = 0
-    for lid in lead_ids:
-        total += rebuild_lead_assignments(lid, conn)
+    One DELETE + one INSERT … SELECT in a single transaction, however
+    many leads the campaign has — see _ASSIGNMENTS_SQL for the rules —
+    followed by the lead_events.assignment_id stamp."""
+    params = {
+        "campaign_id": campaign_id,
+        "fresh": ASSIGNMENT_TYPE_FRESH,
+        "rotation": ASSIGNMENT_TYPE_ROTATION,
+    }
+    lead_filter = ""
+    if affected_lead_ids is not None:
+        params["lead_ids"] = list(affected_lead_ids)
+        lead_filter = " AND l.id = ANY(%(lead_ids)s)"
+
+    with conn.cursor() as cur:
+        cur.execute(
+            f"""
+            DELETE FROM lead_assignments
+            WHERE lead_id IN (
+                SELECT l.id FROM leads l
+                WHERE l.campaign_id = %(campaign_id)s{lead_filter}
+            )
+            """,
+            params,
+        )
+        cur.execute(_ASSIGNMENTS_SQL.format(lead_filter=lead_filter), params)
+        total = cur.rowcount
+        cur.execute(_STAMP_ASSIGNMENTS_SQL.format(lead_filter=lead_filter), params)
     conn.commit()
     return total
 
@@ -780,19 +1252,33 @@ def rebuild_assignments_for_campaign(campaign_id: int, conn,
 # "Latest event in window" is per-assignment, not per-lead. If a rep had
 # the same lead twice (FRESH, then again as ROTATION later), both windows
 # contribute their own latest-stage to the rep's totals. The window is
-# half-open [started_at, ended_at) — ended_at=NULL means open-ended.
+# half-open [started_at, ended_at) — ended_at=NULL means open-ended. The
+# assignment rebuild stamps each event's assignment_id by that rule, so
+# the rollup joins events to windows by key.
 
-def recalc_sales_kpis(campaign_id: int, conn) -> int:
+def recalc_sales_kpis(campaign_id: int, conn, sales_user_ids=None) -> int:
     """Upsert one sales_kpis row per matched rep in the campaign; delete
-    rows for reps who no longer have any assignments. Returns rep count."""
+    rows for reps who no longer have any assignments. Returns rep count.
+
+    sales_user_ids narrows the pass to those reps (incremental recalc).
+    Each rep's row is still rebuilt from all of their assignments in the
+    campaign, so a scoped pass writes exactly what a full pass would."""
     import psycopg2.extras
 
+    window_filter = rep_filter = ""
+    params: tuple = (campaign_id,)
+    if sales_user_ids is not None:
+        sales_user_ids = list(sales_user_ids)
+        window_filter = " AND a.sales_user_id = ANY(%s)"
+        rep_filter = " AND sales_user_id = ANY(%s)"
+        params = (campaign_id, sales_user_ids)
+
     with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-        # The window-join + DISTINCT ON(assignment) gives us "latest valid
-        # event per assignment" in a single pass — much cheaper than a
+        # The assignment_id join + DISTINCT ON(assignment) gives us "latest
+        # valid event per assignment" in a single pass — much cheaper than a
         # Python loop with per-assignment queries.
         cur.execute(
-            """
+            f"""
             WITH window_latest AS (
                 SELECT DISTINCT ON (a.id)
                        a.id            AS assignment_id,
@@ -801,20 +1287,18 @@ def recalc_sales_kpis(campaign_id: int, conn) -> int:
                        a.assignment_type,
                        le.normalized_stage
                 FROM lead_assignments a
-                JOIN lead_events le ON le.lead_id = a.lead_id
+                JOIN lead_events le ON le.assignment_id = a.id
                 WHERE a.campaign_id = %s
-                  AND a.sales_user_id IS NOT NULL
+                  AND a.sales_user_id IS NOT NULL{window_filter}
                   AND le.is_voided = FALSE
                   AND le.normalized_stage IS NOT NULL
-                  AND le.follow_date >= a.started_at
-                  AND (a.ended_at IS NULL OR le.follow_date < a.ended_at)
                 ORDER BY a.id, le.follow_date DESC NULLS LAST, le.id DESC
             )
             SELECT sales_user_id, assignment_type, normalized_stage, COUNT(*) AS n
             FROM window_latest
             GROUP BY sales_user_id, assignment_type, normalized_stage
             """,
-            (campaign_id,),
+            params,
         )
         outcome_rows = cur.fetchall()
 
@@ -822,13 +1306,13 @@ def recalc_sales_kpis(campaign_id: int, conn) -> int:
         # own a lead without that lead having a valid event in the window
         # yet, and we still want to count them.
         cur.execute(
-            """
+            f"""
             SELECT sales_user_id, assignment_type, COUNT(DISTINCT lead_id) AS n
             FROM lead_assignments
-            WHERE campaign_id = %s AND sales_user_id IS NOT NULL
+            WHERE campaign_id = %s AND sales_user_id IS NOT NULL{rep_filter}
             GROUP BY sales_user_id, assignment_type
             """,
-            (campaign_id,),
+            params,
         )
         count_rows = cur.fetchall()
 
@@ -889,20 +1373,256 @@ def recalc_sales_kpis(campaign_id: int, conn) -> int:
                 template="(%s, %s, %s, %s, %s::jsonb, %s::jsonb)",
             )
             cur.execute(
-                """
+                f"""
                 DELETE FROM sales_kpis
-                WHERE campaign_id = %s
+                WHERE campaign_id = %s{rep_filter}
                   AND sales_user_id <> ALL(%s)
                 """,
-                (campaign_id, list(per_user.keys())),
+                params + (list(per_user.keys()),),
             )
         else:
             cur.execute(
-                "DELETE FROM sales_kpis WHERE campaign_id = %s",
+                f"DELETE FROM sales_kpis WHERE campaign_id = %s{rep_filter}",
+                params,
+            )
+        if sales_user_ids is not None:
+            # A scoped pass only saw some reps — report the campaign-wide
+            # count so callers get the same number either way.
+            cur.execute(
+                "SELECT COUNT(*) FROM sales_kpis WHERE campaign_id = %s",
                 (campaign_id,),
             )
+            rep_count = cur.fetchone()[0]
+        else:
+            rep_count = len(per_user)
+    conn.commit()
+    return rep_count
+
+
+# ═══ Recalc — Lead state (leads listing) ════════════════════════════════
+#
+# lead_state is the campaign leads listing, precomputed: one row per lead
+# holding what the listing shows and filters on. "Latest event" here is
+# the latest non-voided event by (follow_date DESC NULLS LAST, id DESC)
+# whether or not its stage matched — the listing has always shown
+# unmatched stages as a blank stage rather than skipping the event. That
+# differs on purpose from campaign_kpis, which only buckets matched
+# stages.
+#
+# Two writers, like the daily rollup below:
+#   - bump_lead_state — the ingest paths, in the transaction that inserts
+#     the events, so an upload's leads are listed even if its recalc
+#     fails.
+#   - refresh_lead_state — the recalc pipeline and the flag PATCH
+#     endpoint; recomputes the rows outright, which also covers the
+#     intervention columns and events rewritten by a mapping change.
+
+def refresh_lead_state(campaign_id: int, conn, lead_ids=None) -> int:
+    """Upsert lead_state for every lead in the campaign (or the given
+    subset). Rows whose values didn't change are left alone so a full
+    refresh doesn't rewrite the whole table. Returns rows written."""
+    params = {"campaign_id": campaign_id}
+    lead_filter = ""
+    if lead_ids is not None:
+        params["lead_ids"] = list(lead_ids)
+        lead_filter = " AND l.id = ANY(%(lead_ids)s)"
+
+    with conn.cursor() as cur:
+        cur.execute(
+            f"""
+            WITH scope AS (
+                SELECT l.id, l.campaign_id FROM leads l
+                WHERE l.campaign_id = %(campaign_id)s{lead_filter}
+            ),
+            ev AS (
+                SELECT le.id, le.lead_id, le.normalized_stage,
+                       le.sales_user_id, le.follow_date
+                FROM lead_events le
+                JOIN scope ON scope.id = le.lead_id
+                WHERE le.is_voided = FALSE
+            ),
+            latest AS (
+                SELECT DISTINCT ON (lead_id)
+                       lead_id, normalized_stage, sales_user_id, follow_date
+                FROM ev
+                ORDER BY lead_id, follow_date DESC NULLS LAST, id DESC
+            ),
+            counts AS (
+                SELECT lead_id, COUNT(*) AS n FROM ev GROUP BY lead_id
+            )
+            INSERT INTO lead_state (
+                lead_id, campaign_id, latest_stage, latest_sales_user_id,
+                last_event_at, event_count, has_open_intervention,
+                intervention_priority, updated_at
+            )
+            SELECT scope.id, scope.campaign_id,
+                   latest.normalized_stage, latest.sales_user_id,
+                   latest.follow_date, COALESCE(counts.n, 0),
+                   COALESCE(mi.status = %(open)s, FALSE),
+                   CASE WHEN mi.status = %(open)s THEN mi.priority END,
+                   NOW()
+            FROM scope
+            LEFT JOIN latest ON latest.lead_id = scope.id
+            LEFT JOIN counts ON counts.lead_id = scope.id
+            LEFT JOIN manager_intervention_flags mi ON mi.lead_id = scope.id
+            ON CONFLICT (lead_id) DO UPDATE SET
+                campaign_id           = EXCLUDED.campaign_id,
+                latest_stage          = EXCLUDED.latest_stage,
+                latest_sales_user_id  = EXCLUDED.latest_sales_user_id,
+                last_event_at         = EXCLUDED.last_event_at,
+                event_count           = EXCLUDED.event_count,
+                has_open_intervention = EXCLUDED.has_open_intervention,
+                intervention_priority = EXCLUDED.intervention_priority,
+                updated_at            = NOW()
+            WHERE (lead_state.campaign_id, lead_state.latest_stage,
+                   lead_state.latest_sales_user_id, lead_state.last_event_at,
+                   lead_state.event_count, lead_state.has_open_intervention,
+                   lead_state.intervention_priority)
+                  IS DISTINCT FROM
+                  (EXCLUDED.campaign_id, EXCLUDED.latest_stage,
+                   EXCLUDED.latest_sales_user_id, EXCLUDED.last_event_at,
+                   EXCLUDED.event_count, EXCLUDED.has_open_intervention,
+                   EXCLUDED.intervention_priority)
+            """,
+            {**params, "open": STATUS_OPEN},
+        )
+        written = cur.rowcount
+    conn.commit()
+    return written
+
+
+def bump_lead_state(cur, campaign_id: int, events) -> None:
+    """Fold freshly inserted events into lead_state, creating missing rows.
+
+    Called by the ingest paths in the same transaction that inserts the
+    events, so a lead is in the listing as soon as its events are —
+    whether or not the upload's recalc gets to run. `events` yields
+    (event_id, lead_id, follow_date, normalized_stage, sales_user_id).
+
+    event_count grows by the new events. The latest-event columns move to
+    the batch's latest event when it sorts after the stored one: new
+    events have the highest ids, so they win ties, and an undated event
+    never displaces a dated one. The intervention columns are left to the
+    recalc (refresh_lead_state), which also redoes the row after a
+    mapping change rewrites existing events."""
+    import psycopg2.extras
+
+    per_lead: dict = {}
+    for event_id, lead_id, follow_date, stage, sales_user_id in events:
+        key = (True, follow_date, event_id) if follow_date is not None else (False, event_id)
+        count, latest = per_lead.get(lead_id, (0, None))
+        if latest is None or key > latest[0]:
+            latest = (key, stage, sales_user_id, follow_date)
+        per_lead[lead_id] = (count + 1, latest)
+    if not per_lead:
+        return
+    psycopg2.extras.execute_values(
+        cur,
+        f"""
+        INSERT INTO lead_state AS s (
+            lead_id, campaign_id, latest_stage, latest_sales_user_id,
+            last_event_at, event_count, has_open_intervention,
+            intervention_priority, updated_at
+        )
+        SELECT v.lead_id, v.campaign_id, v.latest_stage, v.latest_sales_user_id,
+               v.last_event_at, v.event_count,
+               COALESCE(mi.status = '{STATUS_OPEN}', FALSE),
+               CASE WHEN mi.status = '{STATUS_OPEN}' THEN mi.priority END,
+               NOW()
+        FROM (VALUES %s) AS v (lead_id, campaign_id, latest_stage,
+                               latest_sales_user_id, last_event_at, event_count)
+        LEFT JOIN manager_intervention_flags mi ON mi.lead_id = v.lead_id
+        ORDER BY v.lead_id
+        ON CONFLICT (lead_id) DO UPDATE SET
+            event_count          = s.event_count + EXCLUDED.event_count,
+            latest_stage         = CASE WHEN s.last_event_at IS NULL
+                                          OR EXCLUDED.last_event_at >= s.last_event_at
+                                        THEN EXCLUDED.latest_stage
+                                        ELSE s.latest_stage END,
+            latest_sales_user_id = CASE WHEN s.last_event_at IS NULL
+                                          OR EXCLUDED.last_event_at >= s.last_event_at
+                                        THEN EXCLUDED.latest_sales_user_id
+                                        ELSE s.latest_sales_user_id END,
+            last_event_at        = CASE WHEN s.last_event_at IS NULL
+                                          OR EXCLUDED.last_event_at >= s.last_event_at
+                                        THEN EXCLUDED.last_event_at
+                                        ELSE s.last_event_at END,
+            updated_at           = NOW()
+        """,
+        [
+            (lead_id, campaign_id, stage, sales_user_id, follow_date, count)
+            for lead_id, (count, (_, stage, sales_user_id, follow_date))
+            in sorted(per_lead.items())
+        ],
+        template="(%s::int, %s::int, %s, %s::int, %s::timestamp, %s::int)",
+        page_size=len(per_lead),
+    )
+
+
+# ═══ Daily activity rollup ══════════════════════════════════════════════
+#
+# lead_events_daily holds COUNT(*) of events per (campaign, day, stage) —
+# exactly the numbers the daily-activity endpoint used to aggregate out of
+# lead_events per request. Same inclusion rule as that query: event rows
+# (not unique leads), matched stage only, not voided, dated.
+#
+# Two writers keep it current:
+#   - bump_daily_activity — called by the ingest paths in the same
+#     transaction that inserts the events, so the rollup moves with them.
+#   - rebuild_daily_activity — recount from lead_events. The full recalc
+#     runs it, which covers stage/rep mapping changes (they rewrite
+#     normalized_stage on existing events) and anything else that edits
+#     events in place. scripts/rebuild_daily_activity.py runs it by hand.
+
+def bump_daily_activity(cur, campaign_id: int, events) -> None:
+    """Add freshly inserted events to the rollup. `events` yields
+    (follow_date, normalized_stage) pairs; rows that don't qualify are
+    skipped here, so callers can pass everything they inserted."""
+    import psycopg2.extras
+
+    buckets: dict = {}
+    for follow_date, stage in events:
+        if follow_date is None or stage is None:
+            continue
+        key = (follow_date.date(), stage)
+        buckets[key] = buckets.get(key, 0) + 1
+    if not buckets:
+        return
+    psycopg2.extras.execute_values(
+        cur,
+        """
+        INSERT INTO lead_events_daily (campaign_id, day, normalized_stage, event_count)
+        VALUES %s
+        ON CONFLICT (campaign_id, day, normalized_stage) DO UPDATE SET
+            event_count = lead_events_daily.event_count + EXCLUDED.event_count
+        """,
+        [(campaign_id, day, stage, n) for (day, stage), n in sorted(buckets.items())],
+        page_size=len(buckets),
+    )
+
+
+def rebuild_daily_activity(campaign_id: int, conn) -> int:
+    """Recount the campaign's rollup rows from lead_events. Returns the
+    number of (day, stage) rows written."""
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM lead_events_daily WHERE campaign_id = %s",
+                    (campaign_id,))
+        cur.execute(
+            """
+            INSERT INTO lead_events_daily (campaign_id, day, normalized_stage, event_count)
+            SELECT campaign_id, DATE(follow_date), normalized_stage, COUNT(*)
+            FROM lead_events
+            WHERE campaign_id = %s
+              AND normalized_stage IS NOT NULL
+              AND is_voided = FALSE
+              AND follow_date IS NOT NULL
+            GROUP BY campaign_id, DATE(follow_date), normalized_stage
+            """,
+            (campaign_id,),
+        )
+        written = cur.rowcount
     conn.commit()
-    return len(per_user)
+    return written
 
 
 # ═══ Lead Timeline enrichment (P3) ══════════════════════════════════════
@@ -1012,7 +1732,7 @@ def build_lead_timeline(lead_id: int, conn) -> dict:
     """Assemble the per-lead timeline payload the page renders.
 
     Pulls: lead row, campaign name, ordered events with assignment_type
-    joined from lead_assignments (via the window join), and any active
+    joined from lead_assignments (via the stamped assignment_id), and any active
     intervention flag. Computes risk + is_transfer in Python via
     enrich_timeline_events.
 
@@ -1034,21 +1754,18 @@ def build_lead_timeline(lead_id: int, conn) -> dict:
         if not lead:
             return None
 
-        # Events + assignment_type via the half-open window join. NULL
+        # Events + assignment_type via the window the rebuild stamped. NULL
         # assignment_type means the event landed outside any window —
         # in practice this is the no-rep ghost rows the parser kept.
         cur.execute(
-            """
+            f"""
             SELECT e.id AS event_id, e.follow_date, e.raw_stage, e.normalized_stage,
                    e.comment, e.sales_user_id, e.raw_sales_rep_name,
-                   u.full_name AS sales_rep_name, u.avatar_url,
+                   u.full_name AS sales_rep_name, {avatar_src_sql("u")} AS avatar_url,
                    a.assignment_type
             FROM lead_events e
             LEFT JOIN users u ON u.id = e.sales_user_id
-            LEFT JOIN lead_assignments a
-                   ON a.lead_id = e.lead_id
-                  AND e.follow_date >= a.started_at
-                  AND (a.ended_at IS NULL OR e.follow_date < a.ended_at)
+            LEFT JOIN lead_assignments a ON a.id = e.assignment_id
             WHERE e.lead_id = %s AND e.is_voided = FALSE
             ORDER BY e.follow_date ASC NULLS LAST, e.id ASC
             """,
@@ -1145,7 +1862,48 @@ def build_lead_timeline(lead_id: int, conn) -> dict:
 
 # ═══ Aggregator ═════════════════════════════════════════════════════════
 
-def recalc_after_upload(campaign_id: int, conn) -> dict:
+# First key of the two-int pg_advisory_lock pair; the campaign id is the
+# second. Any constant works as long as nothing else uses it.
+_RECALC_LOCK_NAMESPACE = 0x43524d   # "CRM"
+
+
+@contextmanager
+def _campaign_recalc_lock(campaign_id: int, conn):
+    """Hold the campaign's recalc lock for the duration of the block.
+
+    Session-level, not xact-level: the pipeline commits after every step
+    and the lock has to outlive those commits. Blocks until a recalc
+    already running elsewhere finishes; the one that waited then reads
+    the events as they are, so it still covers everything committed
+    before it was asked for."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_lock(%s, %s)",
+                    (_RECALC_LOCK_NAMESPACE, campaign_id))
+    try:
+        yield
+    except BaseException:
+        _release_recalc_lock(campaign_id, conn, rollback=True)
+        raise
+    _release_recalc_lock(campaign_id, conn, rollback=False)
+
+
+def _release_recalc_lock(campaign_id: int, conn, rollback: bool) -> None:
+    try:
+        if rollback:
+            conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_unlock(%s, %s)",
+                        (_RECALC_LOCK_NAMESPACE, campaign_id))
+        conn.commit()
+    except Exception as exc:
+        # A dead connection took its session (and the lock) with it.
+        log.warning("Campaign %s: could not release recalc lock: %s",
+                    campaign_id, exc)
+
+
+def recalc_after_upload(campaign_id: int, conn, lead_ids=None,
+                        upload_id: Optional[int] = None,
+                        max_fraction: float = 1.0) -> dict:
     """Called by the background upload thread after lead_events are written.
 
     Pipeline order (P2):
@@ -1158,12 +1916,49 @@ def recalc_after_upload(campaign_id: int, conn) -> dict:
       4. recalc_manager_intervention — the strict-rule flag set; returns
          the new OPEN count which we mirror into campaign_kpis to fix the
          staleness from step (2).
+      5. refresh_lead_state — the leads-listing rows; needs the flags
+         from (4).
+      6. rebuild_daily_activity — full pass only. Uploads keep the daily
+         rollup current while inserting (bump_daily_activity); a full
+         recalc is also what runs after events are edited in place, so it
+         recounts.
+
+    Passing lead_ids + upload_id asks for the incremental variant of the
+    same pipeline (see _recalc_incremental): every step is narrowed to
+    the leads the upload touched. It falls back to the full pipeline
+    whenever the stored aggregates can't be trusted as a baseline, or
+    when the upload touched more than max_fraction of the campaign's
+    leads (at that point the full pass is the cheaper one anyway). The
+    returned dict carries "mode" so the caller can log which ran.
+
+    Runs under a per-campaign advisory lock: the upload worker and the
+    job worker can both ask for the same campaign, and two pipelines
+    interleaving their per-step commits would leave a mix of both.
     """
-    rebuild_assignments_for_campaign(campaign_id, conn)
-    kpis = recalc_campaign_kpis(campaign_id, conn)
-    rep_count = recalc_sales_kpis(campaign_id, conn)
-    open_count = recalc_manager_intervention(campaign_id, conn)
-
+    with _campaign_recalc_lock(campaign_id, conn):
+        if lead_ids is not None and upload_id is not None:
+            reason = _incremental_recalc_blocker(
+                campaign_id, conn, lead_ids, upload_id, max_fraction,
+            )
+            if reason is None:
+                result = _recalc_incremental(campaign_id, conn, lead_ids, upload_id)
+                if result is not None:
+                    return result
+                reason = "no usable campaign_kpis baseline"
+            log.info("Campaign %s: full recalc instead of incremental (%s)",
+                     campaign_id, reason)
+
+        rebuild_assignments_for_campaign(campaign_id, conn)
+        kpis = recalc_campaign_kpis(campaign_id, conn)
+        rep_count = recalc_sales_kpis(campaign_id, conn)
+        open_count = recalc_manager_intervention(campaign_id, conn)
+        refresh_lead_state(campaign_id, conn)
+        rebuild_daily_activity(campaign_id, conn)
+        return _finish_recalc(campaign_id, conn, kpis, rep_count, open_count, "full")
+
+
+def _finish_recalc(campaign_id: int, conn, kpis: dict, rep_count: int,
+                   open_count: int, mode: str) -> dict:
     # Sync intervention count into campaign_kpis. One-row UPDATE so we
     # never touch total_leads / stage_counts here.
     with conn.cursor() as cur:
@@ -1180,12 +1975,209 @@ def recalc_after_upload(campaign_id: int, conn) -> dict:
 
     kpis["manager_intervention_count"] = open_count
     return {
+        "mode": mode,
         "intervention_open": open_count,
         "sales_reps_with_kpis": rep_count,
         "kpis": kpis,
     }
 
 
+def _incremental_recalc_blocker(campaign_id: int, conn, lead_ids,
+                                upload_id: int, max_fraction: float) -> Optional[str]:
+    """Why the incremental recalc can't run for this upload, or None.
+
+    The campaign_kpis delta assumes the stored row reflects every event
+    except this upload's. That breaks if another upload for the campaign
+    is still landing events, or wrote events after the row was last
+    recalculated without recalculating itself (a FAILED upload whose
+    early batches had already committed). Either way we go full. A
+    COMPLETED upload that landed no events (a duplicate) skipped its
+    recalc with nothing to catch up on, so it doesn't count."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT 1
+            FROM crm_report_uploads o
+            LEFT JOIN campaign_kpis k ON k.campaign_id = o.campaign_id
+            WHERE o.campaign_id = %s
+              AND o.id <> %s
+              AND (o.status IN ('PENDING', 'PROCESSING')
+                   OR k.recalculated_at IS NULL
+                   OR (o.created_at >= k.recalculated_at
+                       AND NOT (o.status = 'COMPLETED' AND o.new_events = 0)))
+            LIMIT 1
+            """,
+            (campaign_id, upload_id),
+        )
+        if cur.fetchone() is not None:
+            return "another upload overlaps the stored aggregates"
+
+        if max_fraction < 1.0:
+            cur.execute("SELECT COUNT(*) FROM leads WHERE campaign_id = %s",
+                        (campaign_id,))
+            campaign_leads = cur.fetchone()[0] or 0
+            if len(lead_ids) > campaign_leads * max_fraction:
+                return (f"{len(lead_ids)} of {campaign_leads} leads touched")
+    return None
+
+
+def _reps_on_leads(conn, lead_ids) -> set:
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT DISTINCT sales_user_id FROM lead_assignments "
+            "WHERE lead_id = ANY(%s) AND sales_user_id IS NOT NULL",
+            (list(lead_ids),),
+        )
+        return {r[0] for r in cur.fetchall()}
+
+
+def _recalc_incremental(campaign_id: int, conn, lead_ids,
+                        upload_id: int) -> Optional[dict]:
+    """The recalc_after_upload pipeline restricted to `lead_ids`.
+
+    Assignments and intervention flags are per-lead, so rebuilding just
+    the touched leads is exact. sales_kpis rows are per-rep: we rebuild
+    every rep who owned a touched lead before OR after the rebuild (a
+    rep who lost their only window on a lead must drop that count).
+    campaign_kpis is shifted by a delta — see recalc_campaign_kpis_delta.
+    Returns None (nothing written) if the delta baseline is unusable."""
+    lead_ids = list(lead_ids)
+    kpis = recalc_campaign_kpis_delta(campaign_id, conn, lead_ids, upload_id)
+    if kpis is None:
+        return None
+
+    reps = _reps_on_leads(conn, lead_ids)
+    rebuild_assignments_for_campaign(campaign_id, conn, affected_lead_ids=lead_ids)
+    reps |= _reps_on_leads(conn, lead_ids)
+
+    rep_count = recalc_sales_kpis(campaign_id, conn, sales_user_ids=reps)
+    open_count = recalc_manager_intervention(campaign_id, conn, lead_ids=lead_ids)
+    refresh_lead_state(campaign_id, conn, lead_ids=lead_ids)
+    return _finish_recalc(campaign_id, conn, kpis, rep_count, open_count,
+                          "incremental")
+
+
+# ─── Consistency check ──────────────────────────────────────────────────
+#
+# The incremental recalc is only worth having if it lands the same rows
+# the full one would. check_recalc_consistency snapshots every derived
+# table for the campaign (lead_state and the daily rollup included), runs
+# the full recalc (the reference), snapshots again and diffs. Ids and
+# timestamps are left out of the snapshot: the full pass rewrites
+# assignments with fresh ids and bumps updated_at.
+# Because it *runs* the full recalc, it also repairs whatever it finds.
+
+def _recalc_snapshot(campaign_id: int, conn) -> dict:
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT total_leads, stage_counts, manager_intervention_count "
+            "FROM campaign_kpis WHERE campaign_id = %s",
+            (campaign_id,),
+        )
+        # No row yet reads the same as an all-zero row — that's what the
+        # overview shows, and what the full recalc writes for it.
+        row = cur.fetchone() or (0, {}, 0)
+        campaign = (row[0], _json_dumps_safe(row[1] or {}), row[2])
+
+        cur.execute(
+            """
+            SELECT sales_user_id, fresh_leads_count, rotation_leads_count,
+                   fresh_outcomes::text, rotation_outcomes::text
+            FROM sales_kpis WHERE campaign_id = %s
+            """,
+            (campaign_id,),
+        )
+        sales = {r[0]: r[1:] for r in cur.fetchall()}
+
+        cur.execute(
+            """
+            SELECT lead_id, sales_user_id, trigger_type, current_stage,
+                   previous_positive_stage, priority,
+                   last_positive_stage_date, last_no_answer_date,
+                   last_comment, status
+            FROM manager_intervention_flags WHERE campaign_id = %s
+            """,
+            (campaign_id,),
+        )
+        flags = {r[0]: r[1:] for r in cur.fetchall()}
+
+        cur.execute(
+            """
+            SELECT lead_id, sales_user_id, raw_sales_rep_name,
+                   assignment_type, started_at, ended_at
+            FROM lead_assignments WHERE campaign_id = %s
+            ORDER BY lead_id, started_at, ended_at NULLS LAST,
+                     sales_user_id NULLS LAST, raw_sales_rep_name, assignment_type
+            """,
+            (campaign_id,),
+        )
+        assignments: dict = {}
+        for r in cur.fetchall():
+            assignments.setdefault(r[0], []).append(r[1:])
+
+        # Which window each event is stamped with, named by the window's
+        # contents since ids change on every rebuild.
+        cur.execute(
+            """
+            SELECT le.id, a.sales_user_id, a.raw_sales_rep_name,
+                   a.assignment_type, a.started_at, a.ended_at
+            FROM lead_events le
+            LEFT JOIN lead_assignments a ON a.id = le.assignment_id
+            WHERE le.campaign_id = %s
+            """,
+            (campaign_id,),
+        )
+        event_windows = {r[0]: r[1:] for r in cur.fetchall()}
+
+        cur.execute(
+            """
+            SELECT lead_id, latest_stage, latest_sales_user_id, last_event_at,
+                   event_count, has_open_intervention, intervention_priority
+            FROM lead_state WHERE campaign_id = %s
+            """,
+            (campaign_id,),
+        )
+        lead_state = {r[0]: r[1:] for r in cur.fetchall()}
+
+        cur.execute(
+            """
+            SELECT day, normalized_stage, event_count
+            FROM lead_events_daily WHERE campaign_id = %s
+            """,
+            (campaign_id,),
+        )
+        daily = {(r[0], r[1]): r[2] for r in cur.fetchall()}
+    conn.commit()
+    return {
+        "campaign_kpis": {"campaign": campaign},
+        "sales_kpis": sales,
+        "manager_intervention_flags": flags,
+        "lead_assignments": assignments,
+        "lead_events.assignment_id": event_windows,
+        "lead_state": lead_state,
+        "lead_events_daily": daily,
+    }
+
+
+def check_recalc_consistency(campaign_id: int, conn) -> list:
+    """Diff the stored aggregates against a fresh full recalc. Returns a
+    list of human-readable mismatch lines — empty means consistent."""
+    before = _recalc_snapshot(campaign_id, conn)
+    recalc_after_upload(campaign_id, conn)
+    after = _recalc_snapshot(campaign_id, conn)
+
+    problems = []
+    for table, stored in before.items():
+        expected = after[table]
+        for key in sorted(set(stored) | set(expected), key=str):
+            if stored.get(key) != expected.get(key):
+                problems.append(
+                    f"{table}[{key}]: stored={stored.get(key)!r} "
+                    f"expected={expected.get(key)!r}"
+                )
+    return problems
+
+
 # ─── Local helpers ──────────────────────────────────────────────────────
 
 def _json_dumps_safe(obj) -> str:
@@ -1227,14 +2219,115 @@ def _response_rate_pct(total: int, no_answer: int) -> float:
 # Design notes:
 #   - The helpers don't know whether they were called for an ADD or a
 #     DELETE. They just re-derive — which is correct in both directions
-#     because normalize_stage / match_sales_user read the live mappings
-#     table.
+#     because the resolution reads the live mappings tables after the
+#     caller's commit.
+#   - Each helper is one UPDATE … FROM a per-campaign "resolved" subquery
+#     that applies the same precedence as MappingResolver (campaign
+#     override → global → default / users fallback). The raw value is
+#     fixed, so the resolved value depends only on the campaign.
+#   - Only rows whose stored value actually changes are written, and only
+#     their campaigns are returned — a campaign whose events already
+#     carry the right value has nothing to recalc.
 #   - For stage: we update normalized_stage. is_voided rows are skipped.
 #   - For sales-rep: we update sales_user_id. Skipping is_voided too.
 #   - Callers are responsible for committing the mapping row change
 #     BEFORE calling these (so the live re-derivation sees the new
 #     state) and for running recalc_after_upload per returned campaign.
 
+_APPLY_STAGE_SQL = """
+    WITH resolved AS (
+        SELECT mc.id AS campaign_id,
+               COALESCE(NULLIF(cm.normalized_stage, ''),
+                        NULLIF(gm.normalized_stage, ''),
+                        %(default)s) AS normalized_stage
+        FROM marketing_campaigns mc
+        LEFT JOIN stage_mappings cm
+               ON cm.campaign_id = mc.id
+              AND LOWER(TRIM(cm.raw_stage)) = %(key)s
+        LEFT JOIN stage_mappings gm
+               ON gm.campaign_id IS NULL
+              AND LOWER(TRIM(gm.raw_stage)) = %(key)s
+        WHERE %(scope)s::int IS NULL OR mc.id = %(scope)s::int
+    ),
+    changed AS (
+        UPDATE lead_events le
+        SET normalized_stage = r.normalized_stage
+        FROM resolved r
+        WHERE le.campaign_id = r.campaign_id
+          AND LOWER(TRIM(le.raw_stage)) = %(key)s
+          AND le.is_voided = FALSE
+          AND le.normalized_stage IS DISTINCT FROM r.normalized_stage
+        RETURNING le.campaign_id
+    )
+    SELECT DISTINCT campaign_id FROM changed
+"""
+
+_APPLY_SALES_REP_SQL = """
+    WITH by_name AS (
+        SELECT id
+        FROM users
+        WHERE REGEXP_REPLACE(LOWER(TRIM(full_name)), '\\s+', ' ', 'g') = %(key)s
+          AND role = ANY(%(roles)s)
+          AND active = TRUE
+        ORDER BY id ASC
+        LIMIT 1
+    ),
+    resolved AS (
+        SELECT mc.id AS campaign_id,
+               COALESCE(cm.sales_user_id, gm.sales_user_id,
+                        (SELECT id FROM by_name)) AS sales_user_id
+        FROM marketing_campaigns mc
+        LEFT JOIN sales_rep_mappings cm
+               ON cm.campaign_id = mc.id
+              AND LOWER(TRIM(cm.raw_name)) = %(key)s
+        LEFT JOIN sales_rep_mappings gm
+               ON gm.campaign_id IS NULL
+              AND LOWER(TRIM(gm.raw_name)) = %(key)s
+        WHERE %(scope)s::int IS NULL OR mc.id = %(scope)s::int
+    ),
+    changed AS (
+        UPDATE lead_events le
+        SET sales_user_id = r.sales_user_id
+        FROM resolved r
+        WHERE le.campaign_id = r.campaign_id
+          AND le.raw_sales_rep_key = %(key)s
+          AND le.is_voided = FALSE
+          AND le.sales_user_id IS DISTINCT FROM r.sales_user_id
+        RETURNING le.campaign_id
+    )
+    SELECT DISTINCT campaign_id FROM changed
+"""
+
+
+def backfill_sales_rep_keys(conn, batch_rows: int = 10000) -> int:
+    """Fill raw_sales_rep_key on events stored without one, batch_rows
+    at a time with a commit after each batch, so it never holds more
+    than a batch of row locks and an interrupted run resumes where it
+    stopped. The partial index idx_lead_events_rep_key_pending finds the
+    remaining rows. Returns rows written."""
+    total = 0
+    while True:
+        with conn.cursor() as cur:
+            cur.execute(
+                f"""
+                UPDATE lead_events
+                SET raw_sales_rep_key = {sales_rep_key_sql("raw_sales_rep_name")}
+                WHERE id IN (
+                    SELECT id FROM lead_events
+                    WHERE raw_sales_rep_key IS NULL
+                      AND raw_sales_rep_name IS NOT NULL
+                    ORDER BY id
+                    LIMIT %s
+                )
+                """,
+                (batch_rows,),
+            )
+            written = cur.rowcount
+        conn.commit()
+        total += written
+        if written < batch_rows:
+            return total
+
 
 def apply_stage_mapping_change(raw_stage: str, campaign_id_scope, conn) -> set:
     """Re-derive normalized_stage for every event whose raw_stage matches.
@@ -1242,11 +2335,10 @@ def apply_stage_mapping_change(raw_stage: str, campaign_id_scope, conn) -> set:
     `campaign_id_scope`:
       - integer → only events in that campaign
       - None    → global change; updates events across every campaign
-                  (per-campaign mappings still win in the re-derivation
-                  because normalize_stage uses the proper lookup order)
+                  (per-campaign mappings still win in the re-derivation)
 
-    Returns a set of affected campaign_ids. Empty set means no events
-    matched — caller can skip the recalc loop entirely.
+    Returns the set of campaign_ids whose events changed. Empty set means
+    nothing moved — caller can skip the recalc loop entirely.
     """
     if raw_stage is None:
         return set()
@@ -1254,42 +2346,13 @@ def apply_stage_mapping_change(raw_stage: str, campaign_id_scope, conn) -> set:
     if not raw_key:
         return set()
 
-    affected: set = set()
     with conn.cursor() as cur:
-        # SELECT first so we can recompute per-event in Python — the
-        # mapping lookup is 3-tier (per-campaign → global → default) and
-        # encoding that in a single UPDATE statement would be brittle.
-        if campaign_id_scope is not None:
-            cur.execute(
-                """
-                SELECT id, campaign_id, raw_stage
-                FROM lead_events
-                WHERE LOWER(TRIM(raw_stage)) = %s
-                  AND campaign_id = %s
-                  AND is_voided = FALSE
-                """,
-                (raw_key, campaign_id_scope),
-            )
-        else:
-            cur.execute(
-                """
-                SELECT id, campaign_id, raw_stage
-                FROM lead_events
-                WHERE LOWER(TRIM(raw_stage)) = %s
-                  AND is_voided = FALSE
-                """,
-                (raw_key,),
-            )
-        rows = cur.fetchall()
-
-    for event_id, campaign_id, original_raw in rows:
-        new_stage = normalize_stage(original_raw, campaign_id=campaign_id, conn=conn)
-        with conn.cursor() as cur:
-            cur.execute(
-                "UPDATE lead_events SET normalized_stage = %s WHERE id = %s",
-                (new_stage, event_id),
-            )
-        affected.add(campaign_id)
+        cur.execute(
+            _APPLY_STAGE_SQL,
+            {"key": raw_key, "scope": campaign_id_scope,
+             "default": DEFAULT_STAGE_MAP.get(raw_key)},
+        )
+        affected = {r[0] for r in cur.fetchall()}
 
     conn.commit()
     return affected
@@ -1298,13 +2361,13 @@ def apply_stage_mapping_change(raw_stage: str, campaign_id_scope, conn) -> set:
 def apply_sales_rep_mapping_change(raw_name: str, campaign_id_scope, conn) -> set:
     """Re-derive sales_user_id for every event whose raw_sales_rep_name
     normalizes to this raw_name. Mirrors apply_stage_mapping_change but
-    keyed on the normalized name.
+    keyed on lead_events.raw_sales_rep_key (the stored normalized name).
 
     Scope: an integer campaign_id (per-campaign change) or None (global).
 
-    Returns the set of affected campaign_ids. Whether those campaigns'
-    KPIs/intervention/assignments actually change depends on the recalc
-    chain the caller runs afterwards.
+    Returns the set of campaign_ids whose events changed. Whether those
+    campaigns' KPIs/intervention/assignments actually change depends on
+    the recalc chain the caller runs afterwards.
     """
     if raw_name is None:
         return set()
@@ -1312,45 +2375,13 @@ def apply_sales_rep_mapping_change(raw_name: str, campaign_id_scope, conn) -> se
     if not norm:
         return set()
 
-    affected: set = set()
     with conn.cursor() as cur:
-        # Match events by NORMALIZED raw_name, not exact string — keeps
-        # "Rana Hany" and "rana  hany" together (same as the parser).
-        if campaign_id_scope is not None:
-            cur.execute(
-                """
-                SELECT id, campaign_id, raw_sales_rep_name
-                FROM lead_events
-                WHERE REGEXP_REPLACE(LOWER(TRIM(raw_sales_rep_name)), '\\s+', ' ', 'g') = %s
-                  AND raw_sales_rep_name IS NOT NULL
-                  AND raw_sales_rep_name <> ''
-                  AND campaign_id = %s
-                  AND is_voided = FALSE
-                """,
-                (norm, campaign_id_scope),
-            )
-        else:
-            cur.execute(
-                """
-                SELECT id, campaign_id, raw_sales_rep_name
-                FROM lead_events
-                WHERE REGEXP_REPLACE(LOWER(TRIM(raw_sales_rep_name)), '\\s+', ' ', 'g') = %s
-                  AND raw_sales_rep_name IS NOT NULL
-                  AND raw_sales_rep_name <> ''
-                  AND is_voided = FALSE
-                """,
-                (norm,),
-            )
-        rows = cur.fetchall()
-
-    for event_id, campaign_id, original_raw in rows:
-        new_user_id = match_sales_user(original_raw, campaign_id, conn)
-        with conn.cursor() as cur:
-            cur.execute(
-                "UPDATE lead_events SET sales_user_id = %s WHERE id = %s",
-                (new_user_id, event_id),
-            )
-        affected.add(campaign_id)
+        cur.execute(
+            _APPLY_SALES_REP_SQL,
+            {"key": norm, "scope": campaign_id_scope,
+             "roles": list(_SALES_USER_ROLES)},
+        )
+        affected = {r[0] for r in cur.fetchall()}
 
     conn.commit()
     return affected
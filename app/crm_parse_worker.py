@@ -0,0 +1,165 @@
+"""
+Run the CRM parser in a child process.
+
+Production is one gunicorn process (`--workers 1 --threads 24`), so the
+openpyxl parse of a big sheet — pure-Python CPU work — used to hold the
+GIL against every request thread and the dashboards stalled while an
+upload parsed. iter_rows_in_subprocess moves that work into a separate
+interpreter:
+
+  - The child is `python -m app.crm_parse_worker`, started per parse.
+    Not multiprocessing: its spawn / forkserver children re-import the
+    parent's __main__, and `python server.py` would run create_app()
+    (table DDL, background threads) in every one of them.
+  - The parent sends the job — the file's descriptor (inherited via
+    pass_fds, so nothing is copied), the campaign and a MappingResolver
+    snapshot loaded from the parent's connection — pickled on stdin. The
+    child never touches the database.
+  - The child streams back pickled frames on stdout: batches of
+    ParsedRows as plain tuples, then the final parse summary, or the
+    error that stopped it. The pipe is the backpressure: the child blocks
+    once the ingest thread stops reading, so at most a batch or two sit
+    in memory on either side.
+  - At most CRM_PARSE_PROCESSES children run at once. A parse that can't
+    get a slot, or whose file is under CRM_PARSE_SUBPROCESS_MIN_BYTES
+    (start-up would cost more than the parse), stays in-thread — see
+    crm_processor._parsed_rows.
+"""
+import os
+import pickle
+import subprocess
+import sys
+import threading
+
+from config import Config
+from app.crm_parser import ParsedRow, iter_crm_excel, new_parse_summary
+
+_BATCH_ROWS = 1000
+
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_slots_lock = threading.Lock()
+_slots = None
+
+
+def _parse_slots() -> threading.BoundedSemaphore:
+    global _slots
+    with _slots_lock:
+        if _slots is None:
+            _slots = threading.BoundedSemaphore(max(1, Config.CRM_PARSE_PROCESSES))
+        return _slots
+
+
+def iter_rows_in_subprocess(file_stream, campaign_id: int, resolver, summary: dict,
+                            engine=None, wait: bool = True):
+    """Same rows and summary as iter_crm_excel(file_stream, …), parsed in
+    a child process. `file_stream` must be a real file (it needs a
+    fileno). Returns None without starting anything when no parse slot is
+    free and `wait` is False.
+
+    Errors raised by the parser come back as the same exception type when
+    it's a ValueError (bad header, unreadable file) and as RuntimeError
+    otherwise, including a child that died.
+    """
+    slots = _parse_slots()
+    if not slots.acquire(blocking=wait):
+        return None
+    rows = _stream_rows(slots, file_stream, campaign_id, resolver, summary, engine)
+    # Run up to the first yield: the child starts now, and from here on
+    # closing (or dropping) the generator kills it and frees the slot.
+    next(rows)
+    return rows
+
+
+def _stream_rows(slots, file_stream, campaign_id, resolver, summary, engine):
+    proc = None
+    try:
+        fd = file_stream.fileno()
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "app.crm_parse_worker"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            cwd=_REPO_ROOT, pass_fds=(fd,),
+        )
+        job = {
+            "fd": fd,
+            "campaign_id": campaign_id,
+            "resolver": resolver,
+            "engine": engine or Config.CRM_PARSE_ENGINE,
+        }
+        pickle.dump(job, proc.stdin, protocol=pickle.HIGHEST_PROTOCOL)
+        proc.stdin.close()
+        yield None
+
+        while True:
+            try:
+                frame = pickle.load(proc.stdout)
+            except EOFError:
+                raise RuntimeError(
+                    f"CRM parser process exited with code {proc.wait()} before finishing"
+                ) from None
+            kind = frame[0]
+            if kind == "rows":
+                _, batch, rows_estimate = frame
+                summary["rows_estimate"] = rows_estimate
+                for values in batch:
+                    yield ParsedRow._make(values)
+            elif kind == "done":
+                summary.update(frame[1])
+                return
+            elif frame[1] == "ValueError":
+                raise ValueError(frame[2])
+            else:
+                raise RuntimeError(f"CRM parser process failed: {frame[1]}: {frame[2]}")
+    finally:
+        if proc is not None:
+            if proc.poll() is None:
+                # The consumer gave up early (or failed); nobody reads the
+                # rest of the rows.
+                proc.kill()
+            proc.stdout.close()
+            proc.wait()
+        slots.release()
+
+
+# ─── Child side ─────────────────────────────────────────────────────────
+
+def _child_main() -> None:
+    # Frames go to the real stdout; anything else that prints (a stray
+    # print in an imported module) lands on stderr instead of corrupting
+    # the stream.
+    out = os.fdopen(os.dup(1), "wb")
+    os.dup2(2, 1)
+
+    job = pickle.load(sys.stdin.buffer)
+    summary = new_parse_summary()
+    try:
+        with os.fdopen(job["fd"], "rb") as fh:
+            fh.seek(0)
+            rows = iter_crm_excel(fh, job["campaign_id"], None, summary,
+                                  engine=job["engine"], resolver=job["resolver"])
+            batch = []
+            for row in rows:
+                # Plain tuples — the cheapest thing to pickle; the parent
+                # rebuilds the ParsedRow.
+                batch.append(tuple(row))
+                if len(batch) >= _BATCH_ROWS:
+                    _send(out, ("rows", batch, summary["rows_estimate"]))
+                    batch = []
+            if batch:
+                _send(out, ("rows", batch, summary["rows_estimate"]))
+        _send(out, ("done", summary))
+    except BrokenPipeError:
+        # The parent stopped reading (upload failed or was abandoned).
+        return
+    except Exception as e:
+        _send(out, ("error", type(e).__name__, str(e)))
+    out.close()
+
+
+def _send(out, frame) -> None:
+    pickle.dump(frame, out, protocol=pickle.HIGHEST_PROTOCOL)
+    out.flush()
+
+
+if __name__ == "__main__":
+    _child_main()
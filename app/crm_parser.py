@@ -1,25 +1,38 @@
 """
-Excel CRM-report parser.
+CRM-report parser (.xlsx, CSV and TSV).
 
 Reads the first worksheet of an .xlsx export from the CRM, walks the rows
 with forward-fill on `Client name` and `Mobile` (CRM exports often leave
 those blank on continuation rows that belong to the previous client), and
-returns a flat list of normalized event dicts ready for ingestion.
+yields normalized ParsedRow records ready for ingestion.
 
 Kept openpyxl-only — no pandas — because the deployment is single-worker
 and we don't want to pay the ~80 MB pandas import on every cold start.
+
+By default the workbook is opened read_only and rows stream straight off
+the sheet XML (see iter_crm_excel), so a 150k-row export never exists as
+a list of tuples. scripts/bench_crm_parser.py compares the engines.
+
+CSV / TSV exports are recognised by content (an .xlsx is a zip archive;
+anything else is read as delimited text) and go through the stdlib csv
+reader instead — same header search, aliases and forward-fill, an order
+of magnitude cheaper than openpyxl.
 """
+import codecs
+import csv
+import io
 import logging
+import os
 from datetime import datetime, date, time
-from typing import Optional
+from typing import NamedTuple, Optional
 
 from openpyxl import load_workbook
 
+from config import Config
 from app.crm_logic import (
+    MappingResolver,
     normalize_mobile,
     normalize_sales_name,
-    normalize_stage,
-    match_sales_user,
 )
 
 log = logging.getLogger(__name__)
@@ -60,6 +73,59 @@ _DATE_FORMATS = (
 )
 
 
+class ParsedRow(NamedTuple):
+    """One event row off the sheet.
+
+    A tuple rather than a dict: under half the size per row, and the parse
+    child ships it over the pipe as a plain tuple. event_hash is None out
+    of the parser; the ingest fills it in with _replace.
+    """
+    row_number: int
+    client_name: str
+    mobile: str
+    raw_stage: Optional[str]
+    normalized_stage: Optional[str]
+    follow_date: Optional[datetime]
+    raw_sales_rep_name: Optional[str]
+    sales_user_id: Optional[int]
+    comment: Optional[str]
+    event_hash: Optional[str] = None
+
+
+# ─── Warnings ───────────────────────────────────────────────────────────
+#
+# A warnings list (summary["warnings"], the ingest's own, and the JSONB
+# column they end up in) holds one entry per kind of problem, not one per
+# row:
+#
+#   {"code": "bad_mobile", "detail": None, "count": 1834,
+#    "rows": [12, 15, …], "example": "01x"}
+#
+# `rows` keeps the first WARNING_SAMPLE_ROWS row numbers and `example` the
+# first offending value, so a sheet with a broken column costs a few
+# hundred bytes instead of a string per row. The UI renders entries by
+# code (crm.upload.warning.<code>).
+
+WARNING_SAMPLE_ROWS = 20
+_WARNING_EXAMPLE_CHARS = 200
+
+
+def add_warning(warnings: list, code: str, row_number: Optional[int] = None,
+                detail: Optional[str] = None, example=None) -> None:
+    """Count one occurrence of (code, detail) in `warnings`."""
+    for entry in warnings:
+        if entry["code"] == code and entry["detail"] == detail:
+            break
+    else:
+        if example is not None:
+            example = str(example)[:_WARNING_EXAMPLE_CHARS]
+        entry = {"code": code, "detail": detail, "count": 0, "rows": [], "example": example}
+        warnings.append(entry)
+    entry["count"] += 1
+    if row_number is not None and len(entry["rows"]) < WARNING_SAMPLE_ROWS:
+        entry["rows"].append(row_number)
+
+
 def _cell_text(v) -> str:
     """Trim a cell value to a string, handling None and openpyxl quirks."""
     if v is None:
@@ -120,41 +186,49 @@ def _resolve_headers(header_row) -> dict:
     return found
 
 
+def _canons_in_row(row) -> set:
+    """Canonical keys whose alias appears somewhere in `row`."""
+    found = set()
+    for cell in row:
+        if cell is None:
+            continue
+        label = str(cell).strip().lower()
+        for canon, aliases in _HEADER_ALIASES.items():
+            if label in aliases:
+                found.add(canon)
+                break
+    return found
+
+
+def _sheets_in_preference_order(wb):
+    """"feedback"-named sheets first, others in workbook order."""
+    return sorted(
+        wb.worksheets,
+        key=lambda s: 0 if "feedback" in s.title.lower() else 1,
+    )
+
+
 def _find_sheet_and_header(wb):
-    """Return (worksheet, header_row_tuple, rows_iterator_after_header, first_data_row_num).
+    """Return (worksheet, header_row_tuple, rows_iterator_after_header,
+    first_data_row_num, last_row_num).
 
     Strategy:
     1. Prefer a sheet whose name contains 'feedback' (case-insensitive).
     2. Try each sheet in order, scanning every row to find the first one
        that contains ALL required canonical columns.  This handles files
        where empty rows or a merged title row precede the real header.
+
+    Used by the "full" engine only — it materialises every row of every
+    sheet it visits, which is what the streaming engine below avoids.
     """
     required_canons = set(_REQUIRED_COLUMNS)
 
-    def _canons_in_row(row):
-        found = set()
-        for cell in row:
-            if cell is None:
-                continue
-            label = str(cell).strip().lower()
-            for canon, aliases in _HEADER_ALIASES.items():
-                if label in aliases:
-                    found.add(canon)
-                    break
-        return found
-
-    # Sort sheets: "feedback"-named sheets first, others in workbook order.
-    sheets = sorted(
-        wb.worksheets,
-        key=lambda s: 0 if "feedback" in s.title.lower() else 1,
-    )
-
-    for ws in sheets:
+    for ws in _sheets_in_preference_order(wb):
         all_rows = list(ws.iter_rows(values_only=True))
         for row_idx, row in enumerate(all_rows):
             if required_canons.issubset(_canons_in_row(row)):
                 # This row has ALL required columns — it's the header.
-                return ws, row, iter(all_rows[row_idx + 1:]), row_idx + 2
+                return ws, row, iter(all_rows[row_idx + 1:]), row_idx + 2, len(all_rows)
 
     raise ValueError(
         "No valid header row found in any sheet. "
@@ -162,144 +236,378 @@ def _find_sheet_and_header(wb):
     )
 
 
-def parse_crm_excel(file_stream, campaign_id: int, conn) -> dict:
-    """Parse an .xlsx CRM export into normalized event dicts.
+def _find_sheet_and_header_streaming(wb, scan_rows: int):
+    """Streaming twin of _find_sheet_and_header for read_only workbooks.
 
-    Args
-    ----
-    file_stream
-        Anything openpyxl.load_workbook accepts (a path or a BytesIO). The
-        blueprint passes a BytesIO seeded from request.files['file'].read()
-        so we never hit disk.
-    campaign_id
-        Used for the per-campaign mapping lookup in normalize_stage and
-        match_sales_user.
-    conn
-        Live DB connection — used to read stage_mappings and
-        sales_rep_mappings inside the normalization helpers.
+    Only the first `scan_rows` rows of each sheet are inspected for the
+    header; the returned iterator is the SAME row generator the header
+    came from, so data rows are pulled off the XML lazily and never sit
+    in memory as a list. A sheet whose header isn't within the window is
+    abandoned (its generator is dropped) and the next sheet is tried.
 
-    Returns
-    -------
-    {
-      "rows": [ {row_number, client_name, mobile, raw_stage, normalized_stage,
-                 follow_date, raw_sales_rep_name, sales_user_id, comment} ],
-      "warnings": [str, ...],
-      "unmatched_sales_reps": [str, ...],   # de-duplicated, original casing
-      "unmatched_stages": [str, ...],       # de-duplicated, original casing
-      "total_rows_in_sheet": int,
-    }
+    last_row_num comes from the sheet's declared <dimension>, read before
+    it is reset, and is None when that looks stale (a bare "A1"). It is
+    only a progress estimate — the row loop never relies on it.
+    """
+    required_canons = set(_REQUIRED_COLUMNS)
+
+    for ws in _sheets_in_preference_order(wb):
+        # Some exporters write a stale <dimension ref="A1"/>; read_only
+        # mode trusts it and would truncate every row to one column.
+        declared_last_row = ws.max_row if (ws.max_row or 0) > 1 else None
+        ws.reset_dimensions()
+        rows = ws.iter_rows(values_only=True)
+        for row_idx, row in enumerate(rows):
+            if row_idx >= scan_rows:
+                break
+            if required_canons.issubset(_canons_in_row(row)):
+                return ws, row, rows, row_idx + 2, declared_last_row
 
-    The forward-fill behavior is the key bit — see the loop below for the
-    last_client_name / last_mobile pattern. CRM exports routinely leave
-    those blank on "continuation rows" that belong to the previous client.
+    raise ValueError(
+        f"No valid header row found in the first {scan_rows} rows of any sheet. "
+        "Expected columns: Client name, Mobile, Stage, Follow Date, Sales Rep."
+    )
+
+
+# Engines selectable via Config.CRM_PARSE_ENGINE (or the `engine` kwarg):
+#   "stream" — read_only workbook, header searched in the first
+#              Config.CRM_HEADER_SCAN_ROWS rows, data rows yielded lazily.
+#   "full"   — the original path: fully loaded workbook, every row of
+#              every candidate sheet materialised to find the header.
+#              Kept for parity checks and as an escape hatch.
+PARSE_ENGINES = ("stream", "full")
+
+
+def _open_rows(file_stream, engine: str):
+    """Open the workbook with the chosen engine, or the CSV/TSV reader.
+
+    Returns (workbook, header_row, rows_iterator, first_data_row_number,
+    last_row_number_or_None).
+    The caller owns the workbook and must .close() it — read_only mode
+    keeps the zip archive open until then.
     """
+    if engine not in PARSE_ENGINES:
+        raise ValueError(f"Unknown CRM parse engine: {engine!r}")
+    if not _is_workbook(file_stream):
+        # CSV / TSV: the engines only differ in how they read a workbook.
+        return _open_delimited_rows(file_stream, Config.CRM_HEADER_SCAN_ROWS)
+
     # data_only=True so formula cells (rare in CRM exports, but possible)
     # come through as the cached value instead of "=SUM(...)".
-    # read_only=False so _find_sheet_and_header can materialise all rows as a
-    # list (read_only streaming iterators can't be rewound).
-    wb = load_workbook(file_stream, read_only=False, data_only=True)
-    if not wb.worksheets:
-        raise ValueError("Workbook has no worksheets.")
+    if engine == "stream":
+        wb = load_workbook(file_stream, read_only=True, data_only=True)
+    else:
+        # read_only=False so _find_sheet_and_header can materialise all
+        # rows as a list (read_only streaming iterators can't be rewound).
+        wb = load_workbook(file_stream, read_only=False, data_only=True)
+    try:
+        if not wb.worksheets:
+            raise ValueError("Workbook has no worksheets.")
+        if engine == "stream":
+            _ws, header_row, rows_iter, first, last = _find_sheet_and_header_streaming(
+                wb, Config.CRM_HEADER_SCAN_ROWS
+            )
+        else:
+            _ws, header_row, rows_iter, first, last = _find_sheet_and_header(wb)
+    except Exception:
+        wb.close()
+        raise
+    return wb, header_row, rows_iter, first, last
+
+
+# ─── Delimited text (CSV / TSV) ─────────────────────────────────────────
+#
+# Cells arrive as strings, which _parse_follow_date and normalize_mobile
+# already take (a CSV keeps the leading 0 of a mobile that Excel would
+# have turned into a number). The reader pulls records off the decoded
+# byte stream one at a time, so no list of rows is ever built.
+
+_XLSX_MAGIC = b"PK\x03\x04"
+# Tried in this order; the first one that yields a header row with every
+# required column wins. ";" is what Excel writes under locales that use a
+# decimal comma.
+_DELIMITERS = (",", "\t", ";")
+_ENCODING_CHUNK_BYTES = 1024 * 1024
+
+
+def _is_workbook(file_stream) -> bool:
+    """True for an .xlsx (zip) payload; leaves a stream where it was."""
+    if isinstance(file_stream, (str, os.PathLike)):
+        with open(file_stream, "rb") as fh:
+            return fh.read(4) == _XLSX_MAGIC
+    pos = file_stream.tell()
+    head = file_stream.read(4)
+    file_stream.seek(pos)
+    return head == _XLSX_MAGIC
+
+
+def _sniff_encoding(fh):
+    """Return (encoding, line_count_or_None) for a delimited export.
+
+    A BOM decides outright (UTF-8, or UTF-16 from Excel's "Unicode Text"
+    save). Otherwise the whole file must decode as strict UTF-8, else it
+    is taken as Windows-1256 — what Arabic Windows / Excel write for
+    "CSV". The same pass counts line breaks for the progress estimate
+    (None for UTF-16, where bytes don't map to lines). Rewinds `fh`.
+    """
+    start = fh.tell()
+    head = fh.read(4)
+    fh.seek(start)
+    if head[:2] in (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE):
+        return "utf-16", None
+
+    encoding = "utf-8-sig" if head.startswith(codecs.BOM_UTF8) else None
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    valid_utf8 = True
+    lines = 0
+    last = b""
+    while True:
+        chunk = fh.read(_ENCODING_CHUNK_BYTES)
+        if not chunk:
+            break
+        lines += chunk.count(b"\n")
+        last = chunk[-1:]
+        if encoding is None and valid_utf8:
+            try:
+                decoder.decode(chunk)
+            except UnicodeDecodeError:
+                valid_utf8 = False
+    if encoding is None and valid_utf8:
+        try:
+            decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            valid_utf8 = False
+    fh.seek(start)
+    if last and last != b"\n":
+        lines += 1
+    return encoding or ("utf-8" if valid_utf8 else "cp1256"), lines
+
+
+def _csv_records(reader):
+    """csv.reader, with its errors (e.g. a stray quote running a field
+    past csv.field_size_limit) turned into the ValueError the upload path reports."""
+    try:
+        yield from reader
+    except csv.Error as e:
+        raise ValueError(f"Line {reader.line_num}: {e}") from None
+
+
+class _TextSource:
+    """Stands in for the workbook _open_rows hands back: close() releases
+    the text wrapper, closing the file only if we opened it ourselves."""
+
+    def __init__(self, text, owned: bool):
+        self._text = text
+        self._owned = owned
+
+    def close(self) -> None:
+        if self._owned:
+            self._text.close()
+        else:
+            self._text.detach()
+
+
+def _open_delimited_rows(file_stream, scan_rows: int):
+    """CSV/TSV twin of _find_sheet_and_header_streaming: returns
+    (source, header_row, rows_iterator, first_data_row_num, last_row_num)."""
+    owned = isinstance(file_stream, (str, os.PathLike))
+    fh = open(file_stream, "rb") if owned else file_stream
+    try:
+        start = fh.tell()
+        encoding, line_count = _sniff_encoding(fh)
+        required_canons = set(_REQUIRED_COLUMNS)
+        for delimiter in _DELIMITERS:
+            fh.seek(start)
+            text = io.TextIOWrapper(fh, encoding=encoding, newline="")
+            rows = _csv_records(csv.reader(text, delimiter=delimiter))
+            for row_idx, row in enumerate(rows):
+                if row_idx >= scan_rows:
+                    break
+                if required_canons.issubset(_canons_in_row(row)):
+                    return _TextSource(text, owned), row, rows, row_idx + 2, line_count
+            text.detach()
+    except Exception:
+        if owned:
+            fh.close()
+        raise
+    if owned:
+        fh.close()
+    raise ValueError(
+        f"No valid header row found in the first {scan_rows} rows of the file "
+        f"(read as {encoding} text; tried comma, tab and semicolon). "
+        "Expected columns: Client name, Mobile, Stage, Follow Date, Sales Rep."
+    )
 
-    ws, header_row, rows_iter, first_data_row_number = _find_sheet_and_header(wb)
 
-    headers = _resolve_headers(list(header_row))
+def new_parse_summary() -> dict:
+    """Empty summary dict for iter_crm_excel to fill in as it goes."""
+    return {
+        "warnings": [],
+        "unmatched_sales_reps": [],
+        "unmatched_stages": [],
+        "total_rows_in_sheet": 0,
+        # Data rows the sheet says it has (None if unknown). Set as soon
+        # as the header is found; the upload worker uses it for progress.
+        "rows_estimate": None,
+    }
 
-    def _val(row_tuple, canon):
-        idx = headers.get(canon)
-        if idx is None or idx > len(row_tuple):
-            return None
-        return row_tuple[idx - 1]
 
-    out_rows: list = []
-    warnings: list = []
-    unmatched_reps: dict = {}    # norm → display
-    unmatched_stages: dict = {}  # norm → display
-    total_rows = 0
+def iter_crm_excel(file_stream, campaign_id: int, conn, summary: dict,
+                   engine: Optional[str] = None,
+                   resolver: Optional[MappingResolver] = None):
+    """Generator form of parse_crm_excel — yields one ParsedRow per row.
 
-    last_client_name: Optional[str] = None
-    last_mobile_normalized: Optional[str] = None
+    `summary` (see new_parse_summary) is filled in while the generator
+    runs: warnings are tallied as rows are read (see add_warning), and
+    the unmatched lists plus total_rows_in_sheet are final once the
+    generator is exhausted. The upload worker consumes this directly so
+    ingest starts on the first row instead of after the whole sheet has
+    been parsed.
 
-    for row_index, row in enumerate(rows_iter, start=first_data_row_number):
-        if row is None:
-            continue
-        total_rows += 1
-
-        raw_client = _cell_text(_val(row, "client_name"))
-        raw_mobile = _val(row, "mobile")
-        raw_stage = _cell_text(_val(row, "stage"))
-        raw_follow = _val(row, "follow_date")
-        raw_rep = _cell_text(_val(row, "sales_rep"))
-        raw_comment = _cell_text(_val(row, "comment"))
-
-        # Forward-fill: a fresh client header row writes the buffer; a
-        # continuation row reads it. We deliberately update the buffer
-        # BEFORE checking for "totally blank row" — a row with only a
-        # client name and nothing else is a legitimate header pass.
-        if raw_client:
-            last_client_name = raw_client
-        client_name = last_client_name
-
-        # Normalize current row's mobile if present; otherwise inherit.
-        if raw_mobile not in (None, ""):
-            this_mobile_norm = normalize_mobile(raw_mobile)
-            if this_mobile_norm:
-                last_mobile_normalized = this_mobile_norm
-            else:
-                warnings.append(
-                    f"Row {row_index}: mobile {raw_mobile!r} couldn't be normalized; "
-                    "row will be skipped if no prior valid mobile is in scope."
-                )
-        mobile = last_mobile_normalized
-
-        # A row with no event-shaped content is just whitespace — skip
-        # silently. A row that DOES have content but no mobile in scope
-        # is dropped with a warning (we can't attach the event to a lead).
-        has_event = bool(raw_stage or raw_follow or raw_rep or raw_comment)
-        if not has_event:
-            continue
+    Header problems (no sheet with the required columns) raise
+    ValueError on the first next(), before anything is yielded.
 
-        if not mobile:
-            warnings.append(
-                f"Row {row_index}: event row has no mobile in scope (header row "
-                "before it didn't have a normalizable mobile either). Skipping."
-            )
-            continue
+    Stage and rep lookups go through a MappingResolver loaded once from
+    `conn` (or the one passed in), so each distinct raw value costs one
+    dict lookup instead of up to three queries per row.
+    """
+    engine = engine or Config.CRM_PARSE_ENGINE
+    wb, header_row, rows_iter, first_data_row_number, last_row = _open_rows(file_stream, engine)
+    if last_row is not None:
+        summary["rows_estimate"] = max(0, last_row - first_data_row_number + 1)
+    try:
+        headers = _resolve_headers(list(header_row))
+        if resolver is None:
+            resolver = MappingResolver.load(conn, campaign_id)
+
+        def _val(row_tuple, canon):
+            idx = headers.get(canon)
+            if idx is None or idx > len(row_tuple):
+                return None
+            return row_tuple[idx - 1]
+
+        warnings = summary["warnings"]
+        unmatched_reps: dict = {}    # norm → display
+        unmatched_stages: dict = {}  # norm → display
+
+        last_client_name: Optional[str] = None
+        last_mobile_normalized: Optional[str] = None
+
+        for row_index, row in enumerate(rows_iter, start=first_data_row_number):
+            if row is None:
+                continue
+            summary["total_rows_in_sheet"] += 1
+
+            raw_client = _cell_text(_val(row, "client_name"))
+            raw_mobile = _val(row, "mobile")
+            raw_stage = _cell_text(_val(row, "stage"))
+            raw_follow = _val(row, "follow_date")
+            raw_rep = _cell_text(_val(row, "sales_rep"))
+            raw_comment = _cell_text(_val(row, "comment"))
+
+            # Forward-fill: a fresh client header row writes the buffer; a
+            # continuation row reads it. We deliberately update the buffer
+            # BEFORE checking for "totally blank row" — a row with only a
+            # client name and nothing else is a legitimate header pass.
+            if raw_client:
+                last_client_name = raw_client
+            client_name = last_client_name
+
+            # Normalize current row's mobile if present; otherwise inherit.
+            if raw_mobile not in (None, ""):
+                this_mobile_norm = normalize_mobile(raw_mobile)
+                if this_mobile_norm:
+                    last_mobile_normalized = this_mobile_norm
+                else:
+                    # The row still goes through if an earlier mobile is in scope.
+                    add_warning(warnings, "bad_mobile", row_index, example=raw_mobile)
+            mobile = last_mobile_normalized
+
+            # A row with no event-shaped content is just whitespace — skip
+            # silently. A row that DOES have content but no mobile in scope
+            # is dropped with a warning (we can't attach the event to a lead).
+            has_event = bool(raw_stage or raw_follow or raw_rep or raw_comment)
+            if not has_event:
+                continue
+
+            if not mobile:
+                add_warning(warnings, "no_mobile", row_index)
+                continue
 
-        # Stage and rep can both fail to resolve; the row is still ingested
-        # with NULLs for the unresolved field and the raw value preserved.
-        norm_stage = normalize_stage(raw_stage, campaign_id=campaign_id, conn=conn) if raw_stage else None
-        if raw_stage and not norm_stage:
-            unmatched_stages.setdefault(raw_stage.lower(), raw_stage)
-
-        sales_user_id = match_sales_user(raw_rep, campaign_id, conn) if raw_rep else None
-        if raw_rep and sales_user_id is None:
-            # Use the normalized form as the dedup key so "Mahmoud  Amr "
-            # and "mahmoud amr" don't both show up in the warnings list.
-            unmatched_reps.setdefault(normalize_sales_name(raw_rep), raw_rep)
-
-        follow_date = _parse_follow_date(raw_follow)
-        if raw_follow not in (None, "") and follow_date is None:
-            warnings.append(
-                f"Row {row_index}: follow_date {raw_follow!r} couldn't be parsed; stored as NULL."
+            # Stage and rep can both fail to resolve; the row is still ingested
+            # with NULLs for the unresolved field and the raw value preserved.
+            norm_stage = resolver.stage(raw_stage) if raw_stage else None
+            if raw_stage and not norm_stage:
+                if raw_stage.lower() not in unmatched_stages:
+                    unmatched_stages[raw_stage.lower()] = raw_stage
+                    summary["unmatched_stages"].append(raw_stage)
+
+            sales_user_id = resolver.sales_user(raw_rep) if raw_rep else None
+            if raw_rep and sales_user_id is None:
+                # Use the normalized form as the dedup key so "Mahmoud  Amr "
+                # and "mahmoud amr" don't both show up in the warnings list.
+                rep_key = normalize_sales_name(raw_rep)
+                if rep_key not in unmatched_reps:
+                    unmatched_reps[rep_key] = raw_rep
+                    summary["unmatched_sales_reps"].append(raw_rep)
+
+            follow_date = _parse_follow_date(raw_follow)
+            if raw_follow not in (None, "") and follow_date is None:
+                add_warning(warnings, "bad_date", row_index, example=raw_follow)
+
+            yield ParsedRow(
+                row_index,
+                client_name or "",
+                mobile,
+                raw_stage or None,
+                norm_stage,
+                follow_date,
+                raw_rep or None,
+                sales_user_id,
+                raw_comment or None,
             )
+    finally:
+        wb.close()
 
-        out_rows.append({
-            "row_number": row_index,
-            "client_name": client_name or "",
-            "mobile": mobile,
-            "raw_stage": raw_stage or None,
-            "normalized_stage": norm_stage,
-            "follow_date": follow_date,
-            "raw_sales_rep_name": raw_rep or None,
-            "sales_user_id": sales_user_id,
-            "comment": raw_comment or None,
-        })
 
-    return {
-        "rows": out_rows,
-        "warnings": warnings,
-        "unmatched_sales_reps": list(unmatched_reps.values()),
-        "unmatched_stages": list(unmatched_stages.values()),
-        "total_rows_in_sheet": total_rows,
+def parse_crm_excel(file_stream, campaign_id: int, conn,
+                    engine: Optional[str] = None) -> dict:
+    """Parse an .xlsx CRM export into normalized ParsedRow records.
+
+    Args
+    ----
+    file_stream
+        A path or a binary stream (BytesIO) holding an .xlsx, or a CSV /
+        TSV export — told apart by content, see _is_workbook. The upload
+        worker passes a BytesIO over the spooled bytes.
+    campaign_id
+        Used for the per-campaign mapping lookup (see MappingResolver).
+    conn
+        Live DB connection — used once up front to load stage_mappings,
+        sales_rep_mappings and the eligible users into a MappingResolver.
+    engine
+        "stream" or "full" (see PARSE_ENGINES). Defaults to
+        Config.CRM_PARSE_ENGINE. Both produce identical output; ignored
+        for CSV / TSV.
+
+    Returns
+    -------
+    {
+      "rows": [ParsedRow, ...],
+      "warnings": [{code, detail, count, rows, example}, ...],   # see add_warning
+      "unmatched_sales_reps": [str, ...],   # de-duplicated, original casing
+      "unmatched_stages": [str, ...],       # de-duplicated, original casing
+      "total_rows_in_sheet": int,
     }
+
+    The forward-fill behavior is the key bit — see the loop in
+    iter_crm_excel for the last_client_name / last_mobile pattern. CRM
+    exports routinely leave those blank on "continuation rows" that
+    belong to the previous client.
+    """
+    summary = new_parse_summary()
+    rows = list(iter_crm_excel(file_stream, campaign_id, conn, summary, engine=engine))
+    # rows_estimate is a progress hint, not parse output — the engines
+    # can legitimately disagree on it when a sheet's dimension is stale.
+    summary.pop("rows_estimate", None)
+    return {"rows": rows, **summary}
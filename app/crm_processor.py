@@ -1,145 +1,562 @@
 """
 Background worker for CRM-report uploads.
 
-The HTTP endpoint inserts a `crm_report_uploads` row with status=PENDING
-and hands the bytes + upload_id to `process_upload()`, which runs on a
-daemon thread and walks the rows into `leads` + `lead_events`. KPI
-recalculation lands in a follow-up phase — for now this is just ingest +
-dedup + status reporting.
+The HTTP endpoint inserts a `crm_report_uploads` row with status=PENDING,
+spools the file into `crm_upload_spool` in the same transaction and hands
+the upload_id to `submit_upload()`. A fixed pool of worker threads
+(CRM_UPLOAD_WORKERS) drains a bounded in-memory queue: each worker copies
+the spool into a temp file, walks the rows into `leads` + `lead_events`,
+runs the KPI recalc and drops the spool row once the upload is COMPLETED
+or FAILED.
 
-We keep a daemon thread (not a process queue) for the same reason
+  - Backpressure: at most CRM_UPLOAD_QUEUE_SIZE uploads wait; past that
+    submit_upload raises UploadQueueFull and the endpoint answers 503.
+    Only the running uploads hold a pooled connection, so that is bounded
+    by the worker count.
+  - Memory: no step holds a whole file. The endpoint hashes and spools
+    the request's (already disk-backed) file part in _SPOOL_CHUNK_BYTES
+    pieces, the worker writes the chunks back out to a temp file and the
+    parser streams rows off that file. A chunked upload (open_upload_session)
+    arrives a chunk per request and reaches the same spool.
+  - GIL: sheets past CRM_PARSE_SUBPROCESS_MIN_BYTES are parsed in a child
+    process (app/crm_parse_worker.py) that streams row batches back, so
+    a big parse doesn't starve the request threads; see _parsed_rows.
+  - Per-campaign serialization: a worker never picks an upload whose
+    campaign is already being processed, so one campaign's uploads land
+    (and recalc) in submission order.
+  - Duplicate files: the endpoint stores the SHA-256 of every upload;
+    a byte-identical re-upload for the same campaign is recorded as a
+    duplicate of the earlier one (record_duplicate_upload) and never
+    reaches the pool. Within an upload, rows whose event_hash already
+    exists are counted as duplicates from one batched lookup instead of
+    an insert attempt each (_split_existing).
+  - Restart recovery: the first start_upload_workers() call in a process
+    re-queues every PENDING / PROCESSING upload that still has a spool
+    row, and fails the ones that don't. Re-ingesting a half-landed upload
+    is safe because events dedup on event_hash; a retry then counts the
+    events the earlier attempt landed as its own (not as duplicates) and
+    always runs the full recalc, since that attempt died before its own.
+
+We keep in-process threads (not a process queue) for the same reason
 `app/sync_service.py` does: the production deployment runs
-`gunicorn --workers 1` so a single in-proc worker is sufficient and
-removes operational moving parts. If the worker count ever bumps up we
-revisit and move to RQ/Celery.
+`gunicorn --workers 1`, so one pool is the whole fleet and the recovery
+sweep can't steal another process's in-flight upload. If the worker
+count ever bumps up we revisit and move to RQ/Celery.
 """
+import csv
 import io
+import itertools
 import json
 import logging
+import hashlib
+import tempfile
 import threading
+import time
 import traceback
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extras
 
-from app.crm_logic import compute_event_hash, recalc_after_upload
-from app.crm_parser import parse_crm_excel
+from config import Config
+from app.crm_events import EVENT_UPLOAD, notify
+from app.crm_logic import (
+    MappingResolver,
+    bump_daily_activity,
+    bump_lead_state,
+    compute_event_hash,
+    recalc_after_upload,
+    sales_rep_key_sql,
+)
+from app.crm_parse_worker import iter_rows_in_subprocess
+from app.crm_parser import ParsedRow, add_warning, iter_crm_excel, new_parse_summary
 from app.database import get_conn
 
 log = logging.getLogger(__name__)
 
+# A spooled upload that has been started this many times without reaching
+# a terminal state (e.g. it keeps taking the process down) is failed
+# instead of being retried again on the next restart.
+_MAX_UPLOAD_ATTEMPTS = 3
+
+# Unit for hashing, spooling and un-spooling an upload: one
+# crm_upload_spool_chunks row, and the most of a file held in memory.
+_SPOOL_CHUNK_BYTES = 1024 * 1024
+
+
+# ─── Upload worker pool ─────────────────────────────────────────────────
+
+class UploadQueueFull(Exception):
+    """Raised by submit_upload when CRM_UPLOAD_QUEUE_SIZE uploads already wait."""
+
+
+_pool_cond = threading.Condition()
+_pending: deque = deque()       # (upload_id, campaign_id), oldest first
+_queued_ids: set = set()        # pending or running — guards double submits
+_busy_campaigns: set = set()
+_workers: list = []
+
+
+class UploadTooLarge(Exception):
+    """Raised by hash_upload_stream when a file passes the size cap."""
+
+
+def hash_upload_stream(stream, max_bytes: int):
+    """Return (sha256_hex, size) of a binary stream, read chunk by chunk.
+
+    Raises UploadTooLarge as soon as more than `max_bytes` have been read,
+    without reading the rest. Rewinds the stream for the next reader.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    stream.seek(0)
+    while True:
+        chunk = stream.read(_SPOOL_CHUNK_BYTES)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_bytes:
+            raise UploadTooLarge(size)
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest(), size
+
+
+def spool_upload(cur, upload_id: int, stream) -> None:
+    """Persist the uploaded file next to its crm_report_uploads row, one
+    _SPOOL_CHUNK_BYTES row at a time.
+
+    Runs on the caller's cursor and does NOT commit — the endpoint lands
+    the upload row and its spool together, so a restart always finds the
+    bytes for an upload it has to resume.
+    """
+    cur.execute("INSERT INTO crm_upload_spool (upload_id) VALUES (%s)", (upload_id,))
+    stream.seek(0)
+    for seq in itertools.count():
+        chunk = stream.read(_SPOOL_CHUNK_BYTES)
+        if not chunk:
+            break
+        cur.execute(
+            "INSERT INTO crm_upload_spool_chunks (upload_id, seq, data) VALUES (%s, %s, %s)",
+            (upload_id, seq, psycopg2.Binary(chunk)),
+        )
+
+
+# ─── Chunked (resumable) uploads ────────────────────────────────────────
+#
+# A file too big to trust to one POST on a flaky connection goes up in
+# pieces: the endpoint opens a crm_upload_sessions row for its declared
+# size, the client PUTs _SPOOL_CHUNK_BYTES-sized chunks (in any order; a
+# retried chunk overwrites itself) and asks which ones arrived when it
+# resumes, then completes the session. Completing hashes the chunks off a
+# server-side cursor and copies them into the spool inside the database,
+# so the app never holds more than a chunk of the file.
+
+def upload_session_chunk_count(total_bytes: int, chunk_bytes: int) -> int:
+    return -(-total_bytes // chunk_bytes)
 
-def start_processing_thread(upload_id: int, file_bytes: bytes, campaign_id: int) -> None:
-    """Spawn the daemon worker. Returns immediately so the HTTP handler can
-    200 the client right away."""
-    t = threading.Thread(
-        target=_process_upload_safe,
-        args=(upload_id, file_bytes, campaign_id),
-        name=f"crm-upload-{upload_id}",
-        daemon=True,
+
+def upload_session_chunk_size(total_bytes: int, chunk_bytes: int, seq: int):
+    """Exact byte length chunk `seq` of a `total_bytes` file must have,
+    or None when there is no such chunk."""
+    if seq < 0 or seq >= upload_session_chunk_count(total_bytes, chunk_bytes):
+        return None
+    return min(chunk_bytes, total_bytes - seq * chunk_bytes)
+
+
+def open_upload_session(cur, campaign_id: int, file_name: str, uploaded_by,
+                        total_bytes: int):
+    """Start a chunked upload; returns (session_id, chunk_bytes). Sweeps
+    sessions idle for longer than CRM_UPLOAD_SESSION_TTL_HOURS on the way.
+    Runs on the caller's cursor, no commit."""
+    cur.execute(
+        "DELETE FROM crm_upload_sessions WHERE updated_at < NOW() - %s * INTERVAL '1 hour'",
+        (Config.CRM_UPLOAD_SESSION_TTL_HOURS,),
     )
-    t.start()
+    cur.execute(
+        """
+        INSERT INTO crm_upload_sessions (campaign_id, file_name, uploaded_by,
+                                         total_bytes, chunk_bytes)
+        VALUES (%s, %s, %s, %s, %s)
+        RETURNING id, chunk_bytes
+        """,
+        (campaign_id, file_name, uploaded_by, total_bytes, _SPOOL_CHUNK_BYTES),
+    )
+    return cur.fetchone()
 
 
-def _process_upload_safe(upload_id: int, file_bytes: bytes, campaign_id: int) -> None:
+def store_upload_session_chunk(cur, session_id: int, seq: int, data: bytes) -> None:
+    """Write (or overwrite) one chunk of a session. No commit."""
+    cur.execute(
+        """
+        INSERT INTO crm_upload_session_chunks (session_id, seq, data)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (session_id, seq) DO UPDATE SET data = EXCLUDED.data
+        """,
+        (session_id, seq, psycopg2.Binary(data)),
+    )
+    cur.execute(
+        "UPDATE crm_upload_sessions SET updated_at = NOW() WHERE id = %s",
+        (session_id,),
+    )
+
+
+def upload_session_received(cur, session_id: int) -> list:
+    """Sequence numbers of the chunks a session has, ascending."""
+    cur.execute(
+        "SELECT seq FROM crm_upload_session_chunks WHERE session_id = %s ORDER BY seq",
+        (session_id,),
+    )
+    return [r[0] for r in cur.fetchall()]
+
+
+def hash_upload_session(conn, session_id: int):
+    """(sha256_hex, size) of a session's chunks in order, read a few at a
+    time off a server-side cursor."""
+    digest = hashlib.sha256()
+    size = 0
+    with conn.cursor(name=f"crm_session_hash_{session_id}") as cur:
+        cur.itersize = 4
+        cur.execute(
+            "SELECT data FROM crm_upload_session_chunks WHERE session_id = %s ORDER BY seq",
+            (session_id,),
+        )
+        for (data,) in cur:
+            digest.update(data)
+            size += len(data)
+    return digest.hexdigest(), size
+
+
+def spool_upload_session(cur, session_id: int, upload_id: int) -> None:
+    """spool_upload for a completed session: the chunks are copied into
+    the spool by Postgres, never through the app. The session itself is
+    left for the caller to drop once the upload is queued. No commit."""
+    cur.execute("INSERT INTO crm_upload_spool (upload_id) VALUES (%s)", (upload_id,))
+    cur.execute(
+        """
+        INSERT INTO crm_upload_spool_chunks (upload_id, seq, data)
+        SELECT %s, seq, data FROM crm_upload_session_chunks
+        WHERE session_id = %s
+        """,
+        (upload_id, session_id),
+    )
+
+
+def record_duplicate_upload(cur, campaign_id: int, file_name: str,
+                            uploaded_by, file_sha256: str):
+    """Short-circuit for a byte-identical re-upload.
+
+    If the campaign already has a COMPLETED upload with this SHA-256,
+    record the new upload as a duplicate of it — COMPLETED on the spot,
+    every event counted as a duplicate, nothing parsed or recalculated —
+    and return (upload_id, original_upload_id). Every event of the
+    original is still in lead_events (events are never deleted), so a
+    re-ingest would only have confirmed that row by row. Returns None
+    when the content is new. Runs on the caller's cursor, no commit.
+    """
+    original = _find_identical_upload(cur, campaign_id, file_sha256)
+    if original is None:
+        return None
+    original_id, total_rows, total_leads, total_events = original
+    cur.execute(
+        """
+        INSERT INTO crm_report_uploads (
+            campaign_id, file_name, uploaded_by, status,
+            file_sha256, duplicate_of_upload_id,
+            total_rows, total_leads, total_events,
+            new_events, duplicate_events,
+            phase, rows_processed, rows_total,
+            parse_ms, ingest_ms, recalc_ms,
+            started_at, progress_at, processed_at
+        )
+        VALUES (%s, %s, %s, 'COMPLETED', %s, %s, %s, %s, %s, 0, %s,
+                'done', %s, %s, 0, 0, 0, NOW(), NOW(), NOW())
+        RETURNING id
+        """,
+        (
+            campaign_id, file_name, uploaded_by,
+            file_sha256, original_id,
+            total_rows, total_leads, total_events, total_events,
+            total_rows, total_rows,
+        ),
+    )
+    return cur.fetchone()[0], original_id
+
+
+def _find_identical_upload(cur, campaign_id: int, file_sha256: str):
+    """(id, total_rows, total_leads, total_events) of the first COMPLETED
+    upload of this content for the campaign, or None."""
+    cur.execute(
+        """
+        SELECT id, total_rows, total_leads, total_events
+        FROM crm_report_uploads
+        WHERE campaign_id = %s AND file_sha256 = %s
+          AND status = 'COMPLETED' AND duplicate_of_upload_id IS NULL
+          AND is_voided = FALSE
+        ORDER BY id
+        LIMIT 1
+        """,
+        (campaign_id, file_sha256),
+    )
+    return cur.fetchone()
+
+
+def upload_queue_has_room() -> bool:
+    with _pool_cond:
+        return len(_pending) < Config.CRM_UPLOAD_QUEUE_SIZE
+
+
+def submit_upload(upload_id: int, campaign_id: int) -> None:
+    """Queue a spooled upload for the worker pool. Returns immediately."""
+    start_upload_workers()
+    _enqueue(upload_id, campaign_id, bounded=True)
+
+
+def _enqueue(upload_id: int, campaign_id: int, bounded: bool) -> None:
+    with _pool_cond:
+        if upload_id in _queued_ids:
+            return
+        if bounded and len(_pending) >= Config.CRM_UPLOAD_QUEUE_SIZE:
+            raise UploadQueueFull(upload_id)
+        _pending.append((upload_id, campaign_id))
+        _queued_ids.add(upload_id)
+        _pool_cond.notify_all()
+
+
+def start_upload_workers() -> None:
+    """Start the worker pool once per process and re-queue uploads that a
+    previous process left unfinished. Idempotent."""
+    with _pool_cond:
+        if _workers:
+            return
+        for i in range(max(1, Config.CRM_UPLOAD_WORKERS)):
+            t = threading.Thread(target=_worker_loop, name=f"crm-upload-{i}", daemon=True)
+            _workers.append(t)
+            t.start()
+    log.info("🧵 CRM upload pool started (%d worker(s), queue %d)",
+             len(_workers), Config.CRM_UPLOAD_QUEUE_SIZE)
+    try:
+        _recover_interrupted_uploads()
+    except Exception as exc:
+        log.error("CRM upload recovery sweep failed: %s", exc)
+
+
+def _recover_interrupted_uploads() -> None:
+    conn = None
+    try:
+        conn = get_conn()
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT u.id, u.campaign_id, (s.upload_id IS NOT NULL) AS spooled
+                FROM crm_report_uploads u
+                LEFT JOIN crm_upload_spool s ON s.upload_id = u.id
+                WHERE u.status IN ('PENDING', 'PROCESSING')
+                ORDER BY u.id
+                """
+            )
+            rows = cur.fetchall()
+            lost = [r[0] for r in rows if not r[2]]
+            resumable = [(r[0], r[1]) for r in rows if r[2]]
+            if lost:
+                cur.execute(
+                    """
+                    UPDATE crm_report_uploads SET
+                        status        = 'FAILED',
+                        error_message = %s,
+                        processed_at  = NOW()
+                    WHERE id = ANY(%s)
+                    """,
+                    ("Upload was interrupted by a server restart and its file is "
+                     "no longer available — please upload it again", lost),
+                )
+            if resumable:
+                cur.execute(
+                    "UPDATE crm_report_uploads SET status = 'PENDING' WHERE id = ANY(%s)",
+                    ([uid for uid, _ in resumable],),
+                )
+        conn.commit()
+    finally:
+        if conn is not None:
+            conn.close()
+
+    # Recovered uploads were already accepted once — never bounce them.
+    for upload_id, campaign_id in resumable:
+        _enqueue(upload_id, campaign_id, bounded=False)
+    if lost or resumable:
+        log.info("CRM upload recovery: %d re-queued, %d failed (no spool)",
+                 len(resumable), len(lost))
+
+
+def _next_upload():
+    """Block until an upload whose campaign isn't busy is available."""
+    with _pool_cond:
+        while True:
+            for i, (upload_id, campaign_id) in enumerate(_pending):
+                if campaign_id not in _busy_campaigns:
+                    del _pending[i]
+                    _busy_campaigns.add(campaign_id)
+                    return upload_id, campaign_id
+            _pool_cond.wait()
+
+
+def _worker_loop() -> None:
+    while True:
+        upload_id, campaign_id = _next_upload()
+        try:
+            _process_upload_safe(upload_id, campaign_id)
+        except Exception as exc:
+            log.error("CRM upload worker: upload %s: %s", upload_id, exc)
+        finally:
+            with _pool_cond:
+                _busy_campaigns.discard(campaign_id)
+                _queued_ids.discard(upload_id)
+                _pool_cond.notify_all()
+
+
+def _process_upload_safe(upload_id: int, campaign_id: int) -> None:
     """Top-level wrapper — every exception path lands the upload row in a
     terminal state (COMPLETED or FAILED) so the polling client never sees
-    it hung in PROCESSING forever."""
+    it hung in PROCESSING forever. The spool row goes once that happens."""
     try:
-        _process_upload(upload_id, file_bytes, campaign_id)
+        attempts = _claim_spool(upload_id)
+        if attempts is None:
+            _mark_failed(upload_id, "Uploaded file is no longer available — please upload it again")
+        elif attempts > _MAX_UPLOAD_ATTEMPTS:
+            _mark_failed(upload_id, f"Upload abandoned after {_MAX_UPLOAD_ATTEMPTS} interrupted attempts")
+        else:
+            with _unspooled_file(upload_id) as file_stream:
+                _process_upload(upload_id, file_stream, campaign_id, attempts)
     except Exception as exc:
         log.error("CRM upload %s crashed: %s\n%s", upload_id, exc, traceback.format_exc())
         _mark_failed(upload_id, str(exc))
+    _drop_spool(upload_id)
 
 
-def _process_upload(upload_id: int, file_bytes: bytes, campaign_id: int) -> None:
+def _claim_spool(upload_id: int):
+    """Count one more attempt on the spooled file and return the attempt
+    count, or None when there's no spool row."""
+    conn = None
+    try:
+        conn = get_conn()
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE crm_upload_spool SET attempts = attempts + 1
+                WHERE upload_id = %s
+                RETURNING attempts
+                """,
+                (upload_id,),
+            )
+            row = cur.fetchone()
+        conn.commit()
+        return row[0] if row else None
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+@contextmanager
+def _unspooled_file(upload_id: int):
+    """Write the spooled upload out to an anonymous temp file and yield
+    it, rewound. Chunks come off a server-side cursor a few at a time, so
+    only ever a handful of them are in memory; the parser then reads the
+    file from disk. (A file object rather than a path: openpyxl refuses
+    paths without an Excel extension, and a spool can be a CSV.)"""
+    with tempfile.TemporaryFile(prefix=f"crm-upload-{upload_id}-") as fh:
+        conn = None
+        try:
+            conn = get_conn()
+            with conn.cursor() as cur:
+                # Spooled before chunking existed.
+                cur.execute(
+                    "SELECT file_bytes FROM crm_upload_spool "
+                    "WHERE upload_id = %s AND file_bytes IS NOT NULL",
+                    (upload_id,),
+                )
+                legacy = cur.fetchone()
+                if legacy:
+                    fh.write(legacy[0])
+            with conn.cursor(name=f"crm_unspool_{upload_id}") as cur:
+                cur.itersize = 4
+                cur.execute(
+                    "SELECT data FROM crm_upload_spool_chunks WHERE upload_id = %s ORDER BY seq",
+                    (upload_id,),
+                )
+                for (data,) in cur:
+                    fh.write(data)
+            conn.commit()
+        finally:
+            if conn is not None:
+                conn.close()
+        fh.seek(0)
+        yield fh
+
+
+def _drop_spool(upload_id: int) -> None:
+    conn = None
+    try:
+        conn = get_conn()
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM crm_upload_spool WHERE upload_id = %s", (upload_id,))
+        conn.commit()
+    except Exception as e:
+        # Harmless leftover: the upload is terminal, so recovery ignores it.
+        log.warning("Could not drop spool for upload %s: %s", upload_id, e)
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+def _process_upload(upload_id: int, file_stream, campaign_id: int, attempt: int = 1) -> None:
     # Move PENDING → PROCESSING so the status endpoint reflects work in
     # flight. A separate connection from the parse/insert connection isn't
     # needed — we commit between phases.
-    _set_status(upload_id, "PROCESSING")
-
     conn = None
     try:
         conn = get_conn()
+        progress = _UploadProgress(conn, upload_id, campaign_id,
+                                   Config.CRM_PROGRESS_INTERVAL_SECONDS)
 
         # ── Parse ────────────────────────────────────────────────────────
-        # The parser uses the same connection to look up admin-defined
-        # stage/sales-rep mappings. parse_crm_excel itself is read-only
-        # against the DB; we don't commit anything until after parsing.
-        parse_result = parse_crm_excel(
-            io.BytesIO(file_bytes), campaign_id=campaign_id, conn=conn
-        )
-        rows = parse_result["rows"]
-        warnings = list(parse_result["warnings"])
-        unmatched_reps = list(parse_result["unmatched_sales_reps"])
-        unmatched_stages = list(parse_result["unmatched_stages"])
-        total_rows_in_sheet = parse_result["total_rows_in_sheet"]
-
-        new_events = 0
-        duplicate_events = 0
-        leads_touched: set = set()
-
-        # ── Ingest row by row ────────────────────────────────────────────
-        # Each row is its own transaction (SAVEPOINT) so one malformed row
-        # can't poison the upload. The unique constraint on event_hash is
-        # the dedup mechanism — re-uploading the same sheet bumps
-        # duplicate_events, not new_events.
-        for row in rows:
-            try:
-                with conn.cursor() as cur:
-                    # 1. Get-or-create the lead.
-                    lead_id = _upsert_lead(cur, campaign_id, row)
-                    leads_touched.add(lead_id)
-
-                    # 2. Compute event_hash and try to insert.
-                    event_hash = compute_event_hash(
-                        campaign_id=campaign_id,
-                        mobile=row["mobile"],
-                        follow_date=row["follow_date"],
-                        raw_sales_rep=row["raw_sales_rep_name"],
-                        normalized_stage=row["normalized_stage"],
-                        comment=row["comment"],
-                    )
-
-                    cur.execute(
-                        """
-                        INSERT INTO lead_events (
-                            lead_id, campaign_id, sales_user_id,
-                            raw_sales_rep_name, raw_stage, normalized_stage,
-                            follow_date, comment,
-                            source_upload_id, source_row_number, event_hash
-                        )
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                        ON CONFLICT (event_hash) DO NOTHING
-                        RETURNING id
-                        """,
-                        (
-                            lead_id,
-                            campaign_id,
-                            row["sales_user_id"],
-                            row["raw_sales_rep_name"],
-                            row["raw_stage"],
-                            row["normalized_stage"],
-                            row["follow_date"],
-                            row["comment"],
-                            upload_id,
-                            row["row_number"],
-                            event_hash,
-                        ),
-                    )
-                    inserted = cur.fetchone()
-                    if inserted:
-                        new_events += 1
-                    else:
-                        duplicate_events += 1
-                conn.commit()
-            except Exception as row_exc:
-                # Rollback the bad row's work and keep going. The Postgres
-                # connection enters an aborted state on error, so the
-                # rollback is mandatory before the next row's INSERT.
-                conn.rollback()
-                warnings.append(
-                    f"Row {row.get('row_number')}: skipped — {type(row_exc).__name__}: {row_exc}"
-                )
-                log.warning("CRM upload %s, row %s skipped: %s",
-                            upload_id, row.get("row_number"), row_exc)
+        # The admin-defined stage/sales-rep mappings are read once from
+        # this connection into a snapshot the parser resolves against. Rows
+        # are pulled lazily by the ingest loop below, so parse and ingest
+        # interleave and the sheet is never held as a full list. The
+        # summary dict fills in as the generator runs and is final once
+        # the loop has drained it.
+        parse_summary = new_parse_summary()
+        progress.start(parse_summary)
+        rows = progress.timed_rows(_parsed_rows(file_stream, campaign_id, conn, parse_summary))
+        stats = _new_ingest_stats()
+        stats["progress"] = progress
+
+        # ── Ingest ───────────────────────────────────────────────────────
+        # "bulk" (default) stages each batch of rows in a temp table and
+        # lands leads + lead_events with a handful of set-based statements;
+        # "row" is the original one-transaction-per-row path. Both dedup
+        # on the event_hash unique constraint — re-uploading the same
+        # sheet bumps duplicate_events, not new_events.
+        if Config.CRM_INGEST_MODE == "row":
+            _ingest_row_by_row(conn, upload_id, campaign_id, rows, stats)
+        else:
+            _ingest_bulk(conn, upload_id, campaign_id, rows, stats,
+                         Config.CRM_INGEST_BATCH_ROWS)
+
+        if attempt > 1:
+            _claim_earlier_attempts(conn, upload_id, campaign_id, stats)
+        new_events = stats["new_events"]
+        duplicate_events = stats["duplicate_events"]
+        leads_touched = stats["leads_touched"]
+        total_leads = len(leads_touched | stats["leads_unchanged"])
+        ingest_warnings = stats["warnings"]
+
+        warnings = parse_summary["warnings"] + ingest_warnings
+        unmatched_reps = parse_summary["unmatched_sales_reps"]
+        unmatched_stages = parse_summary["unmatched_stages"]
+        total_rows_in_sheet = parse_summary["total_rows_in_sheet"]
+        progress.finish_ingest()
 
         # ── Recalc KPIs + Manager Intervention ──────────────────────────
         # Runs before the COMPLETED flip so the overview endpoint never
@@ -148,12 +565,33 @@ def _process_upload(upload_id: int, file_bytes: bytes, campaign_id: int) -> None
         # exception handler, which marks the upload FAILED — better than
         # leaving the user with a green "completed" toast on a sheet that
         # corrupted the dashboards.
+        #
+        # Incremental mode hands over the touched lead ids so only their
+        # assignments / flags / rollups are rebuilt; recalc_after_upload
+        # drops back to the full pass by itself when that isn't safe.
+        #
+        # An upload that landed nothing (every row already on file) has
+        # nothing to recalculate. A retry always runs the full pass: the
+        # attempt that died may have committed batches it never recalculated,
+        # and nothing else will pick them up.
+        recalc_started = time.perf_counter()
         try:
-            recalc_after_upload(campaign_id, conn)
+            if not leads_touched and new_events == 0:
+                recalc = {"mode": "skipped"}
+            elif Config.CRM_RECALC_MODE == "full" or attempt > 1:
+                recalc = recalc_after_upload(campaign_id, conn)
+            else:
+                recalc = recalc_after_upload(
+                    campaign_id, conn,
+                    lead_ids=leads_touched, upload_id=upload_id,
+                    max_fraction=Config.CRM_RECALC_FULL_FRACTION,
+                )
+            progress.recalc_ms = _ms_since(recalc_started)
+            log.info("CRM upload %s recalc (%s) — %s leads touched",
+                     upload_id, recalc["mode"], len(leads_touched))
         except Exception as recalc_exc:
-            warnings.append(
-                f"Recalc failed after ingest: {type(recalc_exc).__name__}: {recalc_exc}"
-            )
+            add_warning(warnings, "recalc_failed",
+                        detail=type(recalc_exc).__name__, example=recalc_exc)
             log.error("CRM upload %s recalc failed: %s\n%s",
                       upload_id, recalc_exc, traceback.format_exc())
             raise
@@ -172,25 +610,40 @@ def _process_upload(upload_id: int, file_bytes: bytes, campaign_id: int) -> None
                     unmatched_sales_reps= %s::jsonb,
                     unmatched_stages    = %s::jsonb,
                     warnings            = %s::jsonb,
+                    phase               = 'done',
+                    rows_processed      = %s,
+                    parse_ms            = %s,
+                    ingest_ms           = %s,
+                    recalc_ms           = %s,
+                    progress_at         = NOW(),
                     processed_at        = NOW()
                 WHERE id = %s
                 """,
                 (
                     total_rows_in_sheet,
-                    len(leads_touched),
+                    total_leads,
                     new_events + duplicate_events,
                     new_events,
                     duplicate_events,
                     json.dumps(unmatched_reps),
                     json.dumps(unmatched_stages),
                     json.dumps(warnings),
+                    total_rows_in_sheet,
+                    progress.parse_ms,
+                    progress.ingest_ms,
+                    progress.recalc_ms,
                     upload_id,
                 ),
             )
+            progress.phase = "done"
+            progress.notify(cur, "COMPLETED")
         conn.commit()
         log.info(
-            "✅ CRM upload %s COMPLETED — leads=%s new=%s dup=%s warnings=%s",
-            upload_id, len(leads_touched), new_events, duplicate_events, len(warnings),
+            "✅ CRM upload %s COMPLETED — leads=%s new=%s dup=%s warnings=%s "
+            "(parse %sms, ingest %sms, recalc %sms)",
+            upload_id, total_leads, new_events, duplicate_events,
+            sum(w["count"] for w in warnings),
+            progress.parse_ms, progress.ingest_ms, progress.recalc_ms,
         )
     except Exception:
         if conn is not None:
@@ -207,7 +660,497 @@ def _process_upload(upload_id: int, file_bytes: bytes, campaign_id: int) -> None
                 pass
 
 
-def _upsert_lead(cur, campaign_id: int, row: dict) -> int:
+def _claim_earlier_attempts(conn, upload_id: int, campaign_id: int, stats: dict) -> None:
+    """Fold what an interrupted earlier attempt of this upload landed into
+    `stats`. The precheck counted those rows as duplicates (their events
+    exist), which would report them wrong and, with nothing new, skip the
+    recalc the earlier attempt never got to run."""
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT lead_id, COUNT(*) FROM lead_events "
+            "WHERE campaign_id = %s AND source_upload_id = %s GROUP BY lead_id",
+            (campaign_id, upload_id),
+        )
+        landed = cur.fetchall()
+    conn.commit()
+    earlier = sum(n for _, n in landed) - stats["new_events"]
+    stats["new_events"] += earlier
+    stats["duplicate_events"] = max(stats["duplicate_events"] - earlier, 0)
+    stats["leads_touched"].update(lead_id for lead_id, _ in landed)
+
+
+def _new_ingest_stats() -> dict:
+    return {
+        "new_events": 0,
+        "duplicate_events": 0,
+        "leads_touched": set(),
+        # Leads of rows that were on file already: they count towards
+        # total_leads, but unless another row lands for them there's
+        # nothing of theirs to recalculate.
+        "leads_unchanged": set(),
+        "warnings": [],
+    }
+
+
+def _event_hash_for(campaign_id: int, row: ParsedRow) -> str:
+    return compute_event_hash(
+        campaign_id=campaign_id,
+        mobile=row.mobile,
+        follow_date=row.follow_date,
+        raw_sales_rep=row.raw_sales_rep_name,
+        normalized_stage=row.normalized_stage,
+        comment=row.comment,
+    )
+
+
+# ─── Existing-event pre-check ───────────────────────────────────────────
+#
+# A re-uploaded export is mostly events we already have. Rather than let
+# each of them go through the lead upsert and an INSERT that ends in ON
+# CONFLICT DO NOTHING, both ingest paths look the chunk's hashes up in
+# one `event_hash = ANY(...)` query (the unique index answers it) and
+# count the hits as duplicates straight away. The insert keeps its ON
+# CONFLICT for rows that land concurrently or repeat within the chunk.
+#
+# The one side effect a duplicate row used to have is backfilling an
+# empty client name on its lead; that is kept, as one UPDATE per chunk.
+
+_PRECHECK_ROWS = 1000
+
+
+def _split_existing(conn, campaign_id: int, rows: list, stats: dict) -> list:
+    """Count rows whose event_hash is already in lead_events as duplicates
+    and return the rest. Rows must carry their event_hash."""
+    with conn.cursor() as cur:
+        existing = _existing_hashes(cur, {r.event_hash for r in rows})
+        if not existing:
+            conn.commit()
+            return rows
+        known = [r for r in rows if r.event_hash in existing]
+        _backfill_client_names(cur, campaign_id, known)
+        cur.execute(
+            "SELECT id FROM leads WHERE campaign_id = %s AND mobile = ANY(%s)",
+            (campaign_id, list({r.mobile for r in known})),
+        )
+        stats["leads_unchanged"].update(r[0] for r in cur.fetchall())
+    conn.commit()
+    stats["duplicate_events"] += len(known)
+    return [r for r in rows if r.event_hash not in existing]
+
+
+def _existing_hashes(cur, hashes) -> set:
+    cur.execute(
+        "SELECT event_hash FROM lead_events WHERE event_hash = ANY(%s)",
+        (list(hashes),),
+    )
+    return {r[0] for r in cur.fetchall()}
+
+
+def _backfill_client_names(cur, campaign_id: int, rows: list) -> None:
+    # First named row per mobile (sheet order), as the lead upserts do.
+    names: dict = {}
+    for r in rows:
+        if r.client_name and r.mobile not in names:
+            names[r.mobile] = r.client_name
+    if not names:
+        return
+    psycopg2.extras.execute_values(
+        cur,
+        """
+        UPDATE leads AS l SET client_name = v.client_name, updated_at = NOW()
+        FROM (VALUES %s) AS v (campaign_id, mobile, client_name)
+        WHERE l.campaign_id = v.campaign_id AND l.mobile = v.mobile
+          AND (l.client_name IS NULL OR l.client_name = '')
+        """,
+        [(campaign_id, mobile, name) for mobile, name in names.items()],
+        template="(%s::int, %s, %s)",
+        page_size=len(names),
+    )
+
+
+# ─── Dry run ────────────────────────────────────────────────────────────
+#
+# POST …/upload?dry_run=1 runs the front half of an upload inside the
+# request: parse, resolve mappings, hash, and look the hashes up with the
+# same batched query as the pre-check. Nothing is written — the only
+# statements are SELECTs, and the endpoint rolls the connection back.
+
+_PREVIEW_SAMPLE_ROWS = 20
+
+
+def preview_upload(conn, campaign_id: int, file_stream, file_sha256: str) -> dict:
+    """What ingesting this file (a binary file object) would do. Raises
+    ValueError (from the parser) when the sheet has no usable header row.
+
+    Runs on a request thread, so it never queues for a parse process:
+    with none free, the sheet is parsed in-thread.
+    """
+    summary = new_parse_summary()
+    rows = iter(_parsed_rows(file_stream, campaign_id, conn, summary, wait=False))
+    new_events = duplicate_events = rejected = 0
+    seen: set = set()       # hashes earlier in this file
+    mobiles: set = set()
+    sample = []
+    with conn.cursor() as cur:
+        while True:
+            chunk = list(itertools.islice(rows, _PRECHECK_ROWS))
+            if not chunk:
+                break
+            staged = []
+            for row in chunk:
+                reason = _reject_reason(row)
+                if reason:
+                    rejected += 1
+                    add_warning(summary["warnings"], "rejected", row.row_number, detail=reason)
+                    continue
+                staged.append(row._replace(event_hash=_event_hash_for(campaign_id, row)))
+            existing = _existing_hashes(cur, {r.event_hash for r in staged}) if staged else set()
+            for row in staged:
+                duplicate = row.event_hash in existing or row.event_hash in seen
+                seen.add(row.event_hash)
+                mobiles.add(row.mobile)
+                if duplicate:
+                    duplicate_events += 1
+                else:
+                    new_events += 1
+                if len(sample) < _PREVIEW_SAMPLE_ROWS:
+                    sample.append(_preview_row(row, duplicate))
+
+        cur.execute(
+            "SELECT COUNT(*) FROM leads WHERE campaign_id = %s AND mobile = ANY(%s)",
+            (campaign_id, list(mobiles)),
+        )
+        known_leads = cur.fetchone()[0]
+        original = _find_identical_upload(cur, campaign_id, file_sha256)
+
+    return {
+        "dry_run": True,
+        "total_rows": summary["total_rows_in_sheet"],
+        "total_leads": len(mobiles),
+        "new_leads": len(mobiles) - known_leads,
+        "total_events": new_events + duplicate_events,
+        "new_events": new_events,
+        "duplicate_events": duplicate_events,
+        "rejected_rows": rejected,
+        "unmatched_sales_reps": summary["unmatched_sales_reps"],
+        "unmatched_stages": summary["unmatched_stages"],
+        "warnings": summary["warnings"],
+        "duplicate_of_upload_id": original[0] if original else None,
+        "sample": sample,
+    }
+
+
+def _parsed_rows(file_stream, campaign_id: int, conn, summary: dict, wait: bool = True):
+    """Rows of an upload, as iter_crm_excel yields them.
+
+    A file of at least CRM_PARSE_SUBPROCESS_MIN_BYTES is parsed in a child
+    process (iter_rows_in_subprocess) with the mapping snapshot loaded
+    here. Smaller files, CRM_PARSE_PROCESSES=0, and a wait=False caller
+    that finds every parse slot taken, parse in this thread.
+    """
+    resolver = MappingResolver.load(conn, campaign_id)
+    if Config.CRM_PARSE_PROCESSES > 0:
+        file_stream.seek(0, io.SEEK_END)
+        size = file_stream.tell()
+        file_stream.seek(0)
+        if size >= Config.CRM_PARSE_SUBPROCESS_MIN_BYTES:
+            rows = iter_rows_in_subprocess(file_stream, campaign_id, resolver, summary, wait=wait)
+            if rows is not None:
+                return rows
+    return iter_crm_excel(file_stream, campaign_id=campaign_id, conn=conn,
+                          summary=summary, resolver=resolver)
+
+
+def _preview_row(row: ParsedRow, duplicate: bool) -> dict:
+    return {
+        "row_number": row.row_number,
+        "client_name": row.client_name,
+        "mobile": row.mobile,
+        "raw_stage": row.raw_stage,
+        "normalized_stage": row.normalized_stage,
+        "raw_sales_rep_name": row.raw_sales_rep_name,
+        "sales_user_id": row.sales_user_id,
+        "follow_date": row.follow_date.isoformat() if row.follow_date else None,
+        "comment": row.comment,
+        "duplicate": duplicate,
+    }
+
+
+# ─── Row-by-row ingest ──────────────────────────────────────────────────
+
+def _ingest_row_by_row(conn, upload_id: int, campaign_id: int, rows, stats: dict) -> None:
+    """Original ingest path: each row is its own transaction so one
+    malformed row can't poison the upload. 3–4 round trips + a commit per
+    row; kept as CRM_INGEST_MODE=row and as the fallback the bulk path
+    uses to isolate a batch that fails as a whole. Rows whose event
+    already exists are weeded out _PRECHECK_ROWS at a time first."""
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, _PRECHECK_ROWS))
+        if not chunk:
+            return
+        chunk = [r if r.event_hash else r._replace(event_hash=_event_hash_for(campaign_id, r))
+                 for r in chunk]
+        fresh = _split_existing(conn, campaign_id, chunk, stats)
+        for row in fresh:
+            _ingest_one_row(conn, upload_id, campaign_id, row, stats)
+
+
+def _ingest_one_row(conn, upload_id: int, campaign_id: int, row: ParsedRow, stats: dict) -> None:
+    try:
+        with conn.cursor() as cur:
+            # 1. Get-or-create the lead.
+            lead_id = _upsert_lead(cur, campaign_id, row)
+            stats["leads_touched"].add(lead_id)
+
+            # 2. Try to insert the event (hash computed with its chunk).
+            cur.execute(
+                f"""
+                INSERT INTO lead_events (
+                    lead_id, campaign_id, sales_user_id,
+                    raw_sales_rep_name, raw_sales_rep_key,
+                    raw_stage, normalized_stage,
+                    follow_date, comment,
+                    source_upload_id, source_row_number, event_hash
+                )
+                VALUES (%s, %s, %s, %s, {sales_rep_key_sql("%s")},
+                        %s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (event_hash) DO NOTHING
+                RETURNING id
+                """,
+                (
+                    lead_id,
+                    campaign_id,
+                    row.sales_user_id,
+                    row.raw_sales_rep_name,
+                    row.raw_sales_rep_name,
+                    row.raw_stage,
+                    row.normalized_stage,
+                    row.follow_date,
+                    row.comment,
+                    upload_id,
+                    row.row_number,
+                    row.event_hash,
+                ),
+            )
+            inserted = cur.fetchone()
+            if inserted:
+                bump_daily_activity(
+                    cur, campaign_id,
+                    [(row.follow_date, row.normalized_stage)],
+                )
+                bump_lead_state(
+                    cur, campaign_id,
+                    [(inserted[0], lead_id, row.follow_date,
+                      row.normalized_stage, row.sales_user_id)],
+                )
+                stats["new_events"] += 1
+            else:
+                stats["duplicate_events"] += 1
+        conn.commit()
+        _tick(stats)
+    except Exception as row_exc:
+        # Rollback the bad row's work and keep going. The Postgres
+        # connection enters an aborted state on error, so the
+        # rollback is mandatory before the next row's INSERT.
+        conn.rollback()
+        add_warning(stats["warnings"], "skipped", row.row_number,
+                    detail=type(row_exc).__name__, example=row_exc)
+        log.warning("CRM upload %s, row %s skipped: %s",
+                    upload_id, row.row_number, row_exc)
+
+
+# ─── Bulk (set-based) ingest ────────────────────────────────────────────
+#
+# Per batch of parsed rows:
+#   1. Python-side validation sends rows that can't possibly land (see
+#      _reject_reason) to the reject list — no savepoint, no round trip.
+#      Rows whose event already exists are counted as duplicates by the
+#      pre-check above and go no further.
+#   2. COPY the rest into a session-local temp table.
+#   3. INSERT … ON CONFLICT (campaign_id, mobile) creates missing leads
+#      and backfills empty client names. Because the conflict is resolved
+#      by Postgres, two uploads racing on the same campaign can no longer
+#      both miss the SELECT in _upsert_lead and lose rows to a unique
+#      violation.
+#   4. INSERT … SELECT … ON CONFLICT (event_hash) DO NOTHING RETURNING
+#      lands the events; len(RETURNING) is new_events. The returned rows
+#      are rolled into lead_events_daily and lead_state.
+#   5. COMMIT — the temp table is ON COMMIT DELETE ROWS, so it's empty
+#      for the next batch.
+#
+# If a batch fails as a whole (e.g. a sales_user_id whose user was deleted
+# mid-upload trips the FK), it is rolled back and replayed through
+# _ingest_row_by_row so the offending row is isolated and the rest land.
+
+_STAGE_TABLE = "crm_ingest_stage"
+
+_STAGE_COLUMNS = (
+    "row_number", "client_name", "mobile", "sales_user_id",
+    "raw_sales_rep_name", "raw_stage", "normalized_stage",
+    "follow_date", "comment", "event_hash",
+)
+
+# Column widths from the lead_events DDL in app/database.py.
+_MAX_STAGE_TOKEN_LEN = 40
+
+
+def _reject_reason(row: ParsedRow):
+    """Why a parsed row can't be ingested, or None if it's fine."""
+    if not row.mobile:
+        return "no mobile"
+    stage = row.normalized_stage
+    if stage is not None and len(stage) > _MAX_STAGE_TOKEN_LEN:
+        return f"normalized stage longer than {_MAX_STAGE_TOKEN_LEN} characters"
+    return None
+
+
+def _copy_buffer(staged: list) -> io.StringIO:
+    """Serialise staged rows as CSV for COPY … FROM STDIN (FORMAT csv).
+
+    None → unquoted empty field → NULL. Empty strings also become NULL,
+    which matches the row path (the parser already maps blank cells to
+    None, and _upsert_lead writes `client_name or None`).
+    """
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    for row in staged:
+        writer.writerow([
+            row.row_number,
+            row.client_name or None,
+            row.mobile,
+            row.sales_user_id,
+            row.raw_sales_rep_name,
+            row.raw_stage,
+            row.normalized_stage,
+            row.follow_date.isoformat(sep=" ") if row.follow_date else None,
+            row.comment,
+            row.event_hash,
+        ])
+    buf.seek(0)
+    return buf
+
+
+def _ingest_bulk(conn, upload_id: int, campaign_id: int, rows, stats: dict,
+                 batch_rows: int) -> None:
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, batch_rows))
+        if not batch:
+            return
+        staged = []
+        for row in batch:
+            reason = _reject_reason(row)
+            if reason:
+                add_warning(stats["warnings"], "rejected", row.row_number, detail=reason)
+                continue
+            staged.append(row._replace(event_hash=_event_hash_for(campaign_id, row)))
+        if staged:
+            staged = _split_existing(conn, campaign_id, staged, stats)
+        if not staged:
+            _tick(stats)
+            continue
+        try:
+            _ingest_batch(conn, upload_id, campaign_id, staged, stats)
+        except Exception as batch_exc:
+            conn.rollback()
+            log.warning("CRM upload %s: bulk batch of %d rows failed (%s); "
+                        "replaying row by row", upload_id, len(staged), batch_exc)
+            _ingest_row_by_row(conn, upload_id, campaign_id, staged, stats)
+        _tick(stats)
+
+
+def _ingest_batch(conn, upload_id: int, campaign_id: int, staged: list, stats: dict) -> None:
+    """Land one validated batch. Counters are only bumped after COMMIT so a
+    failed batch replayed row by row isn't double-counted."""
+    with conn.cursor() as cur:
+        cur.execute(
+            f"""
+            CREATE TEMP TABLE IF NOT EXISTS {_STAGE_TABLE} (
+                row_number          INTEGER,
+                client_name         TEXT,
+                mobile              TEXT NOT NULL,
+                sales_user_id       INTEGER,
+                raw_sales_rep_name  TEXT,
+                raw_stage           TEXT,
+                normalized_stage    VARCHAR(40),
+                follow_date         TIMESTAMP,
+                comment             TEXT,
+                event_hash          VARCHAR(64)
+            ) ON COMMIT DELETE ROWS
+            """
+        )
+        cur.copy_expert(
+            f"COPY {_STAGE_TABLE} ({', '.join(_STAGE_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            _copy_buffer(staged),
+        )
+
+        # One candidate per mobile: the first row (sheet order) that
+        # carries a client name, so new leads get the same name the row
+        # path would have ended up with. DO UPDATE only fires to backfill
+        # an empty name on an existing lead.
+        cur.execute(
+            f"""
+            INSERT INTO leads (campaign_id, client_name, mobile)
+            SELECT DISTINCT ON (s.mobile) %s, s.client_name, s.mobile
+            FROM {_STAGE_TABLE} s
+            ORDER BY s.mobile, (s.client_name IS NULL), s.row_number
+            ON CONFLICT (campaign_id, mobile) DO UPDATE SET
+                client_name = EXCLUDED.client_name,
+                updated_at  = NOW()
+            WHERE (leads.client_name IS NULL OR leads.client_name = '')
+              AND EXCLUDED.client_name IS NOT NULL
+            """,
+            (campaign_id,),
+        )
+
+        cur.execute(
+            f"""
+            SELECT DISTINCT l.id
+            FROM {_STAGE_TABLE} s
+            JOIN leads l ON l.campaign_id = %s AND l.mobile = s.mobile
+            """,
+            (campaign_id,),
+        )
+        lead_ids = [r[0] for r in cur.fetchall()]
+
+        cur.execute(
+            f"""
+            INSERT INTO lead_events (
+                lead_id, campaign_id, sales_user_id,
+                raw_sales_rep_name, raw_sales_rep_key,
+                raw_stage, normalized_stage,
+                follow_date, comment,
+                source_upload_id, source_row_number, event_hash
+            )
+            SELECT l.id, %s, s.sales_user_id,
+                   s.raw_sales_rep_name, {sales_rep_key_sql("s.raw_sales_rep_name")},
+                   s.raw_stage, s.normalized_stage,
+                   s.follow_date, s.comment,
+                   %s, s.row_number, s.event_hash
+            FROM {_STAGE_TABLE} s
+            JOIN leads l ON l.campaign_id = %s AND l.mobile = s.mobile
+            ORDER BY s.row_number
+            ON CONFLICT (event_hash) DO NOTHING
+            RETURNING id, lead_id, follow_date, normalized_stage, sales_user_id
+            """,
+            (campaign_id, upload_id, campaign_id),
+        )
+        new_rows = cur.fetchall()
+        inserted = len(new_rows)
+
+        # Roll the new events into lead_events_daily and lead_state in the
+        # same transaction, so neither ever sees half a batch.
+        bump_daily_activity(cur, campaign_id, [(r[2], r[3]) for r in new_rows])
+        bump_lead_state(cur, campaign_id, new_rows)
+    conn.commit()
+
+    stats["new_events"] += inserted
+    stats["duplicate_events"] += len(staged) - inserted
+    stats["leads_touched"].update(lead_ids)
+
+
+def _upsert_lead(cur, campaign_id: int, row: ParsedRow) -> int:
     """Find the lead row for (campaign, mobile) or create it. Returns id.
 
     If the lead already exists with an empty client_name and this row
@@ -216,15 +1159,15 @@ def _upsert_lead(cur, campaign_id: int, row: dict) -> int:
     """
     cur.execute(
         "SELECT id, client_name FROM leads WHERE campaign_id = %s AND mobile = %s",
-        (campaign_id, row["mobile"]),
+        (campaign_id, row.mobile),
     )
     existing = cur.fetchone()
     if existing:
         lead_id, existing_name = existing
-        if (not existing_name) and row["client_name"]:
+        if (not existing_name) and row.client_name:
             cur.execute(
                 "UPDATE leads SET client_name = %s, updated_at = NOW() WHERE id = %s",
-                (row["client_name"], lead_id),
+                (row.client_name, lead_id),
             )
         return lead_id
 
@@ -234,29 +1177,182 @@ def _upsert_lead(cur, campaign_id: int, row: dict) -> int:
         VALUES (%s, %s, %s)
         RETURNING id
         """,
-        (campaign_id, row["client_name"] or None, row["mobile"]),
+        (campaign_id, row.client_name or None, row.mobile),
     )
     return cur.fetchone()[0]
 
 
-# ─── Status helpers ─────────────────────────────────────────────────────
+# ─── Live progress ──────────────────────────────────────────────────────
+#
+# The status endpoint reports phase, rows_processed / rows_total and the
+# per-phase timings, and derives rows/s + ETA from them. The worker writes
+# them at most once per CRM_PROGRESS_INTERVAL_SECONDS, on its own
+# connection and only between transactions (after a batch or row commit),
+# so a progress write never rides along in work that may be rolled back.
+# Every write also goes out as an `upload` event (app/crm_events.py) for
+# clients on the live stream.
+#
+# parse and ingest interleave (rows stream out of the parser into the
+# ingest batches), so parse_ms is the time spent inside the row generator
+# and ingest_ms is the rest of the ingest loop's wall time.
 
-def _set_status(upload_id: int, status: str) -> None:
-    conn = None
-    try:
-        conn = get_conn()
-        with conn.cursor() as cur:
+class _UploadProgress:
+    def __init__(self, conn, upload_id: int, campaign_id: int, interval: float):
+        self.conn = conn
+        self.upload_id = upload_id
+        self.campaign_id = campaign_id
+        self.interval = interval
+        self.phase = None
+        self.summary: dict = {}
+        self.parse_ms = None
+        self.ingest_ms = None
+        self.recalc_ms = None
+        self._parse_s = 0.0
+        self._ingest_started = None
+        self._last_write = 0.0
+
+    def start(self, summary: dict) -> None:
+        """PENDING → PROCESSING, and reset the counters a previous
+        (interrupted) attempt may have left behind."""
+        self.summary = summary
+        self.phase = "parsing"
+        self._ingest_started = time.perf_counter()
+        with self.conn.cursor() as cur:
             cur.execute(
-                "UPDATE crm_report_uploads SET status = %s WHERE id = %s",
-                (status, upload_id),
+                """
+                UPDATE crm_report_uploads SET
+                    status = 'PROCESSING', phase = %s,
+                    rows_processed = 0, rows_total = NULL,
+                    parse_ms = NULL, ingest_ms = NULL, recalc_ms = NULL,
+                    started_at = NOW(), progress_at = NOW()
+                WHERE id = %s
+                """,
+                (self.phase, self.upload_id),
             )
-        conn.commit()
-    except Exception as e:
-        log.error("Failed to mark upload %s as %s: %s", upload_id, status, e)
-    finally:
-        if conn is not None:
-            conn.close()
+            self.notify(cur, "PROCESSING")
+        self.conn.commit()
+        self._last_write = time.monotonic()
 
+    def timed_rows(self, rows):
+        """Pass rows through, timing the parser and switching the phase
+        to "ingesting" once the first row is out."""
+        it = iter(rows)
+        while True:
+            t0 = time.perf_counter()
+            try:
+                row = next(it)
+            except StopIteration:
+                self._parse_s += time.perf_counter() - t0
+                return
+            self._parse_s += time.perf_counter() - t0
+            if self.phase == "parsing":
+                self.phase = "ingesting"
+                self.write()
+            yield row
+
+    def tick(self) -> None:
+        if time.monotonic() - self._last_write >= self.interval:
+            self.write()
+
+    def finish_ingest(self) -> None:
+        self._update_timings()
+        self.phase = "recalculating"
+        self.write()
+
+    def _update_timings(self) -> None:
+        total_ms = _ms_since(self._ingest_started)
+        self.parse_ms = int(self._parse_s * 1000)
+        self.ingest_ms = max(0, total_ms - self.parse_ms)
+
+    def write(self) -> None:
+        if self.phase in ("parsing", "ingesting"):
+            self._update_timings()
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE crm_report_uploads SET
+                        phase = %s, rows_processed = %s, rows_total = %s,
+                        parse_ms = %s, ingest_ms = %s, recalc_ms = %s,
+                        progress_at = NOW()
+                    WHERE id = %s
+                    """,
+                    (
+                        self.phase,
+                        self.summary.get("total_rows_in_sheet", 0),
+                        self.summary.get("rows_estimate"),
+                        self.parse_ms, self.ingest_ms, self.recalc_ms,
+                        self.upload_id,
+                    ),
+                )
+                self.notify(cur, "PROCESSING")
+            self.conn.commit()
+        except Exception as e:
+            # Progress is cosmetic — never fail an upload over it.
+            log.debug("progress write for upload %s failed: %s", self.upload_id, e)
+            try:
+                self.conn.rollback()
+            except Exception:
+                pass
+        self._last_write = time.monotonic()
+
+    def notify(self, cur, status: str) -> None:
+        """Push the state just written to the live event stream."""
+        _notify_upload(
+            cur, self.upload_id, self.campaign_id, status,
+            phase=self.phase,
+            rows_processed=self.summary.get("total_rows_in_sheet", 0),
+            rows_total=self.summary.get("rows_estimate"),
+            parse_ms=self.parse_ms, ingest_ms=self.ingest_ms,
+        )
+
+
+def _notify_upload(cur, upload_id: int, campaign_id: int, status: str, phase=None,
+                   rows_processed=0, rows_total=None, parse_ms=None, ingest_ms=None) -> None:
+    """`upload` event for app/crm_events.py — the same progress fields the
+    status endpoint returns, so the modal renders it without a query."""
+    rate, eta = upload_rate_and_eta(phase, rows_processed, rows_total, parse_ms, ingest_ms)
+    notify(cur, EVENT_UPLOAD, {
+        "upload_id": upload_id,
+        "campaign_id": campaign_id,
+        "status": status,
+        "phase": phase,
+        "rows_processed": rows_processed,
+        "rows_total": rows_total,
+        "rows_per_second": rate,
+        "eta_seconds": eta,
+    })
+
+
+def _tick(stats: dict) -> None:
+    progress = stats.get("progress")
+    if progress is not None:
+        progress.tick()
+
+
+def _ms_since(t0: float) -> int:
+    return int((time.perf_counter() - t0) * 1000)
+
+
+def upload_rate_and_eta(phase, rows_processed, rows_total, parse_ms, ingest_ms):
+    """(rows_per_second, eta_seconds) for the upload status endpoint.
+
+    The rate is rows read over parse + ingest time, so it stays meaningful
+    after the upload has finished (it's the ingest throughput on record).
+    The ETA covers the row phases only and is None once they're over, or
+    when the sheet didn't declare how many rows it has.
+    """
+    elapsed_ms = (parse_ms or 0) + (ingest_ms or 0)
+    if not rows_processed or elapsed_ms <= 0:
+        return None, None
+    rate = rows_processed * 1000.0 / elapsed_ms
+    eta = None
+    if phase in ("parsing", "ingesting") and rows_total:
+        eta = max(0, round((rows_total - rows_processed) / rate))
+    return round(rate, 1), eta
+
+
+# ─── Status helpers ─────────────────────────────────────────────────────
 
 def _mark_failed(upload_id: int, message: str) -> None:
     conn = None
@@ -270,9 +1366,13 @@ def _mark_failed(upload_id: int, message: str) -> None:
                     error_message = %s,
                     processed_at  = NOW()
                 WHERE id = %s
+                RETURNING campaign_id
                 """,
                 (message[:2000] if message else "unknown error", upload_id),
             )
+            row = cur.fetchone()
+            if row:
+                _notify_upload(cur, upload_id, row[0], "FAILED")
         conn.commit()
     except Exception as e:
         log.error("Could not even mark upload %s FAILED: %s", upload_id, e)
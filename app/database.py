@@ -5,38 +5,202 @@ Extended schema with Finance, HR, Teams, and more roles
 import logging
 import threading
 import time
+from collections import deque
+
 import psycopg2
 import psycopg2.extras
 import psycopg2.pool
+from flask import g, has_request_context
 from config import Config
 
 log = logging.getLogger(__name__)
 
 _POOL = None
 _POOL_LOCK = threading.Lock()
-_POOL_MIN = 1
-_POOL_MAX = 10
+
+# TCP keepalives so a connection the network silently dropped (proxy idle
+# timeout, server failover) errors out instead of hanging on its next use.
+_KEEPALIVE_KWARGS = {
+    "keepalives": 1,
+    "keepalives_idle": 30,
+    "keepalives_interval": 10,
+    "keepalives_count": 3,
+}
+
+
+def _connect_kwargs() -> dict:
+    if Config.DATABASE_URL:
+        return {"dsn": Config.DATABASE_URL, "connect_timeout": 10, **_KEEPALIVE_KWARGS}
+    return {
+        "host": Config.DB_HOST,
+        "port": Config.DB_PORT,
+        "database": Config.DB_NAME,
+        "user": Config.DB_USER,
+        "password": Config.DB_PASSWORD,
+        "connect_timeout": 10,
+        **_KEEPALIVE_KWARGS,
+    }
+
+
+class _Pool:
+    """Thread-safe connection pool.
+
+    - At most `maxconn` connections are out at once. A checkout that finds
+      them all in use queues (first come, first served) for up to
+      `wait_seconds`; with `max_waiters` already queued it fails at once.
+      Both failures raise psycopg2.pool.PoolError.
+    - Idle connections are reused most-recently-returned first. Only one
+      idle for `validate_idle_seconds` or more gets a SELECT 1 before it
+      is handed out; a connection that fails it is dropped and the next
+      one tried, or a new one opened.
+    - stats() reports the counters behind the admin pool endpoint.
+    """
+
+    def __init__(self, minconn, maxconn, connect, *, wait_seconds,
+                 max_waiters, validate_idle_seconds):
+        self.minconn = max(0, minconn)
+        self.maxconn = max(1, maxconn, self.minconn)
+        self._connect = connect
+        self._wait_seconds = wait_seconds
+        self._max_waiters = max_waiters
+        self._validate_idle_seconds = validate_idle_seconds
+        self._cond = threading.Condition()
+        self._idle = []  # (conn, returned_at monotonic), most recent last
+        self._in_use = 0
+        self._waiters = deque()
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_ms_total": 0.0,
+            "wait_ms_max": 0.0,
+            "stale_drops": 0,
+            "exhausted": 0,
+            "timeouts": 0,
+            "rejected": 0,
+        }
+        for _ in range(self.minconn):
+            self._idle.append((connect(), time.monotonic()))
+
+    def getconn(self):
+        self._acquire_slot()
+        try:
+            return self._take_conn()
+        except Exception:
+            self._release_slot()
+            raise
+
+    def putconn(self, conn, close=False):
+        if close or conn.closed:
+            try:
+                conn.close()
+            except Exception:
+                pass
+            entry = None
+        else:
+            entry = (conn, time.monotonic())
+        with self._cond:
+            if entry is not None:
+                self._idle.append(entry)
+            self._in_use -= 1
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            out = dict(self._stats)
+            out.update(
+                min=self.minconn,
+                max=self.maxconn,
+                in_use=self._in_use,
+                idle=len(self._idle),
+                waiting=len(self._waiters),
+            )
+        out["wait_ms_total"] = round(out["wait_ms_total"], 1)
+        out["wait_ms_max"] = round(out["wait_ms_max"], 1)
+        return out
+
+    def _acquire_slot(self):
+        start = time.monotonic()
+        with self._cond:
+            self._stats["checkouts"] += 1
+            if self._in_use < self.maxconn and not self._waiters:
+                self._in_use += 1
+                return
+            self._stats["exhausted"] += 1
+            if len(self._waiters) >= self._max_waiters:
+                self._stats["rejected"] += 1
+                raise psycopg2.pool.PoolError(
+                    f"connection pool exhausted ({len(self._waiters)} already waiting)"
+                )
+            ticket = object()
+            self._waiters.append(ticket)
+            deadline = start + self._wait_seconds
+            try:
+                while self._waiters[0] is not ticket or self._in_use >= self.maxconn:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise psycopg2.pool.PoolError(
+                            f"no database connection free after {self._wait_seconds:g}s"
+                        )
+                    self._cond.wait(remaining)
+            finally:
+                self._waiters.remove(ticket)
+                # Whoever is now at the head of the queue gets to re-check.
+                self._cond.notify_all()
+            self._in_use += 1
+            waited_ms = (time.monotonic() - start) * 1000
+            self._stats["waits"] += 1
+            self._stats["wait_ms_total"] += waited_ms
+            self._stats["wait_ms_max"] = max(self._stats["wait_ms_max"], waited_ms)
+
+    def _release_slot(self):
+        with self._cond:
+            self._in_use -= 1
+            self._cond.notify_all()
+
+    def _take_conn(self):
+        while True:
+            with self._cond:
+                entry = self._idle.pop() if self._idle else None
+            if entry is None:
+                return self._connect()
+            conn, returned_at = entry
+            if not conn.closed:
+                if time.monotonic() - returned_at < self._validate_idle_seconds:
+                    return conn
+                try:
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT 1")
+                    conn.rollback()
+                    return conn
+                except Exception:
+                    pass
+            try:
+                conn.close()
+            except Exception:
+                pass
+            with self._cond:
+                self._stats["stale_drops"] += 1
 
 
 def _build_pool():
     """Create the connection pool. Threaded so Flask + Gunicorn workers are safe."""
-    if Config.DATABASE_URL:
-        return psycopg2.pool.ThreadedConnectionPool(
-            _POOL_MIN, _POOL_MAX,
-            dsn=Config.DATABASE_URL,
-            connect_timeout=10,
-        )
-    return psycopg2.pool.ThreadedConnectionPool(
-        _POOL_MIN, _POOL_MAX,
-        host=Config.DB_HOST,
-        port=Config.DB_PORT,
-        database=Config.DB_NAME,
-        user=Config.DB_USER,
-        password=Config.DB_PASSWORD,
-        connect_timeout=10,
+    return _Pool(
+        Config.DB_POOL_MIN, Config.DB_POOL_MAX,
+        lambda: psycopg2.connect(**_connect_kwargs()),
+        wait_seconds=Config.DB_POOL_WAIT_SECONDS,
+        max_waiters=Config.DB_POOL_MAX_WAITERS,
+        validate_idle_seconds=Config.DB_POOL_VALIDATE_IDLE_SECONDS,
     )
 
 
+def connect_direct():
+    """A plain connection outside the pool, for holders that keep it for
+    the life of the process (the LISTEN thread in app/crm_events.py) and
+    would otherwise pin one of the pool's slots forever. Caller closes it."""
+    return psycopg2.connect(**_connect_kwargs())
+
+
 def _get_pool():
     global _POOL
     if _POOL is not None:
@@ -95,26 +259,27 @@ class _PooledConnection:
 
 
 def get_conn(retries=2):
-    """Return a pooled connection. .close() returns it to the pool."""
+    """Return a pooled connection. .close() returns it to the pool.
+
+    Inside a request every caller — the before_request hooks,
+    current_user(), the view, audit_query — shares one connection,
+    checked out on first use and returned by release_request_conn() at
+    teardown; see _RequestBorrow for what .close() does then.
+    """
+    if has_request_context():
+        return _borrow_request_conn(retries)
+    return _checkout(retries)
+
+
+def _checkout(retries):
     pool = _get_pool()
     last_err = None
     for attempt in range(retries + 1):
         try:
-            raw = pool.getconn()
-            # Liveness check: pooled connections can go stale (server restart,
-            # idle-timeout). A cheap SELECT 1 catches it before the caller does.
-            try:
-                with raw.cursor() as cur:
-                    cur.execute("SELECT 1")
-                raw.commit()
-            except Exception:
-                try:
-                    pool.putconn(raw, close=True)
-                except Exception:
-                    pass
-                raise psycopg2.OperationalError("stale pooled connection")
-            return _PooledConnection(raw, pool)
+            return _PooledConnection(pool.getconn(), pool)
         except psycopg2.OperationalError as e:
+            # Stale pooled connections are dropped inside the pool; this is
+            # a new connection failing to open (database restarting).
             last_err = e
             if attempt < retries:
                 time.sleep(1)
@@ -123,6 +288,80 @@ def get_conn(retries=2):
     raise last_err
 
 
+def pool_stats() -> dict:
+    """Counters for the connection pool — see _Pool."""
+    return _get_pool().stats()
+
+
+class _RequestConn:
+    """The request's checked-out connection and how many borrows are open."""
+
+    def __init__(self, pooled):
+        self.pooled = pooled
+        self.borrows = 0
+
+
+class _RequestBorrow:
+    """What get_conn() hands out inside a request: one borrow of the
+    shared connection.
+
+    close() keeps the old pool semantics for the common sequential case
+    — when the last open borrow closes, uncommitted work is rolled back,
+    just as returning the connection to the pool used to do — but leaves
+    the connection checked out for the next caller. A borrow taken while
+    another is open (a helper called from a view) shares its
+    transaction, so its close() rolls nothing back.
+    """
+
+    def __init__(self, shared):
+        self.__dict__["_shared"] = shared
+        self.__dict__["_returned"] = False
+        shared.borrows += 1
+
+    def close(self):
+        if self.__dict__["_returned"]:
+            return
+        self.__dict__["_returned"] = True
+        shared = self.__dict__["_shared"]
+        shared.borrows -= 1
+        if shared.borrows == 0:
+            try:
+                shared.pooled.rollback()
+            except Exception:
+                pass
+
+    def __getattr__(self, name):
+        return getattr(self.__dict__["_shared"].pooled, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.__dict__["_shared"].pooled, name, value)
+
+    def __enter__(self):
+        return self.__dict__["_shared"].pooled.__enter__()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return self.__dict__["_shared"].pooled.__exit__(exc_type, exc_val, exc_tb)
+
+
+def _borrow_request_conn(retries):
+    shared = g.get("_db_conn")
+    if shared is not None and shared.borrows == 0 and shared.pooled.closed:
+        # The server dropped it since the last borrow; start over.
+        release_request_conn()
+        shared = None
+    if shared is None:
+        shared = _RequestConn(_checkout(retries))
+        g._db_conn = shared
+    return _RequestBorrow(shared)
+
+
+def release_request_conn(exc=None):
+    """Return the request's connection to the pool (teardown_request)."""
+    shared = g.pop("_db_conn", None)
+    if shared is not None:
+        shared.pooled.close()
+
+
 def table_exists(conn, table_name: str) -> bool:
     with conn.cursor() as cur:
         cur.execute("""
@@ -145,6 +384,26 @@ def column_exists(conn, table_name: str, column_name: str) -> bool:
         return cur.fetchone()[0]
 
 
+def backfill_campaigns(conn, what: str, pending_sql: str, rebuild) -> int:
+    """Run rebuild(campaign_id, conn) for every campaign pending_sql lists.
+
+    For derived tables that are built per campaign the first time they
+    exist. Each rebuild commits on its own and pending_sql must only list
+    campaigns still missing their rows, so a boot cut short (e.g. by the
+    gunicorn timeout) resumes with the campaigns it hadn't reached
+    instead of leaving them empty for good. Returns campaigns rebuilt.
+    """
+    with conn.cursor() as cur:
+        cur.execute(pending_sql)
+        campaign_ids = [r[0] for r in cur.fetchall()]
+    conn.commit()
+    for cid in campaign_ids:
+        rebuild(cid, conn)
+    if campaign_ids:
+        log.info("📦 Backfilled %s for %d campaign(s)", what, len(campaign_ids))
+    return len(campaign_ids)
+
+
 def init_all_tables():
     """Create all tables + migrate existing ones."""
     conn = None
@@ -214,9 +473,16 @@ def init_all_tables():
                 # dependency. The auth endpoint caps the size to keep the row
                 # size sane.
                 ("avatar_url", "ALTER TABLE users ADD COLUMN IF NOT EXISTS avatar_url TEXT"),
+                # avatar_hash versions the picture: listings hand out
+                # /api/avatars/<id>?v=<hash prefix> instead of the data URL
+                # (app/util/avatars.py) and the avatar endpoint uses it as
+                # the ETag.
+                ("avatar_hash", "ALTER TABLE users ADD COLUMN IF NOT EXISTS avatar_hash TEXT "
+                                "GENERATED ALWAYS AS (md5(avatar_url)) STORED"),
                 # last_seen powers the Online/Offline status in the admin UI.
-                # Updated on every authenticated request via a before_request
-                # hook in app/__init__.py, throttled to ~once per 30 seconds.
+                # Noted on every authenticated request by a before_request
+                # hook in app/__init__.py and written in batches by
+                # app/last_seen.py every LAST_SEEN_FLUSH_SECONDS.
                 ("last_seen", "ALTER TABLE users ADD COLUMN IF NOT EXISTS last_seen TIMESTAMP"),
                 # approval_status drives the self-signup → admin-approval flow.
                 # Existing rows default to 'approved'; new self-registrations
@@ -629,6 +895,99 @@ def init_all_tables():
                     "ON crm_report_uploads(campaign_id, created_at DESC);"
                 )
 
+                # Live progress + per-phase timings, written by the upload
+                # worker (crm_processor._UploadProgress). phase is one of
+                # parsing / ingesting / recalculating / done; rows_total is
+                # the sheet's declared row count and may stay NULL. The
+                # timings are kept after completion as the campaign's
+                # ingest performance history.
+                for col, ddl in [
+                    ("phase", "ALTER TABLE crm_report_uploads ADD COLUMN IF NOT EXISTS phase VARCHAR(20)"),
+                    ("rows_processed", "ALTER TABLE crm_report_uploads ADD COLUMN IF NOT EXISTS rows_processed INTEGER DEFAULT 0"),
+                    ("rows_total", "ALTER TABLE crm_report_uploads ADD COLUMN IF NOT EXISTS rows_total INTEGER"),
+                    ("parse_ms", "ALTER TABLE crm_report_uploads ADD COLUMN IF NOT EXISTS parse_ms INTEGER"),
+                    ("ingest_ms", "ALTER TABLE crm_report_uploads ADD COLUMN IF NOT EXISTS ingest_ms INTEGER"),
+                    ("recalc_ms", "ALTER TABLE crm_report_uploads ADD COLUMN IF NOT EXISTS recalc_ms INTEGER"),
+                    ("started_at", "ALTER TABLE crm_report_uploads ADD COLUMN IF NOT EXISTS started_at TIMESTAMP"),
+                    ("progress_at", "ALTER TABLE crm_report_uploads ADD COLUMN IF NOT EXISTS progress_at TIMESTAMP"),
+                ]:
+                    if not column_exists(conn, "crm_report_uploads", col):
+                        cur.execute(ddl)
+
+                # SHA-256 of the uploaded bytes. A byte-identical re-upload
+                # for the same campaign is recorded straight away as a
+                # duplicate of the earlier COMPLETED upload instead of
+                # being parsed again.
+                for col, ddl in [
+                    ("file_sha256", "ALTER TABLE crm_report_uploads ADD COLUMN IF NOT EXISTS file_sha256 VARCHAR(64)"),
+                    ("duplicate_of_upload_id", "ALTER TABLE crm_report_uploads ADD COLUMN IF NOT EXISTS duplicate_of_upload_id INTEGER REFERENCES crm_report_uploads(id) ON DELETE SET NULL"),
+                ]:
+                    if not column_exists(conn, "crm_report_uploads", col):
+                        cur.execute(ddl)
+                cur.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_crm_uploads_file_sha256
+                    ON crm_report_uploads(campaign_id, file_sha256)
+                    WHERE status = 'COMPLETED'
+                """)
+
+                # crm_upload_spool — the uploaded file, kept only until its
+                # upload is COMPLETED or FAILED. Lets a restarted process
+                # resume PENDING / PROCESSING uploads (crm_processor
+                # .start_upload_workers). In the database rather than on
+                # disk because the container filesystem doesn't survive a
+                # redeploy. `attempts` counts worker starts, so a file that
+                # keeps killing the process is eventually given up on.
+                # The bytes live in crm_upload_spool_chunks so neither the
+                # endpoint nor the worker holds a whole file in memory;
+                # file_bytes is only set on rows spooled before that.
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS crm_upload_spool (
+                        upload_id   INTEGER PRIMARY KEY REFERENCES crm_report_uploads(id) ON DELETE CASCADE,
+                        file_bytes  BYTEA,
+                        attempts    INTEGER DEFAULT 0,
+                        created_at  TIMESTAMP DEFAULT NOW()
+                    );
+                """)
+                cur.execute(
+                    "ALTER TABLE crm_upload_spool ALTER COLUMN file_bytes DROP NOT NULL;"
+                )
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS crm_upload_spool_chunks (
+                        upload_id   INTEGER NOT NULL REFERENCES crm_upload_spool(upload_id) ON DELETE CASCADE,
+                        seq         INTEGER NOT NULL,
+                        data        BYTEA NOT NULL,
+                        PRIMARY KEY (upload_id, seq)
+                    );
+                """)
+
+                # Chunked (resumable) uploads in flight. A session is the
+                # file's declared size plus whichever of its
+                # chunk_bytes-sized pieces have arrived; completing it
+                # copies the chunks into crm_upload_spool_chunks under a
+                # new crm_report_uploads row and drops the session.
+                # Sessions idle past CRM_UPLOAD_SESSION_TTL_HOURS are
+                # swept when the next one is opened.
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS crm_upload_sessions (
+                        id           SERIAL PRIMARY KEY,
+                        campaign_id  INTEGER NOT NULL REFERENCES marketing_campaigns(id) ON DELETE CASCADE,
+                        file_name    TEXT NOT NULL,
+                        uploaded_by  INTEGER REFERENCES users(id) ON DELETE CASCADE,
+                        total_bytes  BIGINT NOT NULL,
+                        chunk_bytes  INTEGER NOT NULL,
+                        created_at   TIMESTAMP DEFAULT NOW(),
+                        updated_at   TIMESTAMP DEFAULT NOW()
+                    );
+                """)
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS crm_upload_session_chunks (
+                        session_id  INTEGER NOT NULL REFERENCES crm_upload_sessions(id) ON DELETE CASCADE,
+                        seq         INTEGER NOT NULL,
+                        data        BYTEA NOT NULL,
+                        PRIMARY KEY (session_id, seq)
+                    );
+                """)
+
                 cur.execute("""
                     CREATE TABLE IF NOT EXISTS leads (
                         id          SERIAL PRIMARY KEY,
@@ -669,6 +1028,59 @@ def init_all_tables():
                 cur.execute("CREATE INDEX IF NOT EXISTS idx_lead_events_normalized_stage ON lead_events(normalized_stage);")
                 cur.execute("CREATE INDEX IF NOT EXISTS idx_lead_events_follow_date ON lead_events(follow_date);")
 
+                # Retroactive mapping changes (crm_logic.apply_*_mapping_change)
+                # look events up by the normalized raw value. The rep name is
+                # also stored in the form the parser resolves with
+                # (normalize_sales_name: lower, ws-collapsed, trimmed) so the
+                # lookup is an index probe rather than a REGEXP_REPLACE over
+                # every row. The stage key is a plain LOWER(TRIM()) and is
+                # served by an expression index.
+                #
+                # raw_sales_rep_key is a plain column that ingest fills in
+                # (crm_logic.sales_rep_key_sql), not a generated one: adding
+                # a stored generated column rewrites all of lead_events
+                # under an exclusive lock, while a nullable column is a
+                # catalog change. Rows from before it existed are filled in
+                # batches below; the partial index finds the ones left, so
+                # an interrupted boot resumes and a finished one costs a
+                # single probe.
+                if not column_exists(conn, "lead_events", "raw_sales_rep_key"):
+                    cur.execute(
+                        "ALTER TABLE lead_events ADD COLUMN IF NOT EXISTS raw_sales_rep_key TEXT"
+                    )
+                    log.info("📦 Added lead_events.raw_sales_rep_key")
+                else:
+                    cur.execute("""
+                        SELECT is_generated = 'ALWAYS' FROM information_schema.columns
+                        WHERE table_schema = 'public' AND table_name = 'lead_events'
+                          AND column_name = 'raw_sales_rep_key'
+                    """)
+                    if cur.fetchone()[0]:
+                        # Created as a generated column by an earlier build;
+                        # keeps the stored values, no rewrite.
+                        cur.execute(
+                            "ALTER TABLE lead_events ALTER COLUMN raw_sales_rep_key DROP EXPRESSION"
+                        )
+                        log.info("📦 lead_events.raw_sales_rep_key is now a plain column")
+                cur.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_lead_events_rep_key "
+                    "ON lead_events(raw_sales_rep_key, campaign_id);"
+                )
+                cur.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_lead_events_rep_key_pending
+                    ON lead_events(id)
+                    WHERE raw_sales_rep_key IS NULL AND raw_sales_rep_name IS NOT NULL;
+                """)
+                conn.commit()
+                from app.crm_logic import backfill_sales_rep_keys
+                filled = backfill_sales_rep_keys(conn)
+                if filled:
+                    log.info("📦 Backfilled lead_events.raw_sales_rep_key on %d row(s)", filled)
+                cur.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_lead_events_stage_key "
+                    "ON lead_events(LOWER(TRIM(raw_stage)), campaign_id);"
+                )
+
                 # campaign_id NULL = global mapping (applies to every campaign
                 # unless an override exists). Per-campaign rows take precedence
                 # — see crm_logic.normalize_stage() for the lookup order.
@@ -716,6 +1128,15 @@ def init_all_tables():
                         updated_at                  TIMESTAMP DEFAULT NOW()
                     );
                 """)
+                # recalculated_at moves only when total_leads / stage_counts
+                # are recomputed (updated_at also moves on every flag
+                # PATCH). The incremental recalc uses it as the "baseline
+                # as of" time — see crm_logic._incremental_recalc_blocker.
+                if not column_exists(conn, "campaign_kpis", "recalculated_at"):
+                    cur.execute(
+                        "ALTER TABLE campaign_kpis "
+                        "ADD COLUMN IF NOT EXISTS recalculated_at TIMESTAMP"
+                    )
 
                 # manager_intervention_flags — one row per lead that currently
                 # meets a trigger. UNIQUE on lead_id is what makes the recalc
@@ -780,6 +1201,131 @@ def init_all_tables():
                     "ON lead_assignments(sales_user_id, campaign_id);"
                 )
 
+                # lead_events.assignment_id — the window each event falls in,
+                # stamped by the assignment rebuild so the sales-KPI rollup
+                # and the lead timeline join by key instead of by date range.
+                # NULL for events outside every window (no rep yet, no date).
+                # Not a foreign key: the rebuild deletes and re-inserts a
+                # lead's assignments and restamps its events in the same
+                # transaction, and an ON DELETE action would write every
+                # event twice.
+                cur.execute(
+                    "ALTER TABLE lead_events ADD COLUMN IF NOT EXISTS assignment_id INTEGER"
+                )
+                cur.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_lead_events_assignment "
+                    "ON lead_events(assignment_id);"
+                )
+                # Unstamped dated events: what the backfill below looks
+                # for. Ingest adds to it and the recalc's stamp takes rows
+                # back out, so it stays about as small as the events that
+                # fall before their lead's first window.
+                cur.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_lead_events_unstamped
+                    ON lead_events(campaign_id, lead_id)
+                    WHERE assignment_id IS NULL AND follow_date IS NOT NULL
+                """)
+                conn.commit()
+                # Pending = an event still unstamped although one of its
+                # lead's windows covers it (_STAMP_ASSIGNMENTS_SQL's rule),
+                # so campaigns an earlier boot already stamped are skipped.
+                from app.crm_logic import rebuild_assignments_for_campaign
+                backfill_campaigns(
+                    conn, "lead_events.assignment_id",
+                    """
+                    SELECT c.id FROM marketing_campaigns c
+                    WHERE EXISTS (
+                        SELECT 1 FROM lead_events e
+                        JOIN lead_assignments a ON a.lead_id = e.lead_id
+                        WHERE e.campaign_id = c.id
+                          AND e.assignment_id IS NULL
+                          AND e.follow_date IS NOT NULL
+                          AND e.follow_date >= a.started_at
+                          AND (a.ended_at IS NULL OR e.follow_date < a.ended_at))
+                    """,
+                    rebuild_assignments_for_campaign,
+                )
+
+                # lead_state — one row per lead with the derived fields the
+                # campaign leads listing filters and sorts on (latest event's
+                # stage / rep / time, event count, open-flag state). Kept in
+                # step by crm_logic.bump_lead_state during ingest and
+                # refresh_lead_state from the recalc pipeline and the flag
+                # PATCH endpoint, so the listing never has to walk
+                # lead_events. Every index leads with campaign_id and ends
+                # in the listing's keyset order.
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS lead_state (
+                        lead_id                INTEGER PRIMARY KEY REFERENCES leads(id) ON DELETE CASCADE,
+                        campaign_id            INTEGER NOT NULL REFERENCES marketing_campaigns(id) ON DELETE CASCADE,
+                        latest_stage           VARCHAR(40),
+                        latest_sales_user_id   INTEGER REFERENCES users(id) ON DELETE SET NULL,
+                        last_event_at          TIMESTAMP,
+                        event_count            INTEGER NOT NULL DEFAULT 0,
+                        has_open_intervention  BOOLEAN NOT NULL DEFAULT FALSE,
+                        intervention_priority  VARCHAR(10),
+                        updated_at             TIMESTAMP DEFAULT NOW()
+                    );
+                """)
+                for name, cols in [
+                    ("idx_lead_state_order",        "campaign_id"),
+                    ("idx_lead_state_stage",        "campaign_id, latest_stage"),
+                    ("idx_lead_state_rep",          "campaign_id, latest_sales_user_id"),
+                    ("idx_lead_state_intervention", "campaign_id, has_open_intervention"),
+                ]:
+                    cur.execute(
+                        f"CREATE INDEX IF NOT EXISTS {name} ON lead_state"
+                        f"({cols}, last_event_at DESC NULLS LAST, lead_id DESC);"
+                    )
+                # Build it for campaigns with leads that have no row yet.
+                # Every lead gets one from then on (ingest adds it with the
+                # lead's first event), so this only finds work on the first
+                # boot with lead_state, or one that was cut short.
+                from app.crm_logic import refresh_lead_state
+                backfill_campaigns(
+                    conn, "lead_state",
+                    """
+                    SELECT DISTINCT l.campaign_id FROM leads l
+                    WHERE NOT EXISTS (SELECT 1 FROM lead_state s WHERE s.lead_id = l.id)
+                    """,
+                    refresh_lead_state,
+                )
+
+                # lead_events_daily — per (campaign, day, stage) event counts
+                # behind the daily-activity endpoint. The primary key doubles
+                # as the range-scan index for "campaign X between two days".
+                # Maintained by crm_logic.bump_daily_activity (ingest) and
+                # rebuild_daily_activity (full recalc, backfill, and
+                # scripts/rebuild_daily_activity.py).
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS lead_events_daily (
+                        campaign_id       INTEGER NOT NULL REFERENCES marketing_campaigns(id) ON DELETE CASCADE,
+                        day               DATE NOT NULL,
+                        normalized_stage  VARCHAR(40) NOT NULL,
+                        event_count       INTEGER NOT NULL DEFAULT 0,
+                        PRIMARY KEY (campaign_id, day, normalized_stage)
+                    );
+                """)
+                # Build it for campaigns that have countable events but no
+                # rollup rows (same inclusion rule as rebuild_daily_activity).
+                from app.crm_logic import rebuild_daily_activity
+                backfill_campaigns(
+                    conn, "lead_events_daily",
+                    """
+                    SELECT c.id FROM marketing_campaigns c
+                    WHERE EXISTS (
+                              SELECT 1 FROM lead_events e
+                              WHERE e.campaign_id = c.id
+                                AND e.normalized_stage IS NOT NULL
+                                AND e.is_voided = FALSE
+                                AND e.follow_date IS NOT NULL)
+                      AND NOT EXISTS (
+                              SELECT 1 FROM lead_events_daily d
+                              WHERE d.campaign_id = c.id)
+                    """,
+                    rebuild_daily_activity,
+                )
+
                 # sales_kpis (P2) — per-rep, per-campaign rollup of Fresh vs
                 # Rotation lead counts and the latest-stage outcome bucket
                 # within each assignment window. Recalc is upsert + cleanup,
@@ -828,6 +1374,38 @@ def init_all_tables():
                     "CREATE INDEX IF NOT EXISTS idx_sales_rep_mappings_lookup "
                     "ON sales_rep_mappings(campaign_id, raw_name);"
                 )
+
+                # crm_jobs — background work queue (app/crm_jobs.py). A
+                # mapping change lands one "mapping_change" job; running it
+                # fans out into one "campaign_recalc" job per affected
+                # campaign. Workers claim with FOR UPDATE SKIP LOCKED. The
+                # partial unique index allows at most one PENDING recalc
+                # per campaign, which is what coalesces repeated requests.
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS crm_jobs (
+                        id             SERIAL PRIMARY KEY,
+                        job_type       VARCHAR(30) NOT NULL,
+                        campaign_id    INTEGER REFERENCES marketing_campaigns(id) ON DELETE CASCADE,
+                        payload        JSONB DEFAULT '{}'::jsonb,
+                        status         VARCHAR(20) DEFAULT 'PENDING',
+                        attempts       INTEGER DEFAULT 0,
+                        result         JSONB,
+                        error_message  TEXT,
+                        requested_by   INTEGER REFERENCES users(id) ON DELETE SET NULL,
+                        created_at     TIMESTAMP DEFAULT NOW(),
+                        started_at     TIMESTAMP,
+                        finished_at    TIMESTAMP
+                    );
+                """)
+                cur.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_crm_jobs_open "
+                    "ON crm_jobs(id) WHERE status IN ('PENDING', 'PROCESSING');"
+                )
+                cur.execute("""
+                    CREATE UNIQUE INDEX IF NOT EXISTS idx_crm_jobs_recalc_pending
+                    ON crm_jobs(campaign_id)
+                    WHERE job_type = 'campaign_recalc' AND status = 'PENDING';
+                """)
                 conn.commit()
 
         log.info("✅ All tables ensured (users, kpi_entries, salary_config, payroll, hr_records, teams, crm_ingestion)")
@@ -0,0 +1,121 @@
+"""
+Batched users.last_seen heartbeat for the admin Online/Offline status.
+
+Every authenticated request used to run its own UPDATE + commit (the
+SQL throttle only kept the row from changing; the round trip still
+happened). Now the before_request hook calls record_seen(), which only
+notes the user in an in-process dict, and one flusher thread writes
+everything noted every LAST_SEEN_FLUSH_SECONDS with a single
+UPDATE … FROM (VALUES …).
+
+Each entry keeps when (monotonic) the user was last seen, and the flush
+stamps NOW() minus that age, so last_seen is on the database clock like
+the "online within 2 minutes" check that reads it, and is at most one
+flush interval behind. A failed flush puts its entries back for the
+next one. Logout calls forget() before its own write; forget() waits
+out a flush in progress, so nothing recorded before the logout can mark
+the user online again afterwards.
+"""
+import logging
+import threading
+import time
+
+from config import Config
+from app.database import get_conn
+
+log = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+# Held for a whole flush; taken before _lock wherever both are needed.
+_flush_lock = threading.Lock()
+_pending: dict = {}  # user_id → time.monotonic() of the latest request
+_flusher_thread = None
+
+
+def record_seen(user_id: int) -> None:
+    """Note a request by this user; written by the next flush."""
+    with _lock:
+        _pending[user_id] = time.monotonic()
+    start_flusher()
+
+
+def forget(user_id: int) -> None:
+    """Drop the user's unwritten heartbeat (logout)."""
+    with _flush_lock, _lock:
+        _pending.pop(user_id, None)
+
+
+def flush(conn=None) -> int:
+    """Write every pending heartbeat in one UPDATE, on `conn` if given
+    (committed, left open) or a pooled connection. Returns users written."""
+    with _flush_lock:
+        return _flush_locked(conn)
+
+
+def _flush_locked(conn) -> int:
+    import psycopg2.extras
+
+    with _lock:
+        batch = dict(_pending)
+        _pending.clear()
+    if not batch:
+        return 0
+
+    now = time.monotonic()
+    rows = [(uid, max(0.0, now - seen)) for uid, seen in batch.items()]
+    own_conn = conn is None
+    try:
+        if own_conn:
+            conn = get_conn()
+        with conn.cursor() as cur:
+            psycopg2.extras.execute_values(
+                cur,
+                """
+                UPDATE users u
+                SET last_seen = v.seen
+                FROM (
+                    SELECT id, NOW() - age * INTERVAL '1 second' AS seen
+                    FROM (VALUES %s) AS raw (id, age)
+                ) v
+                WHERE u.id = v.id
+                  AND (u.last_seen IS NULL OR u.last_seen < v.seen)
+                """,
+                rows,
+                template="(%s::integer, %s::float8)",
+            )
+        conn.commit()
+    except Exception:
+        # Put them back unless a newer request has already replaced the
+        # entry.
+        with _lock:
+            for uid, seen in batch.items():
+                _pending.setdefault(uid, seen)
+        raise
+    finally:
+        if own_conn and conn is not None:
+            conn.close()
+    return len(rows)
+
+
+def start_flusher() -> None:
+    """Start the flusher thread once per process. Idempotent."""
+    global _flusher_thread
+    if _flusher_thread is not None:
+        return
+    with _lock:
+        if _flusher_thread is not None and _flusher_thread.is_alive():
+            return
+        _flusher_thread = threading.Thread(target=_flush_loop, name="last-seen", daemon=True)
+        _flusher_thread.start()
+    log.info("🧵 last_seen flusher started (every %ss)", Config.LAST_SEEN_FLUSH_SECONDS)
+
+
+def _flush_loop() -> None:
+    while True:
+        time.sleep(Config.LAST_SEEN_FLUSH_SECONDS)
+        try:
+            flush()
+        except Exception as exc:
+            # Never let the heartbeat kill the thread; the entries were put
+            # back and the next pass retries them.
+            log.debug("last_seen flush failed: %s", exc)
@@ -538,36 +538,430 @@ function initPasswordToggles() {
   });
 }
 
+// ─── Live CRM events (SSE) ─────────────────────────────────────────
+// One EventSource per page on /api/crm/events (app/crm_events.py). Every
+// open stream pins a server thread, so it is opened only while something
+// subscribed with on() — in practice watchUpload — and closed again when
+// the last of those unsubscribes; listen() rides along on a stream that
+// happens to be open without opening one. Events: `upload` (progress of
+// any upload), `intervention` (badge counts) and `resync` (events may
+// have been missed — re-read state over HTTP). If the stream can't be
+// opened at all (no EventSource, role without access, or the server is
+// at its stream cap) subscribers get one `resync` and carry on with
+// plain polling.
+const crmEvents = (() => {
+  const handlers = {};
+  let es = null;
+  let live = false;
+  let failed = false;
+  let holders = 0;
+
+  function emit(type, data) {
+    (handlers[type] || []).slice().forEach(fn => fn(data));
+  }
+
+  function connect() {
+    if (es || failed) return;
+    if (!window.EventSource) { failed = true; return; }
+    es = new EventSource("/api/crm/events");
+    es.addEventListener("open", () => { live = true; });
+    es.addEventListener("error", () => {
+      live = false;
+      // CONNECTING = the browser is retrying by itself (stream ended or
+      // network blip). CLOSED = it gave up (non-200), so stop here.
+      if (es.readyState === EventSource.CLOSED) {
+        es = null;
+        failed = true;
+        emit("resync", {});
+      }
+    });
+    ["upload", "intervention", "resync"].forEach(type => {
+      es.addEventListener(type, (ev) => {
+        let data;
+        try { data = JSON.parse(ev.data); } catch (_) { return; }
+        emit(type, data);
+      });
+    });
+  }
+
+  function disconnect() {
+    if (!es) return;
+    es.close();
+    es = null;
+    live = false;
+  }
+
+  function listen(type, fn) {
+    (handlers[type] = handlers[type] || []).push(fn);
+    return () => { handlers[type] = (handlers[type] || []).filter(f => f !== fn); };
+  }
+
+  return {
+    // Subscribe and keep the stream open until the returned function is
+    // called.
+    on(type, fn) {
+      const off = listen(type, fn);
+      holders++;
+      connect();
+      let released = false;
+      return () => {
+        off();
+        if (released) return;
+        released = true;
+        if (--holders === 0) disconnect();
+      };
+    },
+    // Subscribe without opening the stream. Returns an unsubscribe function.
+    listen,
+    isLive() { return live; },
+    available() { return !failed && !!window.EventSource; },
+  };
+})();
+window.crmEvents = crmEvents;
+
 // ─── Sidebar Manager-Intervention badge (P3) ───────────────────────
-// The sidebar link renders an empty `#navInterventionBadge` span. We
-// populate it from /api/crm/intervention/open-count after auth resolves.
-// The endpoint is role-gated to marketing/manager/admin — anonymous and
-// out-of-scope users get a 401/403 and we silently leave the badge
-// hidden, which is the correct visible state.
-async function refreshInterventionBadge() {
+// The sidebar link renders an empty `#navInterventionBadge` span (only
+// for marketing/manager/admin). Its counts come from
+// /api/crm/intervention/open-count, polled every _BADGE_POLL_MS while the
+// tab is visible. The server answers from a shared count cache that the
+// flag writers' events keep current, so the polls don't reach the
+// database. The last answer is kept in sessionStorage for as long, so
+// moving between pages doesn't ask again. On a page that has the live
+// stream open anyway (an upload in progress) its `intervention` events
+// update the badge in between.
+const _BADGE_POLL_MS = 60000;
+const _BADGE_CACHE_KEY = "ain_intervention_badge";
+function renderInterventionBadge(data) {
+  const el = document.getElementById("navInterventionBadge");
+  if (!el) return;
+  const count = (data && data.open_count) || 0;
+  if (count <= 0) {
+    el.hidden = true;
+    el.textContent = "";
+    return;
+  }
+  el.hidden = false;
+  el.textContent = count > 99 ? "99+" : String(count);
+  // Red when there's at least one HIGH, amber otherwise.
+  el.classList.toggle("is-high", (data && data.high_priority) > 0);
+}
+
+function cacheInterventionBadge(data) {
+  try {
+    sessionStorage.setItem(_BADGE_CACHE_KEY, JSON.stringify({ at: Date.now(), data }));
+  } catch (_) {}
+}
+
+function cachedInterventionBadge() {
+  try {
+    const c = JSON.parse(sessionStorage.getItem(_BADGE_CACHE_KEY) || "null");
+    if (c && Date.now() - c.at < _BADGE_POLL_MS) return c.data;
+  } catch (_) {}
+  return null;
+}
+
+async function fetchInterventionBadge() {
   const el = document.getElementById("navInterventionBadge");
   if (!el) return;  // page doesn't have the sidebar (auth pages)
   try {
     const data = await api("/api/crm/intervention/open-count");
-    const count = (data && data.open_count) || 0;
-    if (count <= 0) {
-      el.hidden = true;
-      el.textContent = "";
-      return;
-    }
-    el.hidden = false;
-    el.textContent = count > 99 ? "99+" : String(count);
-    // Red when there's at least one HIGH, amber otherwise.
-    el.classList.toggle("is-high", (data && data.high_priority) > 0);
+    cacheInterventionBadge(data);
+    renderInterventionBadge(data);
   } catch (_) {
     // 401/403/network — keep the badge hidden.
     el.hidden = true;
   }
 }
-// Expose for templates that toggle status to refresh the badge after a
-// PATCH (e.g. marketing_lead_timeline.html, marketing_intervention.html).
+
+// Templates call this after a flag PATCH (e.g. marketing_lead_timeline.html,
+// marketing_intervention.html), so it skips the cache.
+function refreshInterventionBadge() {
+  fetchInterventionBadge();
+}
 window.refreshInterventionBadge = refreshInterventionBadge;
 
+function initInterventionBadge() {
+  if (!document.getElementById("navInterventionBadge")) return;
+  const cached = cachedInterventionBadge();
+  if (cached) renderInterventionBadge(cached);
+  else fetchInterventionBadge();
+  setInterval(() => {
+    if (document.visibilityState === "visible") fetchInterventionBadge();
+  }, _BADGE_POLL_MS);
+  crmEvents.listen("intervention", (data) => {
+    cacheInterventionBadge(data);
+    renderInterventionBadge(data);
+  });
+  crmEvents.listen("resync", fetchInterventionBadge);
+}
+
+// ─── CRM upload progress ───────────────────────────────────────────
+// Both upload modals (marketing.html, marketing_campaign.html) follow an
+// upload with watchUpload and render the same one-line summary: phase,
+// rows so far (of the estimate when the sheet declared one), throughput
+// and ETA.
+function formatUploadProgress(s) {
+  const phase = s.status === "PENDING" ? "queued" : (s.phase || "parsing");
+  let txt = t(`crm.upload.phase.${phase}`, t("crm.upload.processing"));
+  if (phase === "ingesting" && s.rows_processed) {
+    txt += ` ${fmtNum(s.rows_processed)}`;
+    if (s.rows_total) txt += ` / ${fmtNum(s.rows_total)}`;
+    if (s.rows_per_second) {
+      txt += ` · ${t("crm.upload.rows_per_sec").replace("{n}", fmtNum(s.rows_per_second))}`;
+    }
+    if (s.eta_seconds != null) {
+      txt += ` · ${t("crm.upload.eta").replace("{n}", fmtNum(s.eta_seconds))}`;
+    }
+  }
+  return txt;
+}
+
+// One entry of an upload's warnings (see add_warning in app/crm_parser.py):
+// a kind of problem, how many rows hit it, the first few row numbers and
+// the first offending value. Uploads from before warnings were tallied
+// stored plain strings; those are shown as they are.
+function formatUploadWarning(w) {
+  if (typeof w === "string") return w;
+  let txt = t(`crm.upload.warning.${w.code}`, w.code);
+  if (w.detail) txt += ` (${w.detail})`;
+  if (w.example) txt += ` — "${w.example}"`;
+  txt += ` · ${t("crm.upload.warning.count").replace("{n}", fmtNum(w.count))}`;
+  if (w.rows && w.rows.length) {
+    txt += ` · ${t("crm.upload.warning.rows")} ${w.rows.join(", ")}`;
+    if (w.count > w.rows.length) txt += "…";
+  }
+  return txt;
+}
+
+// Send a CRM report for ingestion; resolves with the upload endpoint's
+// JSON ({upload_id, status, …}), rejects with something tError() reads.
+// Files up to one chunk go up as a single multipart POST. Bigger ones use
+// the chunked protocol (see crm_bp): open a session, PUT each chunk —
+// retried with backoff when the connection drops — then complete it. The
+// session id is remembered per file in localStorage, so sending the same
+// file again after a failure or a reload skips the chunks that arrived.
+// onProgress(pct) reports how much of the file has been sent.
+const _CRM_SINGLE_POST_MAX_BYTES = 1024 * 1024;
+const _CRM_CHUNK_RETRIES = 5;
+
+async function sendCrmUpload(campaignId, file, onProgress) {
+  if (!_CSRF) await _fetchCsrf();
+  if (file.size <= _CRM_SINGLE_POST_MAX_BYTES) {
+    const fd = new FormData();
+    fd.append("file", file);
+    const r = await fetch(`${API}/api/crm/campaigns/${campaignId}/upload`, {
+      method: "POST",
+      credentials: "same-origin",
+      headers: _CSRF ? { "X-CSRF-Token": _CSRF } : {},
+      body: fd,
+    });
+    const data = await r.json();
+    if (!r.ok) throw { data, status: r.status };
+    return data;
+  }
+
+  const key = `crm_upload_session:${campaignId}:${file.name}:${file.size}:${file.lastModified}`;
+  let s = null;
+  const saved = localStorage.getItem(key);
+  if (saved) {
+    // Gone (completed, expired or abandoned) → start over.
+    try { s = await api(`/api/crm/upload-sessions/${saved}`); } catch (_) { s = null; }
+  }
+  if (!s) {
+    s = await api(`/api/crm/campaigns/${campaignId}/uploads/chunked`, {
+      method: "POST",
+      body: { file_name: file.name, size: file.size },
+    });
+    localStorage.setItem(key, String(s.session_id));
+  }
+  const have = new Set(s.received);
+  let sent = have.size;
+  for (let seq = 0; seq < s.chunk_count; seq++) {
+    if (have.has(seq)) continue;
+    await _putCrmUploadChunk(s.session_id, seq,
+                             file.slice(seq * s.chunk_bytes, (seq + 1) * s.chunk_bytes));
+    sent++;
+    if (onProgress) onProgress(Math.round(sent * 100 / s.chunk_count));
+  }
+  const data = await api(`/api/crm/upload-sessions/${s.session_id}/complete`, { method: "POST" });
+  localStorage.removeItem(key);
+  return data;
+}
+
+async function _putCrmUploadChunk(sessionId, seq, blob) {
+  for (let attempt = 0; ; attempt++) {
+    let r = null;
+    try {
+      r = await fetch(`${API}/api/crm/upload-sessions/${sessionId}/chunks/${seq}`, {
+        method: "PUT",
+        credentials: "same-origin",
+        headers: {
+          "Content-Type": "application/octet-stream",
+          ...(_CSRF ? { "X-CSRF-Token": _CSRF } : {}),
+        },
+        body: blob,
+      });
+    } catch (_) { /* connection dropped — retried below */ }
+    if (r && r.ok) return;
+    // 4xx won't get better by sending the same bytes again.
+    if ((r && r.status < 500) || attempt >= _CRM_CHUNK_RETRIES) {
+      if (!r) throw new Error(t("errors.server"));
+      let data = null;
+      try { data = await r.json(); } catch { data = null; }
+      throw { data, status: r.status };
+    }
+    await new Promise(res => setTimeout(res, 1000 * 2 ** attempt));
+  }
+}
+
+// Dry run of an upload (POST …/upload?dry_run=1): parses the file and
+// checks it against what's already stored, writes nothing. Renders the
+// counts into `host` so the user sees "95% duplicates" or an unmatched
+// rep before committing to the real upload.
+async function previewCrmUpload(campaignId, file, host) {
+  const token = String(Date.now());
+  host.dataset.previewToken = token;
+  host.hidden = false;
+  host.innerHTML = "";
+  const loading = document.createElement("p");
+  loading.className = "text-muted";
+  loading.style.fontSize = "13px";
+  loading.textContent = t("crm.upload.preview.loading");
+  host.appendChild(loading);
+
+  const fd = new FormData();
+  fd.append("file", file);
+  let p;
+  try {
+    if (!_CSRF) await _fetchCsrf();
+    const r = await fetch(`${API}/api/crm/campaigns/${campaignId}/upload?dry_run=1`, {
+      method: "POST",
+      credentials: "same-origin",
+      headers: _CSRF ? { "X-CSRF-Token": _CSRF } : {},
+      body: fd,
+    });
+    p = await r.json();
+    if (!r.ok) throw { data: p, status: r.status };
+  } catch (e) {
+    if (host.dataset.previewToken !== token) return;
+    host.innerHTML = "";
+    const err = document.createElement("div");
+    err.className = "upload-result-banner is-error";
+    err.textContent = tError(e);
+    host.appendChild(err);
+    return;
+  }
+  // A newer file was picked while this one was being checked.
+  if (host.dataset.previewToken !== token) return;
+
+  host.innerHTML = "";
+  const title = document.createElement("div");
+  title.className = "upload-result-banner" + (p.duplicate_of_upload_id ? " is-error" : "");
+  title.textContent = p.duplicate_of_upload_id
+    ? t("crm.upload.duplicate_of").replace("{id}", p.duplicate_of_upload_id)
+    : t("crm.upload.preview.title");
+  host.appendChild(title);
+
+  const grid = document.createElement("dl");
+  grid.className = "upload-summary-grid";
+  [["crm.upload.summary.total_events", p.total_events],
+   ["crm.upload.summary.new_events", p.new_events],
+   ["crm.upload.summary.duplicates", p.duplicate_events],
+   ["crm.upload.summary.new_leads", p.new_leads],
+   ["crm.upload.summary.rejected", p.rejected_rows]].forEach(([k, v]) => {
+    const dt = document.createElement("dt");
+    dt.textContent = t(k);
+    const dd = document.createElement("dd");
+    dd.textContent = fmtNum(v || 0);
+    grid.appendChild(dt); grid.appendChild(dd);
+  });
+  [["crm.upload.warnings.unmatched_reps", p.unmatched_sales_reps],
+   ["crm.upload.warnings.unmatched_stages", p.unmatched_stages]].forEach(([k, list]) => {
+    if (!list || !list.length) return;
+    const dt = document.createElement("dt");
+    dt.textContent = t(k);
+    const dd = document.createElement("dd");
+    dd.textContent = list.join("، ");
+    grid.appendChild(dt); grid.appendChild(dd);
+  });
+  if (p.warnings && p.warnings.length) {
+    const dt = document.createElement("dt");
+    dt.textContent = t("crm.upload.warnings.other");
+    const dd = document.createElement("dd");
+    p.warnings.forEach(w => {
+      const line = document.createElement("div");
+      line.textContent = formatUploadWarning(w);
+      dd.appendChild(line);
+    });
+    grid.appendChild(dt); grid.appendChild(dd);
+  }
+  host.appendChild(grid);
+}
+
+// Follow one upload until it finishes: onProgress(status) while it runs,
+// onDone(status) once — with the full status payload (summary, warnings)
+// or a synthetic FAILED. Progress comes from the live stream when it's
+// up; the status poll stays on as a safety net (every 15s while live,
+// every 2s without it) and fetches the final result. Gives up after two
+// minutes without any progress, however long the upload itself takes.
+function watchUpload(uploadId, onProgress, onDone) {
+  const STALL_MS = 120000;
+  let lastKey = "";
+  let lastChange = Date.now();
+  let timer = null;
+  let done = false;
+  const offs = [];
+
+  function finish(s) {
+    if (done) return;
+    done = true;
+    clearTimeout(timer);
+    offs.forEach(off => off());
+    onDone(s);
+  }
+
+  function progressed(s) {
+    const key = `${s.status}|${s.phase || ""}|${s.rows_processed || 0}`;
+    if (key !== lastKey) { lastKey = key; lastChange = Date.now(); }
+    onProgress(s);
+  }
+
+  function schedule(ms) {
+    if (done) return;
+    clearTimeout(timer);
+    timer = setTimeout(poll, ms != null ? ms : (crmEvents.isLive() ? 15000 : 2000));
+  }
+
+  async function poll() {
+    if (done) return;
+    try {
+      const s = await api(`/api/crm/uploads/${uploadId}/status`);
+      if (s.status === "COMPLETED" || s.status === "FAILED") { finish(s); return; }
+      progressed(s);
+    } catch (e) {
+      finish({ status: "FAILED", error_message: tError(e) });
+      return;
+    }
+    if (Date.now() - lastChange > STALL_MS) {
+      finish({ status: "FAILED", error_message: t("crm.upload.timeout") || "Timed out" });
+      return;
+    }
+    schedule();
+  }
+
+  offs.push(crmEvents.on("upload", (ev) => {
+    if (done || ev.upload_id !== uploadId) return;
+    // The event carries progress only; the result card needs the full
+    // status payload, so a terminal event triggers one poll.
+    if (ev.status === "COMPLETED" || ev.status === "FAILED") schedule(0);
+    else progressed(ev);
+  }));
+  offs.push(crmEvents.on("resync", () => schedule(0)));
+  // First poll right away: a duplicate file is COMPLETED before the
+  // upload request even returns.
+  schedule(0);
+}
+
 // ─── Reveal-on-scroll for .reveal elements ─────────────────────────
 function initReveal() {
   if (!("IntersectionObserver" in window)) return;
@@ -617,7 +1011,7 @@ document.addEventListener("DOMContentLoaded", () => {
   initPasswordToggles();
   initPassfailToggles();
   initStickyShrink();
-  refreshInterventionBadge();
+  initInterventionBadge();
   document.addEventListener("keydown", _onSidebarKeydown);
   document.addEventListener("keydown", _onModalKeydown);
   document.querySelectorAll(".modal-backdrop").forEach(m => {
@@ -569,6 +569,10 @@ const I18N = {
     "errors.range_inverted": "تاريخ الانتهاء لازم يكون بعد تاريخ البدء أو مساوي له.",
     "errors.range_too_wide": "النطاق الزمني ما يقدرش يزيد عن ٥ سنين.",
     "errors.range_too_large": "النتائج كتيرة جدًا — ضيّق النطاق.",
+    "errors.upload_queue_full": "في ملفات كتير بتتعالج دلوقتي — جرّب الرفع تاني بعد شوية.",
+    "errors.crm_sheet_unreadable": "مش لاقيين في الملف صف عناوين فيه الأعمدة المطلوبة.",
+    "errors.upload_too_large": "الملف أكبر من الحد المسموح — قسّمه على كذا ملف.",
+    "errors.upload_incomplete": "الملف ما وصلش كامل — جرّب ترفعه تاني وهنكمّل من مكان ما وقف.",
     "errors.sub_month_not_allowed": "العرض ده بيدعم نطاقات شهرية بس.",
     "errors.invalid_preset": "النطاق المختار غير صالح.",
     "finance.range_warning_submonth": "<strong>تنبيه:</strong> الأرقام المالية إجمالات شهرية. النطاق ده بيفلتر القيود اللي اتقدمت في الفترة دي بس — الإيراد المعروض لكل صف بيغطي الشهر بالكامل.",
@@ -921,19 +925,39 @@ const I18N = {
     /* ─── CRM Report ingestion (P1b+) ─── */
     "crm.upload.title":                       "رفع تقرير CRM",
     "crm.upload.button":                      "رفع",
-    "crm.upload.choose_file":                 "اختر ملف Excel (.xlsx)",
+    "crm.upload.choose_file":                 "اختر ملف Excel أو CSV (.xlsx أو .csv أو .tsv)",
     "crm.upload.cap_hint":                    "الحد الأقصى لحجم الملف 10 ميجا",
     "crm.upload.processing":                  "جاري المعالجة...",
+    "crm.upload.phase.queued":                "في قائمة الانتظار...",
+    "crm.upload.phase.sending":               "جاري إرسال الملف... {pct}%",
+    "crm.upload.phase.parsing":               "جاري قراءة الملف...",
+    "crm.upload.phase.ingesting":             "جاري حفظ الصفوف",
+    "crm.upload.phase.recalculating":         "جاري إعادة حساب المؤشرات...",
+    "crm.upload.rows_per_sec":                "{n} صف/ث",
+    "crm.upload.eta":                         "متبقٍ ~{n} ث",
     "crm.upload.completed":                   "اكتمل الرفع",
+    "crm.upload.duplicate_of":                "الملف نفسه رُفع من قبل (رفع #{id}) — لا توجد أحداث جديدة",
+    "crm.upload.preview.loading":             "جاري فحص الملف...",
+    "crm.upload.preview.title":               "معاينة قبل الرفع",
+    "crm.upload.summary.new_leads":           "عملاء جدد",
+    "crm.upload.summary.rejected":            "صفوف مرفوضة",
     "crm.upload.failed":                      "فشل الرفع",
     "crm.upload.timeout":                     "انتهت المهلة — راجع سجل الرفع",
-    "crm.upload.bad_type":                    "النوع غير مدعوم — يلزم ملف .xlsx",
+    "crm.upload.bad_type":                    "النوع غير مدعوم — يلزم ملف .xlsx أو .csv أو .tsv",
     "crm.upload.summary.total_events":        "إجمالي الأحداث",
     "crm.upload.summary.new_events":          "أحداث جديدة",
     "crm.upload.summary.duplicates":          "تكرارات تم تخطيها",
     "crm.upload.warnings.unmatched_reps":     "مندوبون غير مطابقين",
     "crm.upload.warnings.unmatched_stages":   "مراحل غير معروفة",
     "crm.upload.warnings.other":              "ملاحظات أخرى",
+    "crm.upload.warning.bad_mobile":          "رقم موبايل تعذّرت قراءته",
+    "crm.upload.warning.no_mobile":           "صف بلا رقم موبايل قبله — تم تخطيه",
+    "crm.upload.warning.bad_date":            "تاريخ متابعة تعذّرت قراءته — حُفظ فارغاً",
+    "crm.upload.warning.rejected":            "صفوف مرفوضة",
+    "crm.upload.warning.skipped":             "صفوف تعذّر حفظها — تم تخطيها",
+    "crm.upload.warning.recalc_failed":       "فشلت إعادة حساب المؤشرات",
+    "crm.upload.warning.count":               "{n} صف",
+    "crm.upload.warning.rows":                "الصفوف:",
 
     "crm.overview.title":               "نظرة عامة على الحملة",
     "crm.overview.total_leads":         "إجمالي العملاء",
@@ -1093,6 +1117,8 @@ const I18N = {
     "crm.admin.suggestions.empty_reps":   "كل المندوبين في الأحداث الحالية مربوطين ✓",
     "crm.admin.confirm.delete":         "حذف هذا الربط؟ سيتم إعادة تقييم الأحداث المتأثرة.",
     "crm.admin.recalculated":           "تم الحفظ — أُعيد حساب {count} حملة",
+    "crm.admin.recalc_queued":          "تم الحفظ — جارٍ إعادة الحساب في الخلفية",
+    "crm.admin.recalc_failed":          "تعذّرت إعادة الحساب",
   },
 
   en: {
@@ -1659,6 +1685,10 @@ const I18N = {
     "errors.range_inverted": "End date must be on or after start date.",
     "errors.range_too_wide": "Date range cannot exceed 5 years.",
     "errors.range_too_large": "Too many results — narrow the range.",
+    "errors.upload_queue_full": "Too many uploads are being processed — try again in a moment.",
+    "errors.crm_sheet_unreadable": "No sheet in this file has a header row with the required columns.",
+    "errors.upload_too_large": "The file is over the size limit — split it into smaller files.",
+    "errors.upload_incomplete": "The file didn't arrive in full — send it again to pick up where it stopped.",
     "errors.sub_month_not_allowed": "This view supports monthly ranges only.",
     "errors.invalid_preset": "Invalid date range.",
     "finance.range_warning_submonth": "<strong>Heads up:</strong> financial figures are monthly totals. This range filters which entries are shown by submission date — the revenue shown per row covers the full month.",
@@ -2011,19 +2041,39 @@ const I18N = {
     /* ─── CRM Report ingestion (P1b+) ─── */
     "crm.upload.title":                       "Upload CRM Report",
     "crm.upload.button":                      "Upload",
-    "crm.upload.choose_file":                 "Choose Excel file (.xlsx)",
+    "crm.upload.choose_file":                 "Choose an Excel or CSV file (.xlsx, .csv, .tsv)",
     "crm.upload.cap_hint":                    "Maximum file size 10 MB",
     "crm.upload.processing":                  "Processing...",
+    "crm.upload.phase.queued":                "Queued...",
+    "crm.upload.phase.sending":               "Sending the file... {pct}%",
+    "crm.upload.phase.parsing":               "Reading the file...",
+    "crm.upload.phase.ingesting":             "Saving rows",
+    "crm.upload.phase.recalculating":         "Recalculating KPIs...",
+    "crm.upload.rows_per_sec":                "{n} rows/s",
+    "crm.upload.eta":                         "~{n}s left",
     "crm.upload.completed":                   "Upload completed",
+    "crm.upload.duplicate_of":                "Same file as upload #{id} — no new events",
+    "crm.upload.preview.loading":             "Checking the file...",
+    "crm.upload.preview.title":               "Preview before upload",
+    "crm.upload.summary.new_leads":           "New leads",
+    "crm.upload.summary.rejected":            "Rows rejected",
     "crm.upload.failed":                      "Upload failed",
     "crm.upload.timeout":                     "Timed out — check the upload log",
-    "crm.upload.bad_type":                    "Unsupported type — .xlsx required",
+    "crm.upload.bad_type":                    "Unsupported type — .xlsx, .csv or .tsv required",
     "crm.upload.summary.total_events":        "Total events",
     "crm.upload.summary.new_events":          "New events",
     "crm.upload.summary.duplicates":          "Duplicates skipped",
     "crm.upload.warnings.unmatched_reps":     "Unmatched sales reps",
     "crm.upload.warnings.unmatched_stages":   "Unmatched stages",
     "crm.upload.warnings.other":              "Other notes",
+    "crm.upload.warning.bad_mobile":          "Mobile number couldn't be read",
+    "crm.upload.warning.no_mobile":           "Row with no mobile above it — skipped",
+    "crm.upload.warning.bad_date":            "Follow date couldn't be read — stored empty",
+    "crm.upload.warning.rejected":            "Rows rejected",
+    "crm.upload.warning.skipped":             "Rows that failed to save — skipped",
+    "crm.upload.warning.recalc_failed":       "KPI recalculation failed",
+    "crm.upload.warning.count":               "{n} rows",
+    "crm.upload.warning.rows":                "rows",
 
     "crm.overview.title":               "Campaign Overview",
     "crm.overview.total_leads":         "Total Leads",
@@ -2183,6 +2233,8 @@ const I18N = {
     "crm.admin.suggestions.empty_reps":   "All current event reps are mapped ✓",
     "crm.admin.confirm.delete":         "Delete this mapping? Affected events will be re-evaluated.",
     "crm.admin.recalculated":           "Saved — recalculated {count} campaign(s)",
+    "crm.admin.recalc_queued":          "Saved — recalculating in the background",
+    "crm.admin.recalc_failed":          "Recalculation failed",
   },
 };
 
@@ -0,0 +1,48 @@
+"""
+Avatar URLs for JSON payloads and pages.
+
+users.avatar_url holds the picture itself — a base64 data URL of the
+256×256 image the profile page crops and resizes in the browser (see
+auth_bp.upload_avatar), 30–80 KB a row. Listings must not ship that, so
+they select avatar_src_sql(alias) AS avatar_url instead: a
+/api/avatars/<user_id>?v=<version> link, or NULL when the user has no
+picture. The version is a prefix of users.avatar_hash (md5 of the data
+URL, a generated column), so the link changes whenever the picture does
+and avatars_bp can serve it with a long max-age.
+"""
+from __future__ import annotations
+
+import base64
+from typing import Optional, Tuple
+
+AVATAR_VERSION_CHARS = 12
+
+
+def avatar_src(user_id: int, avatar_hash: Optional[str]) -> Optional[str]:
+    """Versioned avatar link for one user, or None without a picture."""
+    if not avatar_hash:
+        return None
+    return f"/api/avatars/{user_id}?v={avatar_hash[:AVATAR_VERSION_CHARS]}"
+
+
+def avatar_src_sql(alias: str = "u") -> str:
+    """SQL expression for avatar_src over the users row `alias`."""
+    return (
+        f"CASE WHEN {alias}.avatar_hash IS NULL THEN NULL "
+        f"ELSE '/api/avatars/' || {alias}.id || '?v=' "
+        f"|| LEFT({alias}.avatar_hash, {AVATAR_VERSION_CHARS}) END"
+    )
+
+
+def decode_avatar(data_url: Optional[str]) -> Optional[Tuple[str, bytes]]:
+    """(mime, image bytes) from a stored data URL; None if it's unusable."""
+    if not data_url or not data_url.startswith("data:"):
+        return None
+    header, _, b64 = data_url.partition(",")
+    if ";base64" not in header:
+        return None
+    try:
+        raw = base64.b64decode(b64, validate=True)
+    except ValueError:
+        return None
+    return header[5:].split(";", 1)[0].strip().lower(), raw
@@ -44,6 +44,17 @@ class Config:
     DB_USER = os.environ.get("DB_USER", "postgres")
     DB_PASSWORD = os.environ.get("DB_PASSWORD", "AdPVLYioZHOYsrpSswoILIvpkHwIReTz")
 
+    # Connection pool (app/database.py): DB_POOL_MIN connections opened up
+    # front, at most DB_POOL_MAX in use. When all are busy a checkout
+    # queues for up to DB_POOL_WAIT_SECONDS, behind at most
+    # DB_POOL_MAX_WAITERS others; past either it fails. Connections idle
+    # for DB_POOL_VALIDATE_IDLE_SECONDS or more get a SELECT 1 before reuse.
+    DB_POOL_MIN = int(os.environ.get("DB_POOL_MIN", 1))
+    DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", 10))
+    DB_POOL_WAIT_SECONDS = float(os.environ.get("DB_POOL_WAIT_SECONDS", 10))
+    DB_POOL_MAX_WAITERS = int(os.environ.get("DB_POOL_MAX_WAITERS", 50))
+    DB_POOL_VALIDATE_IDLE_SECONDS = float(os.environ.get("DB_POOL_VALIDATE_IDLE_SECONDS", 30))
+
     # Master V API (only used if sync not disabled)
     MASTER_V_URL = "https://newapi.masterv.net/api/v3/public"
     MASTER_V_TOKEN = os.environ.get(
@@ -60,6 +71,11 @@ class Config:
     # Sync control
     DISABLE_SYNC = _env_bool("DISABLE_SYNC", False)
 
+    # users.last_seen heartbeats are buffered in memory and written in one
+    # batch this often (app/last_seen.py); the admin Online status lags by
+    # at most this much.
+    LAST_SEEN_FLUSH_SECONDS = float(os.environ.get("LAST_SEEN_FLUSH_SECONDS", 15))
+
     # ─── Mailer ────────────────────────────────────────────────────────────
     # Resend HTTPS API (preferred on Railway / Fly / Vercel — they block SMTP).
     RESEND_API_KEY = os.environ.get("RESEND_API_KEY", "")
@@ -84,3 +100,75 @@ class Config:
     # Audit trail — when on, range-aware endpoints insert a row into
     # query_audit per request. Default off; flip via env without redeploy.
     AUDIT_QUERIES = _env_bool("AUDIT_QUERIES", False)
+
+    # ─── CRM upload pipeline ───────────────────────────────────────────────
+    # Parser engine: "stream" (read_only workbook, rows yielded lazily) or
+    # "full" (whole workbook in memory — the original path, kept as a
+    # fallback). The streaming engine only looks for the header row within
+    # the first CRM_HEADER_SCAN_ROWS rows of each sheet.
+    CRM_PARSE_ENGINE = os.environ.get("CRM_PARSE_ENGINE", "stream").strip().lower()
+    CRM_HEADER_SCAN_ROWS = int(os.environ.get("CRM_HEADER_SCAN_ROWS", 50))
+
+    # Parse off the GIL (app/crm_parse_worker.py): files of at least
+    # CRM_PARSE_SUBPROCESS_MIN_BYTES are parsed in a child process, at most
+    # CRM_PARSE_PROCESSES at a time (each ~100 MB RSS while it runs). 0
+    # parses every file in the worker thread, as before. Below the size
+    # threshold the child's start-up would cost more than the parse.
+    CRM_PARSE_PROCESSES = int(os.environ.get("CRM_PARSE_PROCESSES", 2))
+    CRM_PARSE_SUBPROCESS_MIN_BYTES = int(os.environ.get("CRM_PARSE_SUBPROCESS_MIN_BYTES", 256 * 1024))
+
+    # Ingest mode: "bulk" (COPY into a staging table + set-based upserts,
+    # CRM_INGEST_BATCH_ROWS rows per transaction) or "row" (one transaction
+    # per row — the original path).
+    CRM_INGEST_MODE = os.environ.get("CRM_INGEST_MODE", "bulk").strip().lower()
+    CRM_INGEST_BATCH_ROWS = int(os.environ.get("CRM_INGEST_BATCH_ROWS", 5000))
+
+    # Post-upload recalc: "incremental" narrows assignments, intervention
+    # flags, sales_kpis and campaign_kpis to the leads the upload touched;
+    # "full" recomputes the whole campaign every time. Incremental falls
+    # back to full on its own when the stored aggregates can't be trusted,
+    # or when more than CRM_RECALC_FULL_FRACTION of the campaign's leads
+    # were touched. scripts/check_crm_recalc.py verifies the two agree.
+    CRM_RECALC_MODE = os.environ.get("CRM_RECALC_MODE", "incremental").strip().lower()
+    CRM_RECALC_FULL_FRACTION = float(os.environ.get("CRM_RECALC_FULL_FRACTION", 0.5))
+
+    # Upload size cap. 10 MB is roughly ~40k rows of typical CRM exports;
+    # anything larger is almost certainly a multi-month export that should
+    # be split upstream. MAX_CONTENT_LENGTH (Flask) rejects a request body
+    # declaring more than the cap plus multipart framing before any of it
+    # is read; the endpoint enforces the exact cap while hashing the file.
+    CRM_UPLOAD_MAX_BYTES = int(os.environ.get("CRM_UPLOAD_MAX_BYTES", 10 * 1024 * 1024))
+    MAX_CONTENT_LENGTH = CRM_UPLOAD_MAX_BYTES + 64 * 1024
+
+    # Chunked uploads (POST …/uploads/chunked, then PUT each chunk): a
+    # session nobody has sent a chunk to for this long is dropped, chunks
+    # and all, when the next session is opened.
+    CRM_UPLOAD_SESSION_TTL_HOURS = int(os.environ.get("CRM_UPLOAD_SESSION_TTL_HOURS", 24))
+
+    # Upload worker pool (app/crm_processor.py): CRM_UPLOAD_WORKERS threads
+    # ingest uploads, at most CRM_UPLOAD_QUEUE_SIZE more may wait — beyond
+    # that the upload endpoint answers 503. Each running upload holds one
+    # pooled DB connection; its file sits in a temp file, not in memory.
+    CRM_UPLOAD_WORKERS = int(os.environ.get("CRM_UPLOAD_WORKERS", 2))
+    CRM_UPLOAD_QUEUE_SIZE = int(os.environ.get("CRM_UPLOAD_QUEUE_SIZE", 20))
+
+    # How often (at most) an upload worker writes rows_processed / phase /
+    # timings to crm_report_uploads for the status endpoint.
+    CRM_PROGRESS_INTERVAL_SECONDS = float(os.environ.get("CRM_PROGRESS_INTERVAL_SECONDS", 1))
+
+    # Background jobs (app/crm_jobs.py) — mapping-change recalcs run off
+    # the request. The worker sleeps up to CRM_JOB_POLL_SECONDS between
+    # polls when nothing wakes it; a job left PROCESSING for longer than
+    # CRM_JOB_STALE_SECONDS (worker died mid-run) is claimed again.
+    CRM_JOB_POLL_SECONDS = float(os.environ.get("CRM_JOB_POLL_SECONDS", 5))
+    CRM_JOB_STALE_SECONDS = int(os.environ.get("CRM_JOB_STALE_SECONDS", 1800))
+
+    # Live events (app/crm_events.py, GET /api/crm/events). Each open
+    # stream holds one gunicorn thread (not a DB connection): at most
+    # CRM_SSE_MAX_CLIENTS per process, leaving the rest of --threads for
+    # ordinary requests; past the cap clients fall back to polling. Pages
+    # open a stream only while they follow an upload, so a handful is
+    # enough — keep it well under the Procfile's --threads. A stream
+    # closes after CRM_SSE_MAX_SECONDS and the browser reconnects.
+    CRM_SSE_MAX_CLIENTS = int(os.environ.get("CRM_SSE_MAX_CLIENTS", 6))
+    CRM_SSE_MAX_SECONDS = int(os.environ.get("CRM_SSE_MAX_SECONDS", 300))
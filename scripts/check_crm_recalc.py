@@ -0,0 +1,61 @@
+"""
+Consistency check for the CRM post-upload recalc.
+
+Uploads normally run the incremental recalc (CRM_RECALC_MODE=incremental),
+which only rebuilds what the touched leads can have changed. This script
+compares what's stored in campaign_kpis / sales_kpis /
+manager_intervention_flags / lead_assignments (and the window each event
+is stamped with) against a fresh full recalc and prints every difference.
+Running it also leaves the campaign in the full-recalc state, so it
+doubles as a repair tool.
+
+Usage:
+  # Every campaign that has CRM leads:
+  python scripts/check_crm_recalc.py
+
+  # Specific campaigns:
+  python scripts/check_crm_recalc.py 12 14
+
+Exits 1 if any campaign was inconsistent.
+"""
+import os
+import sys
+
+# Make "app" importable when invoked as a one-off script.
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _ROOT not in sys.path:
+    sys.path.insert(0, _ROOT)
+
+from app.crm_logic import check_recalc_consistency
+from app.database import get_conn
+
+
+def main():
+    conn = get_conn()
+    try:
+        if len(sys.argv) > 1:
+            campaign_ids = [int(a) for a in sys.argv[1:]]
+        else:
+            with conn.cursor() as cur:
+                cur.execute("SELECT DISTINCT campaign_id FROM leads ORDER BY campaign_id")
+                campaign_ids = [r[0] for r in cur.fetchall()]
+
+        bad = 0
+        for cid in campaign_ids:
+            problems = check_recalc_consistency(cid, conn)
+            if problems:
+                bad += 1
+                print(f"❌ campaign {cid}: {len(problems)} mismatch(es)")
+                for line in problems:
+                    print(f"   {line}")
+            else:
+                print(f"✅ campaign {cid}: consistent")
+    finally:
+        conn.close()
+
+    print(f"\n{len(campaign_ids) - bad}/{len(campaign_ids)} campaigns consistent")
+    sys.exit(1 if bad else 0)
+
+
+if __name__ == "__main__":
+    main()
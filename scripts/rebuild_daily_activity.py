@@ -0,0 +1,45 @@
+"""
+Rebuild the lead_events_daily rollup from lead_events.
+
+Uploads keep the rollup current as they insert events, and every full
+recalc recounts it, so this is only needed to repair a campaign by hand
+(or after editing lead_events directly in SQL).
+
+Usage:
+  # Every campaign that has CRM events:
+  python scripts/rebuild_daily_activity.py
+
+  # Specific campaigns:
+  python scripts/rebuild_daily_activity.py 12 14
+"""
+import os
+import sys
+
+# Make "app" importable when invoked as a one-off script.
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _ROOT not in sys.path:
+    sys.path.insert(0, _ROOT)
+
+from app.crm_logic import rebuild_daily_activity
+from app.database import get_conn
+
+
+def main():
+    conn = get_conn()
+    try:
+        if len(sys.argv) > 1:
+            campaign_ids = [int(a) for a in sys.argv[1:]]
+        else:
+            with conn.cursor() as cur:
+                cur.execute("SELECT DISTINCT campaign_id FROM lead_events ORDER BY campaign_id")
+                campaign_ids = [r[0] for r in cur.fetchall()]
+
+        for cid in campaign_ids:
+            n = rebuild_daily_activity(cid, conn)
+            print(f"✅ campaign {cid}: {n} day/stage rows")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""
+Parity test: set-based assignment rebuild vs the Python reference.
+
+rebuild_assignments_for_campaign builds lead_assignments with one window-
+function INSERT … SELECT. _assignments_from_events is the readable
+statement of the same rules. This script generates random timelines
+(rep changes, unmatched names with messy whitespace, rep-less rows,
+voided events, NULL dates, timestamp ties), runs the SQL rebuild, and
+checks every lead's windows against the Python function. It also checks
+the lead_events.assignment_id stamp against the [started_at, ended_at)
+range join the readers used before the stamp existed.
+
+Needs a reachable PostgreSQL in DATABASE_URL, but never touches real data:
+leads / lead_events / lead_assignments are created as TEMP tables, which
+shadow the permanent ones for this session only. Without DATABASE_URL the
+script prints a skip notice and exits 0.
+
+Run: PYTHONIOENCODING=utf-8 DISABLE_SYNC=true DATABASE_URL=... python scripts/test_assignments_sql.py
+"""
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.crm_logic import (  # noqa: E402
+    _assignments_from_events,
+    rebuild_assignments_for_campaign,
+)
+
+
+# ─── Tiny harness ───────────────────────────────────────────────────────
+
+_failures = 0
+
+
+def _check(name, ok, detail=""):
+    global _failures
+    if ok:
+        print(f"  ok   {name}")
+    else:
+        _failures += 1
+        print(f"  FAIL {name}: {detail}")
+
+
+# ─── Fixtures ───────────────────────────────────────────────────────────
+
+_TEMP_SCHEMA = """
+    CREATE TEMP TABLE leads (
+        id          SERIAL PRIMARY KEY,
+        campaign_id INTEGER NOT NULL
+    );
+    CREATE TEMP TABLE lead_events (
+        id                 SERIAL PRIMARY KEY,
+        lead_id            INTEGER NOT NULL,
+        campaign_id        INTEGER NOT NULL,
+        sales_user_id      INTEGER,
+        raw_sales_rep_name TEXT,
+        follow_date        TIMESTAMP,
+        is_voided          BOOLEAN DEFAULT FALSE,
+        assignment_id      INTEGER
+    );
+    CREATE TEMP TABLE lead_assignments (
+        id                 SERIAL PRIMARY KEY,
+        lead_id            INTEGER NOT NULL,
+        campaign_id        INTEGER NOT NULL,
+        sales_user_id      INTEGER,
+        raw_sales_rep_name TEXT,
+        assignment_type    VARCHAR(15) NOT NULL,
+        started_at         TIMESTAMP NOT NULL,
+        ended_at           TIMESTAMP,
+        created_at         TIMESTAMP DEFAULT NOW()
+    );
+"""
+
+# Same rep spelled several ways, a rep who never matched a user, and
+# blanks that must be skipped rather than breaking the current window.
+_RAW_NAMES = (
+    "Mahmoud Amr", "  mahmoud   amr ", "MAHMOUD AMR", "Ghost Rep",
+    "ghost\trep", "", "   ", None,
+)
+
+
+def _connect():
+    import psycopg2
+    return psycopg2.connect(os.environ["DATABASE_URL"])
+
+
+def _seed(conn, rnd, campaign_id, n_leads):
+    base = datetime(2026, 1, 1, 9, 0)
+    with conn.cursor() as cur:
+        for _ in range(n_leads):
+            cur.execute("INSERT INTO leads (campaign_id) VALUES (%s) RETURNING id",
+                        (campaign_id,))
+            lead_id = cur.fetchone()[0]
+            for _ in range(rnd.randint(0, 12)):
+                # A small pool of hours so several events share a timestamp
+                # and the id tiebreaker actually matters.
+                follow = base + timedelta(hours=rnd.randint(0, 30))
+                cur.execute(
+                    """
+                    INSERT INTO lead_events
+                        (lead_id, campaign_id, sales_user_id, raw_sales_rep_name,
+                         follow_date, is_voided)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    """,
+                    (
+                        lead_id, campaign_id,
+                        rnd.choice((None, None, 1, 2, 3)),
+                        rnd.choice(_RAW_NAMES),
+                        None if rnd.random() < 0.08 else follow,
+                        rnd.random() < 0.08,
+                    ),
+                )
+    conn.commit()
+
+
+def _python_assignments(conn, campaign_id):
+    """Oracle: the per-lead Python rules over the same rows."""
+    import psycopg2.extras
+    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        cur.execute(
+            """
+            SELECT le.lead_id, le.follow_date, le.sales_user_id, le.raw_sales_rep_name
+            FROM lead_events le
+            JOIN leads l ON l.id = le.lead_id
+            WHERE l.campaign_id = %s
+              AND le.is_voided = FALSE
+              AND le.follow_date IS NOT NULL
+            ORDER BY le.lead_id, le.follow_date ASC, le.id ASC
+            """,
+            (campaign_id,),
+        )
+        by_lead: dict = {}
+        for ev in cur.fetchall():
+            by_lead.setdefault(ev["lead_id"], []).append(ev)
+    out = {}
+    for lead_id, events in by_lead.items():
+        rows = [
+            (a["sales_user_id"], a["raw_sales_rep_name"], a["assignment_type"],
+             a["started_at"], a["ended_at"])
+            for a in _assignments_from_events(events)
+        ]
+        if rows:
+            out[lead_id] = sorted(rows, key=repr)
+    return out
+
+
+def _stored_assignments(conn, campaign_id):
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT lead_id, sales_user_id, raw_sales_rep_name, assignment_type,
+                   started_at, ended_at
+            FROM lead_assignments WHERE campaign_id = %s
+            """,
+            (campaign_id,),
+        )
+        out: dict = {}
+        for r in cur.fetchall():
+            out.setdefault(r[0], []).append(tuple(r[1:]))
+    conn.commit()
+    return {lead_id: sorted(rows, key=repr) for lead_id, rows in out.items()}
+
+
+def _range_join_stamps(conn, campaign_id):
+    """Oracle for the stamp: the window each event falls in by date."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT le.id, a.id
+            FROM lead_events le
+            LEFT JOIN lead_assignments a
+                   ON a.lead_id = le.lead_id
+                  AND le.follow_date >= a.started_at
+                  AND (a.ended_at IS NULL OR le.follow_date < a.ended_at)
+            WHERE le.campaign_id = %s
+            """,
+            (campaign_id,),
+        )
+        rows = cur.fetchall()
+    conn.commit()
+    out: dict = {}
+    for event_id, assignment_id in rows:
+        out.setdefault(event_id, []).append(assignment_id)
+    return out
+
+
+def _stored_stamps(conn, campaign_id):
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT id, assignment_id FROM lead_events WHERE campaign_id = %s",
+            (campaign_id,),
+        )
+        out = {r[0]: [r[1]] for r in cur.fetchall()}
+    conn.commit()
+    return out
+
+
+def _diff(expected, stored):
+    bad = [lid for lid in set(expected) | set(stored)
+           if expected.get(lid) != stored.get(lid)]
+    if not bad:
+        return ""
+    lid = min(bad)
+    return (f"{len(bad)} lead(s) differ; lead {lid}: "
+            f"python={expected.get(lid)} sql={stored.get(lid)}")
+
+
+# ─── Tests ──────────────────────────────────────────────────────────────
+
+def test_campaign_rebuild(conn):
+    print("─── campaign rebuild matches _assignments_from_events ───")
+    for seed in range(5):
+        rnd = random.Random(seed)
+        with conn.cursor() as cur:
+            cur.execute("TRUNCATE leads, lead_events, lead_assignments")
+        _seed(conn, rnd, campaign_id=1, n_leads=150)
+        _seed(conn, rnd, campaign_id=2, n_leads=20)
+
+        written = rebuild_assignments_for_campaign(1, conn)
+        expected = _python_assignments(conn, 1)
+        stored = _stored_assignments(conn, 1)
+        _check(f"seed {seed}: same windows per lead", expected == stored,
+               detail=_diff(expected, stored))
+        _check(f"seed {seed}: rowcount matches",
+               written == sum(len(v) for v in expected.values()),
+               detail=str(written))
+        _check(f"seed {seed}: other campaign untouched",
+               _stored_assignments(conn, 2) == {})
+
+        expected_stamps = _range_join_stamps(conn, 1)
+        _check(f"seed {seed}: events stamped with their window",
+               _stored_stamps(conn, 1) == expected_stamps,
+               detail=_diff(expected_stamps, _stored_stamps(conn, 1)))
+
+        # Rebuilding again must replace, not append.
+        rebuild_assignments_for_campaign(1, conn)
+        _check(f"seed {seed}: rebuild is idempotent",
+               _stored_assignments(conn, 1) == expected)
+        _check(f"seed {seed}: stamps follow the new assignment ids",
+               _stored_stamps(conn, 1) == _range_join_stamps(conn, 1))
+
+
+def test_subset_rebuild(conn):
+    print("─── affected_lead_ids rebuild ───")
+    rnd = random.Random(99)
+    with conn.cursor() as cur:
+        cur.execute("TRUNCATE leads, lead_events, lead_assignments")
+    _seed(conn, rnd, campaign_id=1, n_leads=60)
+    rebuild_assignments_for_campaign(1, conn)
+    before = _stored_assignments(conn, 1)
+
+    # Flip the rep on one event per chosen lead, then rebuild only those.
+    with conn.cursor() as cur:
+        cur.execute("SELECT id FROM leads ORDER BY id LIMIT 10")
+        chosen = [r[0] for r in cur.fetchall()]
+        cur.execute(
+            """
+            UPDATE lead_events SET sales_user_id = 42
+            WHERE id IN (SELECT MAX(id) FROM lead_events
+                         WHERE lead_id = ANY(%s) GROUP BY lead_id)
+            """,
+            (chosen,),
+        )
+    conn.commit()
+    rebuild_assignments_for_campaign(1, conn, affected_lead_ids=chosen)
+
+    expected = _python_assignments(conn, 1)
+    stored = _stored_assignments(conn, 1)
+    chosen_set = set(chosen)
+    _check("chosen leads match the oracle",
+           {k: v for k, v in stored.items() if k in chosen_set}
+           == {k: v for k, v in expected.items() if k in chosen_set},
+           detail=_diff({k: v for k, v in expected.items() if k in chosen_set},
+                        {k: v for k, v in stored.items() if k in chosen_set}))
+    _check("other leads left as they were",
+           {k: v for k, v in stored.items() if k not in chosen_set}
+           == {k: v for k, v in before.items() if k not in chosen_set})
+    _check("stamps match the range join after a subset rebuild",
+           _stored_stamps(conn, 1) == _range_join_stamps(conn, 1))
+
+
+def main():
+    if not os.environ.get("DATABASE_URL"):
+        print("⏭  DATABASE_URL not set — skipping SQL assignment parity test")
+        return
+
+    conn = _connect()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(_TEMP_SCHEMA)
+        conn.commit()
+        test_campaign_rebuild(conn)
+        test_subset_rebuild(conn)
+    finally:
+        conn.close()
+
+    print()
+    if _failures:
+        print(f"❌ {_failures} failure(s)")
+        sys.exit(1)
+    print("✅ all green")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Tests for the live CRM event stream (app/crm_events.py).
+
+Fan-out, the overflow → resync path, SSE framing and the badge cache are
+exercised in-process and always run. The NOTIFY → LISTEN round trip needs
+a reachable PostgreSQL in DATABASE_URL; it only sends notifications on the
+crm_events channel and doesn't touch any table. Without DATABASE_URL it
+prints a skip notice.
+
+Run: PYTHONIOENCODING=utf-8 DISABLE_SYNC=true [DATABASE_URL=...] python scripts/test_crm_events.py
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app.crm_events as ev  # noqa: E402
+
+
+# ─── Tiny harness ───────────────────────────────────────────────────────
+
+_failures = 0
+
+
+def _check(name, ok, detail=""):
+    global _failures
+    if ok:
+        print(f"  ok   {name}")
+    else:
+        _failures += 1
+        print(f"  FAIL {name}: {detail}")
+
+
+def _drain(sub):
+    out = []
+    while not sub.queue.empty():
+        out.append(sub.queue.get_nowait())
+    return out
+
+
+# ─── In-process fan-out ─────────────────────────────────────────────────
+
+def test_dispatch():
+    print("─── dispatch → subscribers ───")
+    a, b = ev.Subscription(), ev.Subscription()
+    ev._subscribers.update({a, b})
+    try:
+        ev.dispatch(json.dumps({"type": "upload", "upload_id": 7, "status": "PROCESSING"}))
+        got_a, got_b = _drain(a), _drain(b)
+        _check("every stream gets the event",
+               got_a == got_b == [("upload", {"upload_id": 7, "status": "PROCESSING"})],
+               detail=f"{got_a} / {got_b}")
+
+        ev.dispatch("not json")
+        ev.dispatch(json.dumps({"upload_id": 1}))
+        _check("malformed payloads are dropped", not _drain(a))
+
+        counts = {"open_count": 3, "high_priority": 1, "medium_priority": 2}
+        ev.dispatch(json.dumps(dict(counts, type="intervention")))
+        _check("intervention event refreshes the badge cache",
+               ev.badge_snapshot() == counts, detail=str(ev.badge_snapshot()))
+        _drain(a)
+        _drain(b)
+
+        ev.unsubscribe(b)
+        ev.dispatch(json.dumps({"type": "upload", "upload_id": 8}))
+        _check("unsubscribed stream hears nothing", not _drain(b) and len(_drain(a)) == 1)
+    finally:
+        ev._subscribers.clear()
+
+
+def test_overflow_and_stream():
+    print("─── event_stream framing + overflow ───")
+    _check("SSE framing",
+           ev.format_sse("upload", {"a": 1}) == 'event: upload\ndata: {"a": 1}\n\n')
+
+    sub = ev.Subscription()
+    for i in range(ev._QUEUE_SIZE + 5):
+        sub.offer("upload", {"i": i})
+    _check("full queue marks the stream as having missed events",
+           sub.missed and sub.queue.full())
+
+    # Badge cache is warm from test_dispatch, so the stream doesn't query.
+    stream = ev.event_stream(sub)
+    head = [next(stream), next(stream)]
+    _check("stream opens with retry + badge counts",
+           head[0].startswith("retry:") and head[1].startswith("event: intervention\n"),
+           detail=str(head))
+    first = next(stream)
+    _check("queued events follow in order", '"i": 0' in first, detail=first)
+    _check("then one resync for what was dropped",
+           next(stream) == ev.format_sse("resync", {}) and not sub.missed)
+    stream.close()
+
+
+def test_subscribe_cap():
+    print("─── CRM_SSE_MAX_CLIENTS ───")
+    from config import Config
+    saved = Config.CRM_SSE_MAX_CLIENTS
+    Config.CRM_SSE_MAX_CLIENTS = 2
+    try:
+        subs = [ev.subscribe(), ev.subscribe()]
+        _check("up to the cap", all(subs) and ev.subscriber_count() == 2)
+        _check("past the cap → None", ev.subscribe() is None)
+        ev.unsubscribe(subs[0])
+        again = ev.subscribe()
+        _check("a closed stream frees its slot", again is not None)
+    finally:
+        Config.CRM_SSE_MAX_CLIENTS = saved
+        ev._subscribers.clear()
+
+
+# ─── NOTIFY → LISTEN (needs PostgreSQL) ─────────────────────────────────
+
+def test_round_trip():
+    print("─── NOTIFY → listener → stream ───")
+    import psycopg2
+
+    sub = ev.subscribe()  # also starts the listener thread
+    # LISTEN is issued asynchronously by the thread; give it a moment.
+    deadline = time.monotonic() + 5
+    conn = psycopg2.connect(os.environ["DATABASE_URL"])
+    try:
+        got = []
+        while time.monotonic() < deadline and not got:
+            with conn.cursor() as cur:
+                ev.notify(cur, ev.EVENT_UPLOAD, {"upload_id": 99, "status": "PROCESSING"})
+            conn.commit()
+            time.sleep(0.2)
+            got = _drain(sub)
+        _check("committed notify reaches the stream",
+               got[:1] == [("upload", {"upload_id": 99, "status": "PROCESSING"})], detail=str(got))
+
+        with conn.cursor() as cur:
+            ev.notify(cur, ev.EVENT_UPLOAD, {"upload_id": 100})
+        conn.rollback()
+        time.sleep(0.5)
+        leftover = [e for e in _drain(sub) if e[1].get("upload_id") == 100]
+        _check("rolled-back notify is never delivered", not leftover, detail=str(leftover))
+    finally:
+        conn.close()
+        ev.unsubscribe(sub)
+
+
+def main():
+    test_dispatch()
+    test_overflow_and_stream()
+
+    if not os.environ.get("DATABASE_URL"):
+        print("⏭  DATABASE_URL not set — skipping subscribe / LISTEN tests")
+    else:
+        test_subscribe_cap()
+        test_round_trip()
+
+    print()
+    if _failures:
+        print(f"❌ {_failures} failure(s)")
+        sys.exit(1)
+    print("✅ all green")
+
+
+if __name__ == "__main__":
+    main()
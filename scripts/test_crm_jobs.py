@@ -0,0 +1,230 @@
+"""
+Tests for the CRM job queue (app/crm_jobs.py).
+
+The status roll-up (summarize_job) is pure and always runs. The claim /
+coalescing tests need a reachable PostgreSQL in DATABASE_URL but never
+touch real data: crm_jobs is created as a TEMP table, which shadows the
+permanent one for this session only. Without DATABASE_URL those tests
+print a skip notice.
+
+Run: PYTHONIOENCODING=utf-8 DISABLE_SYNC=true [DATABASE_URL=...] python scripts/test_crm_jobs.py
+"""
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.crm_jobs import (  # noqa: E402
+    _MAX_ATTEMPTS,
+    claim_next_job,
+    enqueue_campaign_recalc,
+    enqueue_mapping_change,
+    summarize_job,
+)
+
+
+# ─── Tiny harness ───────────────────────────────────────────────────────
+
+_failures = 0
+
+
+def _check(name, ok, detail=""):
+    global _failures
+    if ok:
+        print(f"  ok   {name}")
+    else:
+        _failures += 1
+        print(f"  FAIL {name}: {detail}")
+
+
+# ─── summarize_job (pure) ───────────────────────────────────────────────
+
+def _job(job_type, status, result=None, error_message=None):
+    ts = datetime(2026, 1, 1, 9, 0)
+    return {
+        "id": 1, "job_type": job_type, "campaign_id": None, "status": status,
+        "result": result, "error_message": error_message,
+        "created_at": ts, "started_at": ts, "finished_at": ts,
+    }
+
+
+def _child(job_id, campaign_id, status, error_message=None):
+    return {"id": job_id, "campaign_id": campaign_id, "status": status,
+            "error_message": error_message}
+
+
+def test_summarize_job():
+    print("─── summarize_job ───")
+    out = summarize_job(_job("mapping_change", "PENDING"), [])
+    _check("pending mapping job has unknown total",
+           out["status"] == "PENDING" and out["progress"] == {"done": 0, "total": None},
+           detail=str(out))
+    _check("finished_at hidden until terminal", out["finished_at"] is None)
+
+    result = {"affected_campaigns": [3, 5], "recalc_job_ids": [7, 8]}
+    out = summarize_job(_job("mapping_change", "COMPLETED", result),
+                        [_child(7, 3, "COMPLETED"), _child(8, 5, "PROCESSING")])
+    _check("mapping job stays PROCESSING while recalcs run",
+           out["status"] == "PROCESSING" and out["progress"] == {"done": 1, "total": 2},
+           detail=str(out))
+    _check("affected campaigns passed through", out["affected_campaigns"] == [3, 5])
+
+    out = summarize_job(_job("mapping_change", "COMPLETED", result),
+                        [_child(7, 3, "COMPLETED"), _child(8, 5, "FAILED", "boom")])
+    _check("a failed recalc fails the mapping job",
+           out["status"] == "FAILED" and out["error_message"] == "boom", detail=str(out))
+
+    out = summarize_job(_job("mapping_change", "COMPLETED",
+                             {"affected_campaigns": [], "recalc_job_ids": []}), [])
+    _check("no affected campaigns → COMPLETED with 0/0",
+           out["status"] == "COMPLETED" and out["progress"] == {"done": 0, "total": 0},
+           detail=str(out))
+
+    out = summarize_job(_job("campaign_recalc", "PROCESSING"), [])
+    _check("recalc job progress is 0/1 while running",
+           out["progress"] == {"done": 0, "total": 1}, detail=str(out))
+
+
+# ─── Queue behaviour (needs PostgreSQL) ─────────────────────────────────
+
+_TEMP_SCHEMA = """
+    CREATE TEMP TABLE crm_jobs (
+        id             SERIAL PRIMARY KEY,
+        job_type       VARCHAR(30) NOT NULL,
+        campaign_id    INTEGER,
+        payload        JSONB DEFAULT '{}'::jsonb,
+        status         VARCHAR(20) DEFAULT 'PENDING',
+        attempts       INTEGER DEFAULT 0,
+        result         JSONB,
+        error_message  TEXT,
+        requested_by   INTEGER,
+        created_at     TIMESTAMP DEFAULT NOW(),
+        started_at     TIMESTAMP,
+        finished_at    TIMESTAMP
+    );
+    CREATE UNIQUE INDEX ON crm_jobs(campaign_id)
+        WHERE job_type = 'campaign_recalc' AND status = 'PENDING';
+"""
+
+
+def _connect():
+    import psycopg2
+    return psycopg2.connect(os.environ["DATABASE_URL"])
+
+
+def _reset(conn):
+    with conn.cursor() as cur:
+        cur.execute("TRUNCATE crm_jobs RESTART IDENTITY")
+    conn.commit()
+
+
+def _status(conn, job_id):
+    with conn.cursor() as cur:
+        cur.execute("SELECT status, attempts FROM crm_jobs WHERE id = %s", (job_id,))
+        row = cur.fetchone()
+    conn.commit()
+    return row
+
+
+def test_coalescing(conn):
+    print("─── campaign_recalc coalescing ───")
+    _reset(conn)
+    with conn.cursor() as cur:
+        a = enqueue_campaign_recalc(cur, 1)
+        b = enqueue_campaign_recalc(cur, 1)
+        c = enqueue_campaign_recalc(cur, 2)
+    conn.commit()
+    _check("second enqueue returns the pending job", a == b, detail=f"{a} vs {b}")
+    _check("other campaign gets its own job", c != a)
+
+    job = claim_next_job(conn)
+    _check("claims oldest first", job and job["id"] == a, detail=str(job))
+    with conn.cursor() as cur:
+        d = enqueue_campaign_recalc(cur, 1)
+    conn.commit()
+    _check("enqueue after claim makes a new pending job", d not in (a, c), detail=str(d))
+
+    job = claim_next_job(conn)
+    _check("recalc for a campaign already PROCESSING is skipped",
+           job and job["id"] == c, detail=str(job))
+    _check("nothing else runnable", claim_next_job(conn) is None)
+
+
+def test_mapping_jobs(conn):
+    print("─── mapping_change jobs ───")
+    _reset(conn)
+    with conn.cursor() as cur:
+        first = enqueue_mapping_change(cur, "stage", "Following", None, None)
+        second = enqueue_mapping_change(cur, "sales_rep", "Ghost", 4, 1)
+    conn.commit()
+
+    job = claim_next_job(conn)
+    _check("claimed in FIFO order", job and job["id"] == first, detail=str(job))
+    job = claim_next_job(conn)
+    _check("payload round-trips",
+           job and job["payload"] == {"kind": "sales_rep", "raw": "Ghost", "scope": 4},
+           detail=str(job and job["payload"]))
+    _check("claim bumps attempts", job and job["attempts"] == 1, detail=str(job))
+
+    try:
+        with conn.cursor() as cur:
+            enqueue_mapping_change(cur, "colour", "x", None, None)
+        ok = False
+    except ValueError:
+        ok = True
+    conn.rollback()
+    _check("unknown mapping kind rejected", ok)
+
+
+def test_stale_reclaim(conn):
+    print("─── stale PROCESSING jobs ───")
+    _reset(conn)
+    with conn.cursor() as cur:
+        job_id = enqueue_campaign_recalc(cur, 9)
+    conn.commit()
+    claim_next_job(conn)
+    _check("fresh PROCESSING job isn't reclaimed", claim_next_job(conn) is None)
+
+    with conn.cursor() as cur:
+        cur.execute("UPDATE crm_jobs SET started_at = NOW() - INTERVAL '2 days'")
+    conn.commit()
+    job = claim_next_job(conn)
+    _check("stale job is claimed again",
+           job and job["id"] == job_id and job["attempts"] == 2, detail=str(job))
+
+    with conn.cursor() as cur:
+        cur.execute("UPDATE crm_jobs SET started_at = NOW() - INTERVAL '2 days', attempts = %s",
+                    (_MAX_ATTEMPTS,))
+    conn.commit()
+    _check("exhausted job isn't claimed", claim_next_job(conn) is None)
+    _check("exhausted job is marked FAILED",
+           _status(conn, job_id) == ("FAILED", _MAX_ATTEMPTS), detail=str(_status(conn, job_id)))
+
+
+def main():
+    test_summarize_job()
+
+    if not os.environ.get("DATABASE_URL"):
+        print("⏭  DATABASE_URL not set — skipping queue tests")
+    else:
+        conn = _connect()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(_TEMP_SCHEMA)
+            conn.commit()
+            test_coalescing(conn)
+            test_mapping_jobs(conn)
+            test_stale_reclaim(conn)
+        finally:
+            conn.close()
+
+    print()
+    if _failures:
+        print(f"❌ {_failures} failure(s)")
+        sys.exit(1)
+    print("✅ all green")
+
+
+if __name__ == "__main__":
+    main()
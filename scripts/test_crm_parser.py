@@ -5,11 +5,23 @@ Covers what's runnable WITHOUT touching the real database:
   - normalize_mobile     — every Egyptian/Gulf shape we promised to handle
   - normalize_stage      — DEFAULT_STAGE_MAP path (conn=None)
   - normalize_sales_name — whitespace/case collapsing
+  - MappingResolver      — campaign → global → users → default precedence,
+                           memoisation
   - compute_event_hash   — stable across runs, varies on every component
+  - _merge_stage_counts  — incremental campaign_kpis delta arithmetic
+  - _plan_intervention_writes — preserve vs upsert split for flags
   - parse_crm_excel      — forward-fill on Client name / Mobile, header
                            aliases, unmatched rep collection, comment
-                           passthrough
+                           passthrough; "stream" and "full" engines agree;
+                           CSV / TSV in UTF-8, Windows-1256 and UTF-16 parse
+                           the same as the .xlsx; warnings tallied per kind
   - dedup via event_hash — same row twice → same hash
+  - hash_upload_stream   — chunked SHA-256 + size cap of an upload
+  - upload_session_chunk_* — chunk count / sizes of a resumable upload
+  - iter_rows_in_subprocess — parsing in a child process gives the same
+                           rows / summary / errors as in-thread
+  - upload_rate_and_eta  — status-endpoint throughput / ETA arithmetic,
+                           plus the parser's rows_estimate it feeds on
 
 The parser smoke test feeds in a FakeConn so we don't need PostgreSQL
 running locally. The blueprint, the background thread, and the live INSERTs
@@ -18,7 +30,9 @@ and are smoke-tested with `curl` once the server is up.
 
 Run: PYTHONIOENCODING=utf-8 DISABLE_SYNC=true python scripts/test_crm_parser.py
 """
+import csv
 import io
+import json
 import os
 import sys
 from datetime import datetime
@@ -32,9 +46,12 @@ from app.crm_logic import (  # noqa: E402
     normalize_mobile,
     normalize_sales_name,
     normalize_stage,
+    load_resolvers,
     _classify_lead_intervention,
+    _plan_intervention_writes,
     _assignments_from_events,
     _response_rate_pct,
+    _merge_stage_counts,
     enrich_timeline_events,
     ASSIGNMENT_TYPE_FRESH,
     ASSIGNMENT_TYPE_ROTATION,
@@ -46,7 +63,14 @@ from app.crm_logic import (  # noqa: E402
     PRIORITY_HIGH,
     PRIORITY_MEDIUM,
 )
-from app.crm_parser import parse_crm_excel  # noqa: E402
+from app.crm_parser import (  # noqa: E402
+    PARSE_ENGINES,
+    WARNING_SAMPLE_ROWS,
+    add_warning,
+    iter_crm_excel,
+    new_parse_summary,
+    parse_crm_excel,
+)
 
 
 # ─── Tiny harness ───────────────────────────────────────────────────────
@@ -65,11 +89,12 @@ def _check(name, ok, detail=""):
 
 # ─── FakeConn — satisfies the bits parse_crm_excel needs ───────────────
 #
-# normalize_stage and match_sales_user both call `conn.cursor()` as a
-# context manager and run a SELECT. We return zero rows for every query
-# so the helpers fall back to DEFAULT_STAGE_MAP / users-table-not-found
-# (also empty under FakeConn). That's enough to exercise the parser end-
-# to-end without standing up Postgres.
+# The parser's MappingResolver (and the normalize_stage / match_sales_user
+# helpers) call `conn.cursor()` as a context manager and run a SELECT. We
+# return zero rows for every query so resolution falls back to
+# DEFAULT_STAGE_MAP / users-table-not-found (also empty under FakeConn).
+# That's enough to exercise the parser end-to-end without standing up
+# Postgres.
 
 class _FakeCursor:
     def __enter__(self): return self
@@ -83,6 +108,25 @@ class _FakeConn:
     def cursor(self, *a, **kw): return _FakeCursor()
 
 
+# ScriptedConn — answers each SELECT with canned rows picked by a substring
+# of the SQL, and counts queries so tests can assert on round trips.
+
+class _ScriptedCursor(_FakeCursor):
+    def __init__(self, conn): self._conn, self._rows = conn, []
+    def execute(self, sql, *_args, **_kwargs):
+        self._conn.queries += 1
+        self._rows = next((rows for needle, rows in self._conn.script
+                           if needle in sql), [])
+    def fetchone(self): return self._rows[0] if self._rows else None
+    def fetchall(self): return list(self._rows)
+
+
+class _ScriptedConn:
+    def __init__(self, script):
+        self.script, self.queries = script, 0
+    def cursor(self, *a, **kw): return _ScriptedCursor(self)
+
+
 # ─── Mobile normalization ───────────────────────────────────────────────
 
 def test_normalize_mobile():
@@ -143,6 +187,63 @@ def test_normalize_sales_name():
     _check("None → empty", normalize_sales_name(None) == "")
 
 
+# ─── MappingResolver ────────────────────────────────────────────────────
+
+def test_mapping_resolver():
+    print("─── MappingResolver ───")
+    conn = _ScriptedConn([
+        ("stage_mappings", [
+            (None, "Hot Lead", "INTERESTED"),
+            (7, "hot lead", "MEETING"),      # campaign 7 override
+            (None, "Following", "REQUEST"),  # global beats DEFAULT_STAGE_MAP
+            (9, "Zoom", "MEETING"),          # other campaign — not ours
+        ]),
+        ("sales_rep_mappings", [
+            (None, "M. Amr", 11),
+            (7, "m. amr", 12),
+        ]),
+        ("FROM users", [
+            (11, "Mahmoud Amr"),
+            (13, "  Reham   Hany "),
+            (14, "Reham Hany"),             # duplicate name → lowest id wins
+        ]),
+    ])
+    resolvers = load_resolvers(conn, [7, 8])
+    _check("three queries for any number of campaigns", conn.queries == 3,
+           detail=str(conn.queries))
+    r7, r8 = resolvers[7], resolvers[8]
+
+    _check("campaign override wins", r7.stage("HOT LEAD ") == "MEETING")
+    _check("global used when no override", r8.stage("Hot Lead") == "INTERESTED")
+    _check("global beats DEFAULT_STAGE_MAP", r8.stage("following") == "REQUEST")
+    _check("DEFAULT_STAGE_MAP fallback", r8.stage("No Answer") == "NO_ANSWER")
+    _check("other campaign's override ignored", r8.stage("Zoom") is None)
+    _check("blank / None stage → None", r8.stage("  ") is None and r8.stage(None) is None)
+
+    _check("rep: campaign mapping wins", r7.sales_user("M. Amr") == 12)
+    _check("rep: global mapping", r8.sales_user("m. amr") == 11)
+    _check("rep: users.full_name match, ws-collapsed",
+           r8.sales_user("reham  HANY") == 13)
+    _check("rep: unknown → None", r8.sales_user("Nobody") is None)
+
+    before = conn.queries
+    for _ in range(1000):
+        r7.stage("Hot Lead")
+        r7.sales_user("M. Amr")
+    _check("memoised lookups never hit the connection", conn.queries == before)
+
+    # Parser end-to-end: one resolver load, regardless of row count.
+    conn = _ScriptedConn([("FROM users", [(5, "Mahmoud Amr")])])
+    result = parse_crm_excel(io.BytesIO(_build_sample_xlsx()), campaign_id=42, conn=conn)
+    _check("parser issues only the resolver's three queries",
+           conn.queries == 3, detail=str(conn.queries))
+    _check("parser resolves rep through users",
+           result["rows"][0].sales_user_id == 5)
+    _check("only the unmapped rep is reported",
+           result["unmatched_sales_reps"] == ["Reham Hany"],
+           detail=str(result["unmatched_sales_reps"]))
+
+
 # ─── Event hashing ──────────────────────────────────────────────────────
 
 def test_compute_event_hash():
@@ -219,36 +320,36 @@ def test_parser():
     # Forward-fill
     if len(rows) >= 3:
         first_three = rows[:3]
-        all_ahmed = all(r["client_name"] == "Ahmed Yehia" for r in first_three)
+        all_ahmed = all(r.client_name == "Ahmed Yehia" for r in first_three)
         _check("forward-fill carries client_name", all_ahmed,
-               detail=str([r["client_name"] for r in first_three]))
-        all_same_mobile = all(r["mobile"] == "201012345678" for r in first_three)
+               detail=str([r.client_name for r in first_three]))
+        all_same_mobile = all(r.mobile == "201012345678" for r in first_three)
         _check("forward-fill carries mobile (normalized)", all_same_mobile,
-               detail=str([r["mobile"] for r in first_three]))
+               detail=str([r.mobile for r in first_three]))
 
     # Stage normalization
     if len(rows) >= 3:
         _check("row 2 stage Following → FOLLOWING",
-               rows[0]["normalized_stage"] == "FOLLOWING")
+               rows[0].normalized_stage == "FOLLOWING")
         _check("row 3 stage Meeting → MEETING",
-               rows[1]["normalized_stage"] == "MEETING")
+               rows[1].normalized_stage == "MEETING")
         _check("row 4 stage No Answer → NO_ANSWER",
-               rows[2]["normalized_stage"] == "NO_ANSWER")
+               rows[2].normalized_stage == "NO_ANSWER")
 
     # Sara is row 4 in `rows` because the totally-blank one was skipped
     if len(rows) >= 5:
         sara = rows[3]
         _check("Sara's mobile normalized",
-               sara["mobile"] == "971569116811", detail=sara["mobile"])
+               sara.mobile == "971569116811", detail=sara.mobile)
         _check("Sara's stage Interested → INTERESTED",
-               sara["normalized_stage"] == "INTERESTED")
+               sara.normalized_stage == "INTERESTED")
 
         unknown = rows[4]
         _check("unknown stage → normalized_stage=None",
-               unknown["normalized_stage"] is None)
+               unknown.normalized_stage is None)
         # The unknown row still carries the previous client/mobile (forward-fill)
         _check("unknown row inherits Sara's mobile",
-               unknown["mobile"] == "971569116811")
+               unknown.mobile == "971569116811")
 
     # Unmatched stages / reps
     _check("unmatched_stages contains 'Discounted Special'",
@@ -261,8 +362,8 @@ def test_parser():
 
     # Comment passthrough
     if rows:
-        _check("comment preserved", rows[0]["comment"] == "first call",
-               detail=repr(rows[0].get("comment")))
+        _check("comment preserved", rows[0].comment == "first call",
+               detail=repr(rows[0].comment))
 
 
 # ─── Dedup via event_hash ──────────────────────────────────────────────
@@ -279,11 +380,11 @@ def test_event_hash_dedup():
         return [
             compute_event_hash(
                 campaign_id=42,
-                mobile=r["mobile"],
-                follow_date=r["follow_date"],
-                raw_sales_rep=r["raw_sales_rep_name"],
-                normalized_stage=r["normalized_stage"],
-                comment=r["comment"],
+                mobile=r.mobile,
+                follow_date=r.follow_date,
+                raw_sales_rep=r.raw_sales_rep_name,
+                normalized_stage=r.normalized_stage,
+                comment=r.comment,
             )
             for r in rows
         ]
@@ -393,6 +494,38 @@ def test_intervention_classifier():
            ]) is None)
 
 
+def test_plan_intervention_writes():
+    print("─── _plan_intervention_writes ───")
+    meeting_then_silence = [_ev("MEETING", 1), _ev("NO_ANSWER", 2)]
+    following_then_silence = [_ev("FOLLOWING", 1), _ev("NO_ANSWER", 2)]
+    by_lead = {
+        1: meeting_then_silence,     # new flag
+        2: meeting_then_silence,     # REVIEWED, same trigger → preserve
+        3: meeting_then_silence,     # CLOSED, trigger flipped → reopen
+        4: following_then_silence,   # OPEN, same trigger → refresh as OPEN
+        5: [_ev("MEETING", 1)],      # no longer qualifies
+    }
+    existing = {
+        2: {"trigger_type": TRIGGER_NO_ANSWER_AFTER_MEETING, "status": "REVIEWED"},
+        3: {"trigger_type": TRIGGER_NO_ANSWER_AFTER_FOLLOWING, "status": "CLOSED"},
+        4: {"trigger_type": TRIGGER_NO_ANSWER_AFTER_FOLLOWING, "status": "OPEN"},
+        5: {"trigger_type": TRIGGER_NO_ANSWER_AFTER_MEETING, "status": "OPEN"},
+    }
+    preserve, upsert, keep = _plan_intervention_writes(9, by_lead, existing)
+
+    _check("only the REVIEWED same-trigger flag is preserved",
+           [r[0] for r in preserve] == [2], detail=str(preserve))
+    _check("new / flipped / open flags are upserted",
+           sorted(r[0] for r in upsert) == [1, 3, 4], detail=str(upsert))
+    _check("upserts are written as OPEN",
+           all(r[-1] == "OPEN" for r in upsert))
+    _check("upsert rows carry the campaign id", all(r[1] == 9 for r in upsert))
+    _check("flipped flag takes the new trigger",
+           [r[3] for r in upsert if r[0] == 3] == [TRIGGER_NO_ANSWER_AFTER_MEETING])
+    _check("keep set excludes the lead that stopped qualifying",
+           keep == {1, 2, 3, 4}, detail=str(keep))
+
+
 # ─── Assignment builder (Fresh vs Rotation) ─────────────────────────────
 #
 # Pure-function tests for _assignments_from_events. The function takes an
@@ -692,6 +825,34 @@ def test_response_rate_pct():
            _response_rate_pct(10, -3) == 100.0)
 
 
+# ─── Incremental campaign_kpis delta ────────────────────────────────────
+#
+# _merge_stage_counts(baseline, old, new) moves the touched leads out of
+# their previous buckets and into their current ones. A bucket going
+# negative means the stored baseline is wrong — it must return None so
+# recalc_after_upload falls back to the full pass.
+
+def test_merge_stage_counts():
+    print("─── _merge_stage_counts ───")
+    baseline = {"FOLLOWING": 5, "NO_ANSWER": 3}
+    # Two leads moved FOLLOWING → MEETING, one brand-new lead → NO_ANSWER.
+    merged = _merge_stage_counts(baseline, {"FOLLOWING": 2},
+                                 {"MEETING": 2, "NO_ANSWER": 1})
+    _check("leads move between buckets",
+           merged == {"FOLLOWING": 3, "NO_ANSWER": 4, "MEETING": 2},
+           detail=str(merged))
+    _check("baseline dict is not mutated",
+           baseline == {"FOLLOWING": 5, "NO_ANSWER": 3})
+    # Emptied bucket disappears, like it would from the full GROUP BY.
+    merged = _merge_stage_counts({"MEETING": 1}, {"MEETING": 1}, {"CANCELLATION": 1})
+    _check("emptied bucket dropped", merged == {"CANCELLATION": 1},
+           detail=str(merged))
+    _check("empty baseline + new leads",
+           _merge_stage_counts({}, {}, {"INTERESTED": 2}) == {"INTERESTED": 2})
+    _check("negative bucket → None (fall back to full)",
+           _merge_stage_counts({"MEETING": 1}, {"MEETING": 2}, {}) is None)
+
+
 # ─── Required-column enforcement ───────────────────────────────────────
 
 def test_missing_required_column_raises():
@@ -715,20 +876,347 @@ def test_missing_required_column_raises():
     _check("ValueError was raised", raised)
 
 
+# ─── Engine parity: "stream" vs "full" ─────────────────────────────────
+
+def _build_titled_multisheet_xlsx() -> bytes:
+    """Header isn't on row 1 and isn't on the first sheet: a cover sheet
+    without the CRM columns, then a 'Feedback' sheet with a merged-style
+    title row and a blank spacer before the real header."""
+    wb = Workbook()
+    cover = wb.active
+    cover.title = "Summary"
+    cover.append(["Campaign export", None])
+    cover.append(["Generated", datetime(2026, 4, 25, 8, 0)])
+
+    ws = wb.create_sheet("Feedback Report")
+    ws.append(["April feedback export"])
+    ws.append([])
+    ws.append(["Client name", "Mobile", "Stage", "Follow Date", "Sales Rep", "Comment"])
+    ws.append(["Omar Nabil", 1012345678, "Follow Up",
+               "2026-04-21 11:00", "Reham Hany", None])
+    ws.append([None, None, "No Answer", "21/04/2026", "Reham Hany", "no pickup"])
+    ws.append([None, None, None, None, None, None])
+    ws.append(["Mona Adel", "bad-mobile", "Meeting", "not a date", "Mahmoud Amr", "x"])
+    ws.append([None, "0020 101 999 8888", "Cancelled",
+               datetime(2026, 4, 23, 9, 0), "Mahmoud Amr", "changed mind"])
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+def test_engine_parity():
+    print("─── parse engines: stream == full ───")
+    for label, blob in (("sample", _build_sample_xlsx()),
+                        ("titled multi-sheet", _build_titled_multisheet_xlsx())):
+        full = parse_crm_excel(io.BytesIO(blob), campaign_id=42,
+                               conn=_FakeConn(), engine="full")
+        stream = parse_crm_excel(io.BytesIO(blob), campaign_id=42,
+                                 conn=_FakeConn(), engine="stream")
+        _check(f"{label}: identical output", full == stream,
+               detail=f"full={full!r}\nstream={stream!r}")
+
+    titled = parse_crm_excel(io.BytesIO(_build_titled_multisheet_xlsx()),
+                             campaign_id=42, conn=_FakeConn(), engine="stream")
+    rows = titled["rows"]
+    _check("header found on 'Feedback' sheet row 3 → first data row is 4",
+           bool(rows) and rows[0].row_number == 4,
+           detail=str([r.row_number for r in rows]))
+    _check("unparseable mobile / date surface as warnings",
+           [(w["code"], w["count"], w["example"]) for w in titled["warnings"]]
+           == [("bad_mobile", 1, "bad-mobile"), ("bad_date", 1, "not a date")],
+           detail=str(titled["warnings"]))
+
+    # Header past the streaming scan window → stream rejects, full finds it.
+    from config import Config
+    wb = Workbook()
+    ws = wb.active
+    for _ in range(Config.CRM_HEADER_SCAN_ROWS):
+        ws.append(["padding"])
+    ws.append(["Client name", "Mobile", "Stage", "Follow Date", "Sales Rep"])
+    ws.append(["X", "01012345678", "Following", datetime(2026, 4, 21), "Rep"])
+    buf = io.BytesIO()
+    wb.save(buf)
+    blob = buf.getvalue()
+    raised = False
+    try:
+        parse_crm_excel(io.BytesIO(blob), campaign_id=1, conn=_FakeConn(), engine="stream")
+    except ValueError:
+        raised = True
+    _check("stream: header beyond scan window raises ValueError", raised)
+    full = parse_crm_excel(io.BytesIO(blob), campaign_id=1, conn=_FakeConn(), engine="full")
+    _check("full: header beyond scan window still found", len(full["rows"]) == 1)
+
+
+# ─── CSV / TSV ──────────────────────────────────────────────────────────
+
+# The _build_sample_xlsx rows as text, dates the way a CRM writes them.
+_SAMPLE_TEXT_ROWS = [
+    ["Client name", "Phone", "Stage", "Follow Date", "Sales Rep", "Notes"],
+    ["Ahmed Yehia", "01012345678", "Following", "2026-04-21 11:00:00", "Mahmoud Amr", "first call"],
+    ["", "", "Meeting", "2026-04-22 14:00:00", "Mahmoud Amr", "zoom done"],
+    ["", "", "No Answer", "2026-04-23 12:00:00", "Reham Hany", "stopped responding"],
+    [],
+    ["Sara Ali", "+971569116811", "Interested", "2026-04-24 09:30:00", "Mahmoud Amr", "wants brochure"],
+    ["", "", "Discounted Special", "2026-04-24 10:00:00", "Mahmoud Amr", "promo offer"],
+]
+
+
+def _to_delimited(rows, delimiter=",", encoding="utf-8") -> bytes:
+    buf = io.StringIO()
+    csv.writer(buf, delimiter=delimiter, lineterminator="\r\n").writerows(rows)
+    return buf.getvalue().encode(encoding)
+
+
+def test_delimited():
+    print("─── CSV / TSV ───")
+    expected = parse_crm_excel(io.BytesIO(_build_sample_xlsx()), campaign_id=42, conn=_FakeConn())
+    for label, delimiter, encoding in (("CSV utf-8", ",", "utf-8"),
+                                       ("CSV utf-8 BOM", ",", "utf-8-sig"),
+                                       ("TSV", "\t", "utf-8"),
+                                       ("semicolon CSV", ";", "utf-8"),
+                                       ("UTF-16 TSV", "\t", "utf-16")):
+        blob = _to_delimited(_SAMPLE_TEXT_ROWS, delimiter, encoding)
+        for engine in PARSE_ENGINES:
+            got = parse_crm_excel(io.BytesIO(blob), campaign_id=42, conn=_FakeConn(), engine=engine)
+            _check(f"{label} ({engine}) == .xlsx", got == expected,
+                   detail=f"got={got!r}\nexpected={expected!r}")
+
+    # Arabic names: the same sheet saved as UTF-8 and as Windows-1256.
+    arabic = [list(r) for r in _SAMPLE_TEXT_ROWS]
+    arabic[1][0] = "أحمد يحيى"
+    arabic[5][0] = "سارة علي"
+    utf8 = parse_crm_excel(io.BytesIO(_to_delimited(arabic)), campaign_id=42, conn=_FakeConn())
+    cp1256 = parse_crm_excel(io.BytesIO(_to_delimited(arabic, encoding="cp1256")),
+                             campaign_id=42, conn=_FakeConn())
+    _check("Windows-1256 export decodes like the UTF-8 one",
+           cp1256 == utf8 and utf8["rows"][0].client_name == "أحمد يحيى",
+           detail=str([r.client_name for r in cp1256["rows"]]))
+
+    summary = new_parse_summary()
+    rows = list(iter_crm_excel(io.BytesIO(_to_delimited(_SAMPLE_TEXT_ROWS)), campaign_id=42,
+                               conn=_FakeConn(), summary=summary))
+    _check("rows_estimate from the line count",
+           summary["rows_estimate"] == len(_SAMPLE_TEXT_ROWS) - 1 and len(rows) == 5,
+           detail=str(summary["rows_estimate"]))
+
+    for label, blob in (("no header", _to_delimited([["foo", "bar"], ["1", "2"]])),
+                        # A stray quote swallows the rest of the file into one field.
+                        ("runaway quote", _to_delimited(_SAMPLE_TEXT_ROWS[:2])
+                         + b'"x' + b"y" * (csv.field_size_limit() + 1))):
+        raised = False
+        try:
+            parse_crm_excel(io.BytesIO(blob), campaign_id=1, conn=_FakeConn())
+        except ValueError:
+            raised = True
+        _check(f"{label} → ValueError", raised)
+
+
+# ─── Warning tally ─────────────────────────────────────────────────────
+
+def test_warning_tally():
+    print("─── warnings tallied by kind ───")
+    n = 5000
+    rows = [["Client name", "Mobile", "Stage", "Follow Date", "Sales Rep"]]
+    rows += [[f"Client {i}", f"0101{i:07d}", "Following", "someday", "Rep"] for i in range(n)]
+    result = parse_crm_excel(io.BytesIO(_to_delimited(rows)), campaign_id=1, conn=_FakeConn())
+    warnings = result["warnings"]
+    _check("one entry for every unparseable date",
+           len(warnings) == 1 and warnings[0]["code"] == "bad_date"
+           and warnings[0]["count"] == n, detail=str(warnings)[:200])
+    _check(f"first {WARNING_SAMPLE_ROWS} row numbers kept",
+           warnings[0]["rows"] == list(range(2, 2 + WARNING_SAMPLE_ROWS)),
+           detail=str(warnings[0]["rows"]))
+    _check("JSON stays small", len(json.dumps(warnings)) < 300,
+           detail=str(len(json.dumps(warnings))))
+
+    tally: list = []
+    add_warning(tally, "rejected", 3, detail="no mobile")
+    add_warning(tally, "rejected", 5, detail="no mobile")
+    add_warning(tally, "rejected", 8, detail="stage too long")
+    add_warning(tally, "skipped", 9, detail="ValueError", example="x" * 1000)
+    _check("entries keyed by (code, detail)",
+           [(w["code"], w["detail"], w["count"], w["rows"]) for w in tally[:2]]
+           == [("rejected", "no mobile", 2, [3, 5]), ("rejected", "stage too long", 1, [8])],
+           detail=str(tally))
+    _check("example truncated", len(tally[2]["example"]) == 200)
+
+
+# ─── Bulk ingest staging (pure parts of crm_processor) ─────────────────
+
+def test_bulk_stage_buffer():
+    print("─── bulk ingest: reject list + COPY buffer ───")
+    from app.crm_processor import _copy_buffer, _reject_reason
+
+    rows = parse_crm_excel(io.BytesIO(_build_sample_xlsx()), campaign_id=42,
+                           conn=_FakeConn())["rows"]
+    _check("parsed rows are all accepted",
+           all(_reject_reason(r) is None for r in rows))
+    _check("row without mobile rejected",
+           _reject_reason(rows[0]._replace(mobile=None)) == "no mobile")
+    _check("over-long stage token rejected",
+           _reject_reason(rows[0]._replace(normalized_stage="X" * 41)) is not None)
+
+    staged = [r._replace(event_hash=compute_event_hash(
+        campaign_id=42, mobile=r.mobile, follow_date=r.follow_date,
+        raw_sales_rep=r.raw_sales_rep_name, normalized_stage=r.normalized_stage,
+        comment=r.comment)) for r in rows]
+    staged[0] = staged[0]._replace(comment='said "call me, later"\nthen hung up')
+    back = list(csv.reader(_copy_buffer(staged)))
+    _check("one CSV record per staged row", len(back) == len(staged),
+           detail=str(len(back)))
+    _check("quotes / commas / newlines survive the round trip",
+           back[0][8] == staged[0].comment, detail=repr(back[0][8]))
+    _check("None → empty field (COPY reads it as NULL)",
+           back[4][6] == "" and staged[4].normalized_stage is None)
+    _check("follow_date serialised as ISO timestamp",
+           back[0][7] == "2026-04-21 11:00:00", detail=back[0][7])
+
+
+# ─── Upload size cap + hash (pure part of crm_processor) ───────────────
+
+def test_hash_upload_stream():
+    print("─── upload hash + size cap ───")
+    import hashlib
+    from app.crm_processor import _SPOOL_CHUNK_BYTES, UploadTooLarge, hash_upload_stream
+
+    blob = b"x" * (2 * _SPOOL_CHUNK_BYTES + 17)
+    stream = io.BytesIO(blob)
+    sha, size = hash_upload_stream(stream, len(blob))
+    _check("multi-chunk hash == hashlib over the whole file",
+           sha == hashlib.sha256(blob).hexdigest() and size == len(blob))
+    _check("stream rewound for the spool", stream.tell() == 0)
+
+    stream = io.BytesIO(blob)
+    raised = False
+    try:
+        hash_upload_stream(stream, _SPOOL_CHUNK_BYTES)
+    except UploadTooLarge:
+        raised = True
+    _check("past the cap → UploadTooLarge, rest left unread",
+           raised and stream.tell() == 2 * _SPOOL_CHUNK_BYTES, detail=str(stream.tell()))
+
+
+def test_upload_session_chunks():
+    print("─── chunked upload: chunk layout ───")
+    from app.crm_processor import upload_session_chunk_count, upload_session_chunk_size
+
+    _check("exact multiple → no short tail",
+           upload_session_chunk_count(3000, 1000) == 3
+           and upload_session_chunk_size(3000, 1000, 2) == 1000)
+    _check("last chunk carries the remainder",
+           upload_session_chunk_count(2500, 1000) == 3
+           and upload_session_chunk_size(2500, 1000, 2) == 500)
+    _check("file smaller than a chunk → one chunk of its size",
+           upload_session_chunk_count(10, 1000) == 1
+           and upload_session_chunk_size(10, 1000, 0) == 10)
+    _check("out-of-range seq → None",
+           upload_session_chunk_size(2500, 1000, 3) is None
+           and upload_session_chunk_size(2500, 1000, -1) is None)
+
+
+# ─── Parsing in a child process ────────────────────────────────────────
+
+def test_parse_subprocess():
+    print("─── parse in a child process ───")
+    import tempfile
+    from app.crm_logic import MappingResolver
+    from app.crm_parse_worker import _parse_slots, iter_rows_in_subprocess
+
+    def _tmp(blob):
+        fh = tempfile.TemporaryFile()
+        fh.write(blob)
+        fh.seek(0)
+        return fh
+
+    for label, blob in ((".xlsx", _build_sample_xlsx()),
+                        ("CSV", _to_delimited(_SAMPLE_TEXT_ROWS, encoding="cp1256"))):
+        with _tmp(blob) as fh:
+            child_summary = new_parse_summary()
+            child = list(iter_rows_in_subprocess(
+                fh, 42, MappingResolver.load(_FakeConn(), 42), child_summary))
+        local_summary = new_parse_summary()
+        local = list(iter_crm_excel(io.BytesIO(blob), 42, _FakeConn(), local_summary))
+        _check(f"{label}: same rows and summary as in-thread",
+               child == local and child_summary == local_summary,
+               detail=f"{child_summary} / {local_summary}")
+
+    raised = None
+    with _tmp(_to_delimited([["foo", "bar"]])) as fh:
+        try:
+            list(iter_rows_in_subprocess(fh, 1, MappingResolver(1), new_parse_summary()))
+        except ValueError as e:
+            raised = str(e)
+    _check("header error comes back as ValueError",
+           raised is not None and "header" in raised, detail=str(raised))
+
+    with _tmp(_build_sample_xlsx()) as fh:
+        rows = iter_rows_in_subprocess(fh, 1, MappingResolver(1), new_parse_summary())
+        next(rows)
+        rows.close()
+        dropped = iter_rows_in_subprocess(fh, 1, MappingResolver(1), new_parse_summary())
+        del dropped
+    slots = _parse_slots()
+    free = 0
+    while slots.acquire(blocking=False):
+        free += 1
+    for _ in range(free):
+        slots.release()
+    from config import Config
+    _check("closed / dropped parses free their slot",
+           free == max(1, Config.CRM_PARSE_PROCESSES), detail=str(free))
+
+
+# ─── Upload progress (pure parts of crm_processor) ─────────────────────
+
+def test_upload_rate_and_eta():
+    print("─── upload progress: rows/s + ETA ───")
+    from app.crm_processor import upload_rate_and_eta
+
+    _check("nothing read yet → no rate, no ETA",
+           upload_rate_and_eta("parsing", 0, 100, 0, 0) == (None, None))
+    _check("500 of 2000 rows in 2.5s → 200 rows/s, 8s left",
+           upload_rate_and_eta("ingesting", 500, 2000, 500, 2000) == (200.0, 8))
+    _check("no declared row count → rate only",
+           upload_rate_and_eta("ingesting", 500, None, 500, 2000) == (200.0, None))
+    _check("estimate overshot → ETA clamps at 0",
+           upload_rate_and_eta("ingesting", 2100, 2000, 500, 2000)[1] == 0)
+    _check("recalculating / done → rate kept, ETA dropped",
+           upload_rate_and_eta("done", 2000, 2000, 2000, 8000) == (200.0, None))
+
+    summary = new_parse_summary()
+    for _ in iter_crm_excel(io.BytesIO(_build_sample_xlsx()), campaign_id=42,
+                            conn=_FakeConn(), summary=summary, engine="stream"):
+        pass
+    _check("stream engine estimates rows from the sheet dimension",
+           summary["rows_estimate"] == summary["total_rows_in_sheet"],
+           detail=f"{summary['rows_estimate']} vs {summary['total_rows_in_sheet']}")
+
+
 # ─── Driver ────────────────────────────────────────────────────────────
 
 def main():
     test_normalize_mobile()
     test_normalize_stage()
     test_normalize_sales_name()
+    test_mapping_resolver()
     test_compute_event_hash()
     test_parser()
     test_event_hash_dedup()
     test_missing_required_column_raises()
+    test_engine_parity()
+    test_delimited()
+    test_warning_tally()
+    test_bulk_stage_buffer()
+    test_hash_upload_stream()
+    test_upload_session_chunks()
+    test_parse_subprocess()
+    test_upload_rate_and_eta()
     test_intervention_classifier()
+    test_plan_intervention_writes()
     test_assignments_from_events()
     test_enrich_timeline_events()
     test_response_rate_pct()
+    test_merge_stage_counts()
 
     print()
     if _failures:
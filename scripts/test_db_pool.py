@@ -0,0 +1,277 @@
+"""
+Tests for connection checkout in app/database.py.
+
+No PostgreSQL needed: the request-scoped tests install a fake pool as
+database._POOL, and the _Pool tests hand it a factory of fake
+connections that only count what was done to them.
+
+Run: PYTHONIOENCODING=utf-8 DISABLE_SYNC=true python scripts/test_db_pool.py
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2.pool  # noqa: E402
+from flask import Flask  # noqa: E402
+
+from app import database  # noqa: E402
+from app.database import _Pool, get_conn, release_request_conn  # noqa: E402
+
+
+# ─── Tiny harness ───────────────────────────────────────────────────────
+
+_failures = 0
+
+
+def _check(name, ok, detail=""):
+    global _failures
+    if ok:
+        print(f"  ok   {name}")
+    else:
+        _failures += 1
+        print(f"  FAIL {name}: {detail}")
+
+
+# ─── Fakes ──────────────────────────────────────────────────────────────
+
+class _FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=None):
+        if self.conn.broken:
+            raise psycopg2.OperationalError("server closed the connection")
+        self.conn.executed.append(sql)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _FakeConn:
+    def __init__(self):
+        self.executed = []
+        self.commits = 0
+        self.rollbacks = 0
+        self.closed = 0
+        self.broken = False
+
+    def cursor(self, *a, **kw):
+        return _FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+
+
+class _FakePool:
+    def __init__(self):
+        self.handed_out = []
+        self.returned = []
+
+    def getconn(self):
+        conn = _FakeConn()
+        self.handed_out.append(conn)
+        return conn
+
+    def putconn(self, conn, close=False):
+        self.returned.append(conn)
+
+
+def _install_pool():
+    pool = _FakePool()
+    database._POOL = pool
+    return pool
+
+
+_app = Flask(__name__)
+_app.teardown_request(release_request_conn)
+
+
+# ─── Tests ──────────────────────────────────────────────────────────────
+
+def test_outside_request():
+    print("─── outside a request every get_conn checks out ───")
+    pool = _install_pool()
+    a = get_conn()
+    b = get_conn()
+    _check("two checkouts", len(pool.handed_out) == 2)
+    a.close()
+    b.close()
+    _check("both returned", len(pool.returned) == 2)
+
+
+def test_request_shares_one_connection():
+    print("─── one checkout per request ───")
+    pool = _install_pool()
+    with _app.test_request_context("/api/x"):
+        for _ in range(4):
+            conn = get_conn()
+            with conn.cursor() as cur:
+                cur.execute("SELECT 2")
+            conn.close()
+        _check("one checkout for four callers", len(pool.handed_out) == 1,
+               detail=str(len(pool.handed_out)))
+        _check("still held until teardown", pool.returned == [])
+        raw = pool.handed_out[0]
+        _check("each closed borrow rolled back", raw.rollbacks == 4,
+               detail=str(raw.rollbacks))
+    _check("returned at teardown", pool.returned == pool.handed_out)
+
+
+def test_nested_borrow_shares_transaction():
+    print("─── nested borrow leaves the outer transaction alone ───")
+    pool = _install_pool()
+    with _app.test_request_context("/api/x"):
+        outer = get_conn()
+        raw = pool.handed_out[0]
+        before = raw.rollbacks
+        inner = get_conn()
+        inner.close()
+        _check("inner close rolls nothing back", raw.rollbacks == before)
+        outer.close()
+        _check("outer close rolls back", raw.rollbacks == before + 1)
+        outer.close()
+        _check("double close is a no-op", raw.rollbacks == before + 1)
+
+
+def test_dropped_connection_replaced():
+    print("─── a dropped connection is replaced on the next borrow ───")
+    pool = _install_pool()
+    with _app.test_request_context("/api/x"):
+        get_conn().close()
+        pool.handed_out[0].closed = 1
+        get_conn().close()
+        _check("second checkout", len(pool.handed_out) == 2)
+        _check("dropped one handed back", pool.returned == pool.handed_out[:1])
+
+
+def _make_pool(maxconn=2, **kw):
+    made = []
+
+    def connect():
+        conn = _FakeConn()
+        made.append(conn)
+        return conn
+
+    opts = {"wait_seconds": 1, "max_waiters": 10, "validate_idle_seconds": 60}
+    opts.update(kw)
+    return _Pool(0, maxconn, connect, **opts), made
+
+
+def test_validation_by_idle_age():
+    print("─── SELECT 1 only after the idle threshold ───")
+    pool, made = _make_pool(validate_idle_seconds=0.05)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    _check("recently returned: reused unprobed",
+           pool.getconn() is conn and conn.executed == [])
+    pool.putconn(conn)
+    time.sleep(0.06)
+    _check("idle past threshold: reused after a probe",
+           pool.getconn() is conn and conn.executed == ["SELECT 1"])
+    pool.putconn(conn)
+    _check("one connection opened", len(made) == 1)
+
+
+def test_stale_connection_dropped():
+    print("─── a connection failing the probe is replaced ───")
+    pool, made = _make_pool(validate_idle_seconds=0)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    conn.broken = True
+    fresh = pool.getconn()
+    _check("new connection handed out", fresh is not conn and len(made) == 2)
+    _check("stale one closed", conn.closed == 1)
+    stats = pool.stats()
+    _check("stale drop counted", stats["stale_drops"] == 1, detail=str(stats))
+    _check("slot accounting", stats["in_use"] == 1 and stats["idle"] == 0,
+           detail=str(stats))
+
+
+def test_exhausted_pool_waits():
+    print("─── exhausted pool: wait, timeout, reject ───")
+    pool, _ = _make_pool(maxconn=1, wait_seconds=2)
+    held = pool.getconn()
+    threading.Timer(0.1, pool.putconn, args=(held,)).start()
+    got = pool.getconn()
+    stats = pool.stats()
+    _check("waiter got the returned connection", got is held)
+    _check("wait counted", stats["waits"] == 1 and stats["exhausted"] == 1
+           and stats["wait_ms_max"] >= 50, detail=str(stats))
+
+    pool, _ = _make_pool(maxconn=1, wait_seconds=0.05)
+    pool.getconn()
+    try:
+        pool.getconn()
+        timed_out = False
+    except psycopg2.pool.PoolError:
+        timed_out = True
+    _check("times out", timed_out and pool.stats()["timeouts"] == 1)
+    _check("slot not leaked by the timeout", pool.stats()["in_use"] == 1)
+
+    pool, _ = _make_pool(maxconn=1, max_waiters=0)
+    pool.getconn()
+    try:
+        pool.getconn()
+        rejected = False
+    except psycopg2.pool.PoolError:
+        rejected = True
+    _check("full wait queue rejects at once",
+           rejected and pool.stats()["rejected"] == 1)
+
+
+def test_waiters_served_in_order():
+    print("─── waiters are served first come, first served ───")
+    pool, _ = _make_pool(maxconn=1, wait_seconds=5)
+    held = pool.getconn()
+    order = []
+
+    def worker(name):
+        conn = pool.getconn()
+        order.append(name)
+        time.sleep(0.01)
+        pool.putconn(conn)
+
+    threads = []
+    for name in ("a", "b", "c"):
+        t = threading.Thread(target=worker, args=(name,))
+        t.start()
+        threads.append(t)
+        time.sleep(0.05)  # let it queue before the next one arrives
+    pool.putconn(held)
+    for t in threads:
+        t.join()
+    _check("arrival order", order == ["a", "b", "c"], detail=str(order))
+    _check("all slots returned", pool.stats()["in_use"] == 0)
+
+
+def main():
+    test_outside_request()
+    test_request_shares_one_connection()
+    test_nested_borrow_shares_transaction()
+    test_dropped_connection_replaced()
+    test_validation_by_idle_age()
+    test_stale_connection_dropped()
+    test_exhausted_pool_waits()
+    test_waiters_served_in_order()
+
+    print()
+    if _failures:
+        print(f"❌ {_failures} failure(s)")
+        sys.exit(1)
+    print("✅ all green")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Tests for the batched last_seen heartbeat (app/last_seen.py).
+
+Needs a reachable PostgreSQL in DATABASE_URL but never touches real
+data: users is created as a TEMP table, which shadows the permanent one
+for this session only, and flush() is handed that session's connection.
+Without DATABASE_URL the tests print a skip notice.
+
+Run: PYTHONIOENCODING=utf-8 DISABLE_SYNC=true [DATABASE_URL=...] python scripts/test_last_seen.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import last_seen  # noqa: E402
+
+# The tests call flush() themselves; keep the background thread out of it.
+last_seen.start_flusher = lambda: None
+
+
+# ─── Tiny harness ───────────────────────────────────────────────────────
+
+_failures = 0
+
+
+def _check(name, ok, detail=""):
+    global _failures
+    if ok:
+        print(f"  ok   {name}")
+    else:
+        _failures += 1
+        print(f"  FAIL {name}: {detail}")
+
+
+_TEMP_SCHEMA = """
+    CREATE TEMP TABLE users (
+        id        INTEGER PRIMARY KEY,
+        last_seen TIMESTAMP
+    );
+    INSERT INTO users (id) SELECT generate_series(1, 4);
+"""
+
+
+def _connect():
+    import psycopg2
+    return psycopg2.connect(os.environ["DATABASE_URL"])
+
+
+def _seen(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT id, NOW() - last_seen FROM users ORDER BY id")
+        rows = dict(cur.fetchall())
+    conn.commit()
+    return rows
+
+
+# ─── Tests ──────────────────────────────────────────────────────────────
+
+def test_batched_flush(conn):
+    print("─── one flush writes every pending user ───")
+    for uid in (1, 2, 2, 3):
+        last_seen.record_seen(uid)
+    _check("nothing written before the flush", all(v is None for v in _seen(conn).values()))
+    _check("three users flushed", last_seen.flush(conn) == 3)
+    seen = _seen(conn)
+    _check("stamped users are online",
+           all(seen[u] is not None and seen[u].total_seconds() < 5 for u in (1, 2, 3)),
+           detail=str(seen))
+    _check("unseen user untouched", seen[4] is None)
+    _check("queue drained", last_seen.flush(conn) == 0)
+
+
+def test_stamp_uses_request_age(conn):
+    print("─── the stamp is the request time, not the flush time ───")
+    last_seen.record_seen(4)
+    time.sleep(0.3)
+    last_seen.flush(conn)
+    age = _seen(conn)[4].total_seconds()
+    _check("last_seen is back-dated by the queued time", age >= 0.25, detail=str(age))
+
+    # An older entry must not move a newer stamp backwards.
+    with conn.cursor() as cur:
+        cur.execute("UPDATE users SET last_seen = NOW() + INTERVAL '1 hour' WHERE id = 4")
+    conn.commit()
+    last_seen.record_seen(4)
+    last_seen.flush(conn)
+    _check("newer stamp kept", _seen(conn)[4].total_seconds() < 0)
+
+
+def test_forget(conn):
+    print("─── logout drops the unwritten heartbeat ───")
+    with conn.cursor() as cur:
+        cur.execute("UPDATE users SET last_seen = NULL")
+    conn.commit()
+    last_seen.record_seen(1)
+    last_seen.record_seen(2)
+    last_seen.forget(1)
+    _check("only the other user flushed", last_seen.flush(conn) == 1)
+    seen = _seen(conn)
+    _check("forgotten user stays offline", seen[1] is None and seen[2] is not None,
+           detail=str(seen))
+
+
+def test_failed_flush_requeues(conn):
+    print("─── a failed flush keeps its entries ───")
+    dead = _connect()
+    dead.close()
+    last_seen.record_seen(3)
+    try:
+        last_seen.flush(dead)
+        raised = False
+    except Exception:
+        raised = True
+    _check("error propagates", raised)
+    _check("entry retried by the next flush", last_seen.flush(conn) == 1)
+
+
+def main():
+    if not os.environ.get("DATABASE_URL"):
+        print("⏭  DATABASE_URL not set — skipping last_seen tests")
+    else:
+        conn = _connect()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(_TEMP_SCHEMA)
+            conn.commit()
+            test_batched_flush(conn)
+            test_stamp_uses_request_age(conn)
+            test_forget(conn)
+            test_failed_flush_requeues(conn)
+        finally:
+            conn.close()
+
+    print()
+    if _failures:
+        print(f"❌ {_failures} failure(s)")
+        sys.exit(1)
+    print("✅ all green")
+
+
+if __name__ == "__main__":
+    main()
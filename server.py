@@ -21,6 +21,31 @@ else:
     except Exception as e:
         log.error(f"⚠️  Failed to start sync scheduler: {e}")
 
+# CRM upload worker pool. Starting it also re-queues uploads that the
+# previous process left PENDING / PROCESSING.
+try:
+    from app.crm_processor import start_upload_workers
+    start_upload_workers()
+except Exception as e:
+    log.error(f"⚠️  Failed to start CRM upload workers: {e}")
+
+# LISTEN thread for live CRM events. Started here rather than with the
+# first stream so the badge-count cache behind /api/crm/intervention/
+# open-count follows the writers even while no stream is open.
+try:
+    from app.crm_events import start_listener
+    start_listener()
+except Exception as e:
+    log.error(f"⚠️  Failed to start CRM event listener: {e}")
+
+# Background worker for queued CRM jobs (mapping-change recalcs). Not
+# tied to DISABLE_SYNC — the admin mapping screens depend on it.
+try:
+    from app.crm_jobs import start_job_worker
+    start_job_worker()
+except Exception as e:
+    log.error(f"⚠️  Failed to start CRM job worker: {e}")
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8080))
     debug = os.environ.get("FLASK_DEBUG") == "1"